@@ -0,0 +1,94 @@
+from typing import Dict, List, Tuple
+
+from entities import Match
+
+
+class StatsAggregator:
+    """
+    チーム・メンバー・ポケモン・(チーム, ポケモン) ごとの試合数/勝利数カウンタ。
+
+    試合が追加されるたびに add_match() で O(出場人数) だけ更新するので、
+    統計ページは全試合を走査せずにカウンタを読むだけで済む。
+    カウンタは [試合数, 勝利数] のリスト。
+    """
+
+    def __init__(self):
+        self.match_count = 0
+        self.team: Dict[str, List[int]] = {}
+        self.member: Dict[str, List[int]] = {}
+        self.pokemon: Dict[str, List[int]] = {}
+        self.team_pokemon: Dict[Tuple[str, str], List[int]] = {}
+
+    @staticmethod
+    def _count(counters: dict, key, won: bool, delta: int = 1):
+        counter = counters.get(key)
+        if counter is None:
+            counter = counters[key] = [0, 0]
+        counter[0] += delta
+        if won:
+            counter[1] += delta
+        if not counter[0]:
+            del counters[key]
+
+    def add_match(self, match: Match, delta: int = 1) -> None:
+        """試合1件分のカウンタを加算（delta=-1 なら減算）"""
+        self.match_count += delta
+        team_ids = set()
+        for team_data in (match.team_a_data, match.team_b_data):
+            team_id = team_data.team_id
+            won = match.winner_team_id == team_id
+            # 同じチーム同士の試合は1試合として数える
+            if team_id not in team_ids:
+                team_ids.add(team_id)
+                self._count(self.team, team_id, won, delta)
+            for selection in team_data.player_selections:
+                self._count(self.member, selection.member_id, won, delta)
+                self._count(self.pokemon, selection.pokemon_id, won, delta)
+                self._count(self.team_pokemon, (team_id, selection.pokemon_id), won, delta)
+
+    def remove_match(self, match: Match) -> None:
+        """add_match() で加算した試合1件分を戻す"""
+        self.add_match(match, -1)
+
+    def merge(self, other: "StatsAggregator") -> None:
+        """other のカウンタを足し込む（シーズンをまたいだ集計用）"""
+        self.match_count += other.match_count
+        for name in ("team", "member", "pokemon", "team_pokemon"):
+            counters = getattr(self, name)
+            for key, (played, won) in getattr(other, name).items():
+                counter = counters.get(key)
+                if counter is None:
+                    counters[key] = [played, won]
+                else:
+                    counter[0] += played
+                    counter[1] += won
+
+    def copy(self) -> "StatsAggregator":
+        aggregator = StatsAggregator()
+        aggregator.merge(self)
+        return aggregator
+
+    def to_dict(self) -> dict:
+        return {
+            "match_count": self.match_count,
+            "team": self.team,
+            "member": self.member,
+            "pokemon": self.pokemon,
+            "team_pokemon": [
+                [team_id, pokemon_id, played, won]
+                for (team_id, pokemon_id), (played, won) in self.team_pokemon.items()
+            ]
+        }
+
+    @staticmethod
+    def from_dict(data: dict) -> "StatsAggregator":
+        aggregator = StatsAggregator()
+        aggregator.match_count = data["match_count"]
+        aggregator.team = data["team"]
+        aggregator.member = data["member"]
+        aggregator.pokemon = data["pokemon"]
+        aggregator.team_pokemon = {
+            (team_id, pokemon_id): [played, won]
+            for team_id, pokemon_id, played, won in data["team_pokemon"]
+        }
+        return aggregator
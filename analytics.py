@@ -0,0 +1,329 @@
+from functools import reduce
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from appearances import AppearanceView, IdCodes
+import matchups
+import timeline
+
+# (date_from, date_to)。どちらも YYYY-MM-DD で両端を含み、None なら制限なし
+DateRange = Tuple[Optional[str], Optional[str]]
+
+
+def _column(values, length: int, dtype) -> np.ndarray:
+    """array の先頭 length 要素を NumPy 配列にする（スライスのコピー1回だけ）"""
+    return np.frombuffer(values[:length], dtype=dtype)
+
+
+def appearances_frame(view: AppearanceView) -> pd.DataFrame:
+    """1行が (match, side, team, member, pokemon, won) の出場テーブル（IDは整数コード）"""
+    table, rows = view.table, view.rows
+    return pd.DataFrame({
+        'match': _column(table.match, rows, np.intc),
+        'side': _column(table.side, rows, np.int8),
+        'team': _column(table.team, rows, np.intc),
+        'member': _column(table.member, rows, np.intc),
+        'pokemon': _column(table.pokemon, rows, np.intc),
+        'won': _column(table.won, rows, np.int8),
+    })
+
+
+def sides_frame(view: AppearanceView) -> pd.DataFrame:
+    """1行が (match, team, lineup, won) のサイドテーブル"""
+    table, sides = view.table, view.sides
+    return pd.DataFrame({
+        'match': _column(table.side_match, sides, np.intc),
+        'team': _column(table.side_team, sides, np.intc),
+        'lineup': _column(table.side_lineup, sides, np.intc),
+        'won': _column(table.side_won, sides, np.int8),
+    })
+
+
+def _codes(codes: IdCodes, ids: List[str]) -> np.ndarray:
+    """ID を整数コードに変換（一度も出場していなければ -1）"""
+    return np.array([codes.code_by_id.get(item_id, -1) for item_id in ids], dtype=np.intc)
+
+
+def _played_won(frame: pd.DataFrame, key: str, codes: np.ndarray):
+    """key ごとの試合数・勝利数を groupby で数え、codes の並びで返す"""
+    grouped = frame.groupby(key)['won'].agg(['size', 'sum'])
+    played = grouped['size'].reindex(codes, fill_value=0).to_numpy(dtype=np.int64)
+    won = grouped['sum'].reindex(codes, fill_value=0).to_numpy(dtype=np.int64)
+    return played, won
+
+
+def _window(snapshot, kind: str, codes: np.ndarray, date_range: DateRange):
+    """日付範囲の試合数・勝利数を Timeline の累積の差で求め、codes の並びで返す"""
+    dated = timeline.timeline(snapshot)
+    first_day, last_day = dated.day_range(*date_range)
+    return getattr(dated, kind).window(codes, first_day, last_day)
+
+
+def _with_win_rate(data: dict) -> pd.DataFrame:
+    played = data['matches_played']
+    won = data['matches_won']
+    data['win_rate'] = np.divide(won, played, out=np.zeros(len(played)), where=played > 0)
+    return pd.DataFrame(data)
+
+
+def team_stats(snapshot, date_range: Optional[DateRange] = None) -> pd.DataFrame:
+    """
+    チームごとの試合数・勝利数・勝率（date_range があればその期間の試合のみ）。
+    同じチーム同士の試合は1試合として数える（StatsAggregator と同じ）。
+    """
+    teams = list(snapshot.teams)
+    codes = _codes(snapshot.appearances.table.teams, [team.id for team in teams])
+    if date_range:
+        played, won = _window(snapshot, 'team', codes, date_range)
+    else:
+        sides = sides_frame(snapshot.appearances)
+        played, won = _played_won(sides[timeline.team_sides(sides['team'].to_numpy())], 'team', codes)
+    return _with_win_rate({
+        'team_id': [team.id for team in teams],
+        'team_name': [team.name for team in teams],
+        'matches_played': played,
+        'matches_won': won,
+    })
+
+
+def pokemon_stats(snapshot, date_range: Optional[DateRange] = None) -> pd.DataFrame:
+    """ポケモンごとの使用回数・勝利数・勝率（date_range があればその期間の試合のみ）"""
+    pokemons = list(snapshot.pokemons)
+    codes = _codes(snapshot.appearances.table.pokemons, [pokemon.id for pokemon in pokemons])
+    if date_range:
+        played, won = _window(snapshot, 'pokemon', codes, date_range)
+    else:
+        played, won = _played_won(appearances_frame(snapshot.appearances), 'pokemon', codes)
+    return _with_win_rate({
+        'pokemon_id': [pokemon.id for pokemon in pokemons],
+        'pokemon_name': [pokemon.name for pokemon in pokemons],
+        'matches_played': played,
+        'matches_won': won,
+    })
+
+
+def member_stats(snapshot, date_range: Optional[DateRange] = None) -> pd.DataFrame:
+    """メンバーごとの試合数・勝利数・勝率（date_range があればその期間の試合のみ）"""
+    members = [(team, member) for team in snapshot.teams for member in team.members]
+    codes = _codes(snapshot.appearances.table.members, [member.id for _, member in members])
+    if date_range:
+        played, won = _window(snapshot, 'member', codes, date_range)
+    else:
+        played, won = _played_won(appearances_frame(snapshot.appearances), 'member', codes)
+    return _with_win_rate({
+        'member_id': [member.id for _, member in members],
+        'member_name': [member.name for _, member in members],
+        'team_name': [team.name for team, _ in members],
+        'matches_played': played,
+        'matches_won': won,
+    })
+
+
+def season_stats(summary, kind: str) -> pd.DataFrame:
+    """
+    シーズンをまたいだ集計（seasons.SeasonSummary）から、team_stats / member_stats /
+    pokemon_stats と同じ列の統計を作る。一度でも登録されていたものはすべて含む。
+    """
+    counters = getattr(summary.stats, kind)
+
+    def played_won(ids) -> Tuple[np.ndarray, np.ndarray]:
+        pairs = np.array([counters.get(item_id, (0, 0)) for item_id in ids], dtype=np.int64).reshape(-1, 2)
+        return pairs[:, 0], pairs[:, 1]
+
+    if kind == 'team':
+        ids = list(summary.teams)
+        played, won = played_won(ids)
+        return _with_win_rate({
+            'team_id': ids,
+            'team_name': [summary.teams[team_id] for team_id in ids],
+            'matches_played': played,
+            'matches_won': won,
+        })
+    if kind == 'pokemon':
+        ids = list(summary.pokemons)
+        played, won = played_won(ids)
+        return _with_win_rate({
+            'pokemon_id': ids,
+            'pokemon_name': [summary.pokemons[pokemon_id] for pokemon_id in ids],
+            'matches_played': played,
+            'matches_won': won,
+        })
+    if kind == 'member':
+        ids = list(summary.members)
+        played, won = played_won(ids)
+        return _with_win_rate({
+            'member_id': ids,
+            'member_name': [summary.members[member_id][0] for member_id in ids],
+            'team_name': [summary.teams.get(summary.members[member_id][1], '') for member_id in ids],
+            'matches_played': played,
+            'matches_won': won,
+        })
+    raise ValueError(f"unknown kind: {kind}")
+
+
+def team_pokemon_stats(snapshot, team_id: str, date_range: Optional[DateRange] = None) -> pd.DataFrame:
+    """指定チームが使用したポケモンごとの使用回数・勝利数・勝率（date_range があればその期間の試合のみ）"""
+    table = snapshot.appearances.table
+    pokemons = list(snapshot.pokemons)
+    team_code = table.teams.code_by_id.get(team_id, -1)
+    codes = _codes(table.pokemons, [pokemon.id for pokemon in pokemons])
+    if date_range:
+        # (チーム, ポケモン) の組を1つのエンティティとして引く
+        stride = timeline.timeline(snapshot).pokemon_codes
+        pair_codes = np.where((codes < 0) | (team_code < 0), -1, team_code * stride + codes)
+        played, won = _window(snapshot, 'team_pokemon', pair_codes, date_range)
+    else:
+        frame = appearances_frame(snapshot.appearances)
+        played, won = _played_won(frame[frame['team'] == team_code], 'pokemon', codes)
+
+    # 使用されたポケモンのみ
+    used = played > 0
+    return _with_win_rate({
+        'pokemon_id': [pokemon.id for pokemon, is_used in zip(pokemons, used) if is_used],
+        'pokemon_name': [pokemon.name for pokemon, is_used in zip(pokemons, used) if is_used],
+        'matches_played': played[used],
+        'matches_won': won[used],
+    })
+
+
+def _pair_stats(snapshot, played: np.ndarray, won: np.ndarray) -> pd.DataFrame:
+    """P×P の行列を、登録済みポケモンの組ごとの行 (pokemon, other_pokemon) に並べる"""
+    pokemons = list(snapshot.pokemons)
+    codes = _codes(snapshot.appearances.table.pokemons, [pokemon.id for pokemon in pokemons])
+    # 一度も出場していないポケモン（-1）は 0 の行・列を参照させる
+    padded_played = np.pad(played, ((0, 1), (0, 1)))
+    padded_won = np.pad(won, ((0, 1), (0, 1)))
+    codes = np.where(codes < 0, len(played), codes)
+    grid = np.ix_(codes, codes)
+
+    ids = np.array([pokemon.id for pokemon in pokemons], dtype=object)
+    names = np.array([pokemon.name for pokemon in pokemons], dtype=object)
+    pokemon_count = len(pokemons)
+    return _with_win_rate({
+        'pokemon_id': np.repeat(ids, pokemon_count),
+        'pokemon_name': np.repeat(names, pokemon_count),
+        'other_pokemon_id': np.tile(ids, pokemon_count),
+        'other_pokemon_name': np.tile(names, pokemon_count),
+        'matches_played': padded_played[grid].ravel(),
+        'matches_won': padded_won[grid].ravel(),
+    })
+
+
+def pokemon_synergy_stats(snapshot) -> pd.DataFrame:
+    """同じチームで出場したポケモンの組ごとの試合数・勝利数・勝率"""
+    matrices = matchups.pair_matrices(snapshot.appearances)
+    return _pair_stats(snapshot, matrices.ally, matrices.ally_won)
+
+
+def pokemon_counter_stats(snapshot) -> pd.DataFrame:
+    """pokemon が other_pokemon と対戦した試合数・勝利数・勝率（pokemon 側から見た勝率）"""
+    matrices = matchups.pair_matrices(snapshot.appearances)
+    return _pair_stats(snapshot, matrices.opponent, matrices.opponent_won)
+
+
+def lineup_stats(snapshot) -> pd.DataFrame:
+    """編成コードごとの試合数・勝利数（行番号が編成コード）"""
+    view = snapshot.appearances
+    lineup = _column(view.table.side_lineup, view.sides, np.intc)
+    won = _column(view.table.side_won, view.sides, np.int8)
+    size = len(view.table.lineups)
+    return pd.DataFrame({
+        'matches_played': np.bincount(lineup, minlength=size),
+        'matches_won': np.bincount(lineup, weights=won, minlength=size).astype(np.int64),
+    })
+
+
+def matching_lineups(snapshot, pokemon_ids: List[str], exact: bool = False) -> np.ndarray:
+    """
+    pokemon_ids を全部含む（exact なら完全に一致する）編成のコード。
+    部分一致は各ポケモンの転置インデックス（昇順の編成コード）の共通部分で求める。
+    """
+    lineups = snapshot.appearances.table.lineups
+    code_by_id = snapshot.appearances.table.pokemons.code_by_id
+    codes = [code_by_id.get(pokemon_id) for pokemon_id in pokemon_ids]
+    if any(code is None for code in codes):
+        return np.zeros(0, dtype=np.intc)
+    if exact:
+        code = lineups.code_by_lineup.get(tuple(sorted(codes)))
+        return np.array([] if code is None else [code], dtype=np.intc)
+    if not codes:
+        return np.arange(len(lineups), dtype=np.intc)
+
+    # 書き込み中のリストを直接参照しないよう、スライスでコピーしてから使う
+    postings = sorted(
+        (np.frombuffer(lineups.postings[code][:], dtype=np.intc) if code < len(lineups.postings)
+         else np.zeros(0, dtype=np.intc) for code in set(codes)),
+        key=len
+    )
+    return reduce(lambda left, right: np.intersect1d(left, right, assume_unique=True), postings)
+
+
+def lineup_search(snapshot, counts: pd.DataFrame, pokemon_ids: List[str], exact: bool = False,
+                  min_matches: int = 1, limit: Optional[int] = 50) -> dict:
+    """
+    編成の検索結果。counts は lineup_stats() の結果。
+    条件に合う全編成の合計と、試合数の多い順に limit 件の編成ごとの成績を返す。
+    """
+    codes = matching_lineups(snapshot, pokemon_ids, exact)
+    # スナップショットより後に登録された編成は counts にないので除く
+    codes = codes[codes < len(counts)]
+    played = counts['matches_played'].to_numpy()[codes]
+    won = counts['matches_won'].to_numpy()[codes]
+    total_played = int(played.sum())
+    total_won = int(won.sum())
+
+    shown = played >= max(min_matches, 1)
+    codes, played, won = codes[shown], played[shown], won[shown]
+    order = np.argsort(-played, kind='stable')[:limit]
+
+    table = snapshot.appearances.table
+    pokemon_by_id = snapshot.index.pokemon_by_id
+
+    def name(code: int) -> str:
+        pokemon_id = table.pokemons.ids[code]
+        pokemon = pokemon_by_id.get(pokemon_id)
+        return pokemon.name if pokemon else pokemon_id
+
+    rows = _with_win_rate({
+        'lineup': [" / ".join(sorted(name(code) for code in table.lineups.lineups[lineup]))
+                   for lineup in codes[order]],
+        'matches_played': played[order],
+        'matches_won': won[order],
+    })
+    return {
+        'matches_played': total_played,
+        'matches_won': total_won,
+        'win_rate': total_won / total_played if total_played else 0.0,
+        'lineup_count': int(len(codes)),
+        'lineups': rows,
+    }
+
+
+def match_dates(snapshot) -> List[str]:
+    """試合のある日付（昇順）"""
+    return list(timeline.timeline(snapshot).dates)
+
+
+def win_rate_trend(snapshot, kind: str, entity_id: str, window_days: int) -> pd.DataFrame:
+    """
+    kind（team / member / pokemon）の entity_id について、試合日ごとに
+    その日までの window_days 日間の試合数・勝利数・勝率を並べる。
+    """
+    table = snapshot.appearances.table
+    codes = {'team': table.teams, 'member': table.members, 'pokemon': table.pokemons}[kind]
+    dated = timeline.timeline(snapshot)
+    played, won = getattr(dated, kind).cumulative(codes.code_by_id.get(entity_id, -1))
+
+    # 日 d までの累積から、期間の始まりの前日までの累積を引く
+    starts = dated.rolling_starts(window_days)
+    played = np.concatenate(([0], played))
+    won = np.concatenate(([0], won))
+    ends = np.arange(1, len(dated.dates) + 1)
+    trend = _with_win_rate({
+        'date': dated.dates,
+        'matches_played': played[ends] - played[starts],
+        'matches_won': won[ends] - won[starts],
+    })
+    return trend[trend['matches_played'] > 0].reset_index(drop=True)
@@ -0,0 +1,379 @@
+"""
+Streamlit を通さずにデータを読むための JSON API（ボットや配信オーバーレイ用）。
+
+UI と同じプロセス共有のストア（get_store）と統計キャッシュ（models.cached_stats）を
+使うので、同じプロセスで動かせばデータもキャッシュも共有する。
+
+- レスポンスには ETag（データバージョン）を付け、If-None-Match が一致すれば 304 を返す
+- 同じバージョン・同じURLの本文はエンコード済みのバイト列をキャッシュして返す
+- 一覧はカーソルでページングする（next_cursor を cursor に渡す）
+- どのエンドポイントも ?season=<キー> でシーズンを選べる（省略すると開催中のシーズン）
+
+エンドポイント:
+    GET /api/version
+    GET /api/teams                      ?cursor&limit
+    GET /api/teams/{team_id}
+    GET /api/pokemons                   ?cursor&limit
+    GET /api/matches                    ?cursor&limit&team_id&date_from&date_to（新しい順）
+    GET /api/stats/teams                ?date_from&date_to&min_matches
+    GET /api/stats/pokemons             ?date_from&date_to&min_matches
+    GET /api/stats/members              ?date_from&date_to&min_matches
+    GET /api/stats/teams/{team_id}/pokemons ?date_from&date_to&min_matches
+
+ASGI アプリ（app）として uvicorn などで動かすか、`python api.py` で起動する
+（uvicorn がなければ標準ライブラリの HTTP サーバーで動く）。
+"""
+import argparse
+import asyncio
+import base64
+import binascii
+import datetime
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+from data_store import DataSnapshot, get_store
+from instrumentation import count
+from models import DataManager, cached_stats
+import seasons
+from storage import match_to_dict, pokemon_to_dict, team_to_dict
+
+# 1ページの件数（limit の既定値と上限）
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+# エンコード済みの本文を保持する件数
+RESPONSE_CACHE_SIZE = 256
+
+# プロセスごとのID。データバージョンはプロセス内の連番なので、再起動後に
+# 古い ETag と一致しないよう ETag に含める
+_BOOT_ID = binascii.hexlify(os.urandom(4)).decode()
+
+
+class ApiError(Exception):
+    """クライアントに返すエラー（status と message）"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Response(NamedTuple):
+    status: int
+    headers: List[Tuple[str, str]]
+    body: bytes
+
+
+def _json(value) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def _encode_cursor(value) -> str:
+    return base64.urlsafe_b64encode(_json(value).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, binascii.Error):
+        raise ApiError(400, "invalid cursor")
+
+
+def _limit(query: Dict[str, str]) -> int:
+    try:
+        limit = int(query.get("limit", DEFAULT_LIMIT))
+    except ValueError:
+        raise ApiError(400, "limit must be an integer")
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def _min_matches(query: Dict[str, str]) -> int:
+    try:
+        return int(query.get("min_matches", 0))
+    except ValueError:
+        raise ApiError(400, "min_matches must be an integer")
+
+
+def _date_range(query: Dict[str, str]) -> Optional[Tuple[Optional[str], Optional[str]]]:
+    """date_from / date_to（YYYY-MM-DD。どちらもなければ None）"""
+    for name in ("date_from", "date_to"):
+        if name in query:
+            try:
+                datetime.date.fromisoformat(query[name])
+            except ValueError:
+                raise ApiError(400, f"{name} must be a date (YYYY-MM-DD)")
+    date_from, date_to = query.get("date_from"), query.get("date_to")
+    return (date_from, date_to) if date_from or date_to else None
+
+
+def _check_query(query: Dict[str, str]):
+    """どのエンドポイントでも同じ意味のパラメーターを、データを読む前に検証する"""
+    _limit(query)
+    _min_matches(query)
+    _date_range(query)
+
+
+def _page(items, query: Dict[str, str], to_dict: Callable) -> str:
+    """追記専用の一覧を位置のカーソルでページングする（位置は追加後も変わらない）"""
+    offset = _decode_cursor(query["cursor"]) if "cursor" in query else 0
+    if not isinstance(offset, int) or offset < 0:
+        raise ApiError(400, "invalid cursor")
+    end = min(len(items), offset + _limit(query))
+    page = [to_dict(items[i]) for i in range(offset, end)]
+    next_cursor = _encode_cursor(end) if end < len(items) else None
+    return f'"items":{_json(page)},"next_cursor":{_json(next_cursor)}'
+
+
+def _teams(snapshot: DataSnapshot, query: Dict[str, str]) -> str:
+    return _page(snapshot.teams, query, team_to_dict)
+
+
+def _team(snapshot: DataSnapshot, query: Dict[str, str], team_id: str) -> str:
+    team = snapshot.index.team_by_id.get(team_id)
+    if team is None:
+        raise ApiError(404, "team not found")
+    return f'"item":{_json(team_to_dict(team))}'
+
+
+def _pokemons(snapshot: DataSnapshot, query: Dict[str, str]) -> str:
+    return _page(snapshot.pokemons, query, pokemon_to_dict)
+
+
+def _matches(snapshot: DataSnapshot, query: Dict[str, str]) -> str:
+    """日付の新しい順。カーソルは最後に返した試合の (日付, 追加順)"""
+    index = snapshot.index
+    team_id = query.get("team_id")
+    date_index = index.matches_by_team_date.get(team_id) if team_id else index.matches_by_date
+    before = None
+    if "cursor" in query:
+        before = _decode_cursor(query["cursor"])
+        if (not isinstance(before, list) or len(before) != 2
+                or not isinstance(before[0], str) or not isinstance(before[1], int)):
+            raise ApiError(400, "invalid cursor")
+    limit = _limit(query)
+    # 1件多く取り、次のページがあるかを判定する
+    entries = date_index.page(limit + 1, before, query.get("date_from"), query.get("date_to"),
+                              len(snapshot.matches)) if date_index else []
+    next_cursor = _encode_cursor(list(entries[limit - 1][0])) if len(entries) > limit else None
+    page = [match_to_dict(match) for _, match in entries[:limit]]
+    return f'"items":{_json(page)},"next_cursor":{_json(next_cursor)}'
+
+
+def _season_dir(query: Dict[str, str]) -> str:
+    """handle_request で確定したシーズン（query["season"]）のデータディレクトリ"""
+    return seasons.season_dir(DataManager.DATA_DIR, seasons.resolve(DataManager.DATA_DIR, query["season"]))
+
+
+def _stats(kind: str) -> Callable:
+    def handler(snapshot: DataSnapshot, query: Dict[str, str], team_id: Optional[str] = None) -> str:
+        if team_id is not None and team_id not in snapshot.index.team_by_id:
+            raise ApiError(404, "team not found")
+        date_range = _date_range(query)
+        min_matches = _min_matches(query)
+        frame = cached_stats(kind, _season_dir(query), snapshot, team_id, date_range)
+        if min_matches > 0 and not frame.empty:
+            frame = frame[frame["matches_played"] >= min_matches]
+        return f'"items":{frame.to_json(orient="records", force_ascii=False, double_precision=15) if not frame.empty else "[]"}'
+    return handler
+
+
+# (パスの要素, ハンドラー)。"{}" の位置の要素はハンドラーの引数になる
+ROUTES: List[Tuple[Tuple[str, ...], Callable]] = [
+    (("version",), lambda snapshot, query: f'"season":{_json(query["season"])},"counts":' + _json({
+        "teams": len(snapshot.teams), "pokemons": len(snapshot.pokemons), "matches": len(snapshot.matches)
+    })),
+    (("teams",), _teams),
+    (("teams", "{}"), _team),
+    (("pokemons",), _pokemons),
+    (("matches",), _matches),
+    (("stats", "teams"), _stats("team")),
+    (("stats", "pokemons"), _stats("pokemon")),
+    (("stats", "members"), _stats("member")),
+    (("stats", "teams", "{}", "pokemons"), _stats("team_pokemon")),
+]
+
+
+def _route(path: str) -> Tuple[Callable, List[str]]:
+    parts = [unquote(part) for part in path.strip("/").split("/")]
+    if not parts or parts[0] != "api":
+        raise ApiError(404, "not found")
+    parts = parts[1:]
+    for pattern, handler in ROUTES:
+        if len(pattern) == len(parts) and all(p == "{}" or p == part for p, part in zip(pattern, parts)):
+            return handler, [part for p, part in zip(pattern, parts) if p == "{}"]
+    raise ApiError(404, "not found")
+
+
+# (シーズンのデータディレクトリ, パス, クエリ) -> (データバージョン, 本文)
+_responses: "OrderedDict[Tuple[str, str, str], Tuple[int, bytes]]" = OrderedDict()
+_responses_lock = threading.Lock()
+
+
+def _store(query: Dict[str, str]):
+    return get_store(_season_dir(query), DataManager.STORAGE_BACKEND)
+
+
+def handle_request(method: str, target: str, headers: Dict[str, str]) -> Response:
+    """
+    1リクエストを処理する（ASGI と標準ライブラリのサーバーの共通部分）。
+    headers のキーは小文字。
+    """
+    count("api_requests")
+    if method not in ("GET", "HEAD"):
+        return _error(405, "method not allowed")
+
+    url = urlsplit(target)
+    query = dict(parse_qsl(url.query))
+    # シーズンを省略したら開催中のシーズン（新しいシーズンが始まれば変わる）
+    if query.get("season"):
+        season = seasons.find_season(DataManager.DATA_DIR, query["season"])
+    else:
+        season = seasons.active_season(DataManager.DATA_DIR)
+    if season is None:
+        return _error(404, "season not found")
+    query["season"] = season.key
+    # 存在しないパスや不正なパラメーターは、ETag を比べる前にエラーにする
+    try:
+        handler, args = _route(url.path)
+        _check_query(query)
+    except ApiError as e:
+        return _error(e.status, e.message)
+
+    # データバージョンはシーズン（ストア）ごとの連番なので、ETag にシーズンも含める
+    snapshot = _store(query).snapshot()
+    etag = f'"{_BOOT_ID}-{season.key}-{snapshot.version}"'
+    response_headers = [
+        ("etag", etag),
+        ("cache-control", "no-cache"),
+        ("x-data-version", str(snapshot.version)),
+    ]
+    if headers.get("if-none-match") in (etag, f"W/{etag}", "*"):
+        count("api_not_modified")
+        return Response(304, response_headers, b"")
+
+    key = (_season_dir(query), url.path, url.query)
+    count("api_cache_requests")
+    with _responses_lock:
+        cached = _responses.get(key)
+        if cached is not None and cached[0] == snapshot.version:
+            _responses.move_to_end(key)
+            body = cached[1]
+        else:
+            body = None
+    if body is None:
+        count("api_cache_misses")
+        try:
+            payload = handler(snapshot, query, *args)
+        except ApiError as e:
+            return _error(e.status, e.message)
+        body = f'{{"version":{snapshot.version},{payload}}}'.encode("utf-8")
+        with _responses_lock:
+            _responses[key] = (snapshot.version, body)
+            _responses.move_to_end(key)
+            while len(_responses) > RESPONSE_CACHE_SIZE:
+                _responses.popitem(last=False)
+
+    response_headers.append(("content-type", "application/json; charset=utf-8"))
+    response_headers.append(("content-length", str(len(body))))
+    return Response(200, response_headers, b"" if method == "HEAD" else body)
+
+
+def _error(status: int, message: str) -> Response:
+    body = _json({"error": message}).encode("utf-8")
+    return Response(status, [("content-type", "application/json; charset=utf-8"),
+                             ("content-length", str(len(body)))], body)
+
+
+async def app(scope, receive, send):
+    """ASGI アプリ。ストアの読み込みや統計の計算は待たせないようスレッドで行う"""
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+
+    target = scope["path"] + ("?" + scope["query_string"].decode("latin-1") if scope.get("query_string") else "")
+    headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope["headers"]}
+    response = await asyncio.to_thread(handle_request, scope["method"], target, headers)
+    await send({
+        "type": "http.response.start",
+        "status": response.status,
+        "headers": [(name.encode("latin-1"), value.encode("latin-1")) for name, value in response.headers],
+    })
+    await send({"type": "http.response.body", "body": response.body})
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """標準ライブラリのHTTPサーバー用"""
+
+    protocol_version = "HTTP/1.1"
+
+    def _respond(self):
+        response = handle_request(self.command, self.path, {k.lower(): v for k, v in self.headers.items()})
+        self.send_response(response.status)
+        for name, value in response.headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(response.body)
+
+    do_GET = do_HEAD = do_POST = do_PUT = do_DELETE = _respond
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(host: str = "127.0.0.1", port: int = 8000) -> ThreadingHTTPServer:
+    """標準ライブラリのHTTPサーバーを作る（serve_forever() で動かす）"""
+    server = ThreadingHTTPServer((host, port), _RequestHandler)
+    server.daemon_threads = True
+    return server
+
+
+_background_server: Optional[ThreadingHTTPServer] = None
+_background_lock = threading.Lock()
+
+
+def start_in_background(host: str = "127.0.0.1", port: int = 8000) -> ThreadingHTTPServer:
+    """
+    このプロセスでAPIサーバーをデーモンスレッドで動かす（何度呼んでも1つだけ）。
+    Streamlit のプロセスで動かせば、UI とストア・キャッシュを共有する。
+    """
+    global _background_server
+    with _background_lock:
+        if _background_server is None:
+            _background_server = make_server(host, port)
+            threading.Thread(target=_background_server.serve_forever, name="unite-api", daemon=True).start()
+        return _background_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ポケモンユナイト大会データの JSON API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    # Streamlit の外で st.cache_data を使うときの警告（No runtime found）を出さない
+    logging.getLogger("streamlit.runtime.caching.cache_data_api").setLevel(logging.ERROR)
+
+    try:
+        import uvicorn
+    except ImportError:
+        uvicorn = None
+    if uvicorn is not None:
+        uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+    else:
+        print(f"Serving on http://{args.host}:{args.port}/api/ (stdlib server)")
+        make_server(args.host, args.port).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -91,7 +91,8 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Display dashboard with summary statistics if there's data
-if st.session_state.teams and st.session_state.matches:
+summary = DataManager.get_summary()
+if summary['team_count'] and summary['match_count']:
     st.markdown('<h2 class="main-header">ダッシュボード</h2>', unsafe_allow_html=True)
     
     # Dashboard stats
@@ -103,10 +104,10 @@ if st.session_state.teams and st.session_state.matches:
             <h3 style="color: #5470C6;">登録済みチーム</h3>
             <p style="font-size: 20px; font-weight: bold;">総チーム数: {}</p>
             <hr style="margin: 10px 0; border-color: #eee;">
-        """.format(len(st.session_state.teams)), unsafe_allow_html=True)
+        """.format(summary['team_count']), unsafe_allow_html=True)
         
         # List all teams
-        for team in st.session_state.teams:
+        for team in DataManager.get_teams():
             st.markdown(f"""
             <div style="display: flex; align-items: center; margin-bottom: 8px;">
                 <div style="background-color: #5470C6; color: white; width: 24px; height: 24px; border-radius: 50%; 
@@ -123,41 +124,36 @@ if st.session_state.teams and st.session_state.matches:
             <div style="display: flex; justify-content: space-between; margin-bottom: 15px;">
                 <div>
                     <p style="color: #666; margin-bottom: 0;">総試合数</p>
-                    <p style="font-size: 24px; font-weight: bold; margin-top: 5px;">{len(st.session_state.matches)}</p>
+                    <p style="font-size: 24px; font-weight: bold; margin-top: 5px;">{summary['match_count']}</p>
                 </div>
                 <div>
                     <p style="color: #666; margin-bottom: 0;">登録済みポケモン</p>
-                    <p style="font-size: 24px; font-weight: bold; margin-top: 5px;">{len(st.session_state.pokemons)}体</p>
+                    <p style="font-size: 24px; font-weight: bold; margin-top: 5px;">{summary['pokemon_count']}体</p>
                 </div>
             </div>
         </div>
         """, unsafe_allow_html=True)
     
     # Show recent matches if any
-    if st.session_state.matches:
+    if summary['match_count']:
         st.markdown('<h3 style="margin-top: 30px; color: #FF0000;">最近の試合</h3>', unsafe_allow_html=True)
         
-        # Get recent matches
-        recent_matches = sorted(st.session_state.matches, key=lambda x: x.date, reverse=True)[:5]
+        # Get recent matches (date index, names already joined)
+        recent_matches = DataManager.get_recent_matches(5)
         
-        for match in recent_matches:
-            team_a = DataManager.get_team_by_id(match.team_a_data.team_id)
-            team_b = DataManager.get_team_by_id(match.team_b_data.team_id)
-            winner = DataManager.get_team_by_id(match.winner_team_id)
+        for row in recent_matches:
+            winner_style = 'style="color: #FF0000; font-weight: bold;"' if row['winner_id'] == row['team_a_id'] else ''
+            loser_style = 'style="color: #FF0000; font-weight: bold;"' if row['winner_id'] == row['team_b_id'] else ''
             
-            if team_a and team_b and winner:
-                winner_style = 'style="color: #FF0000; font-weight: bold;"' if winner.id == team_a.id else ''
-                loser_style = 'style="color: #FF0000; font-weight: bold;"' if winner.id == team_b.id else ''
-                
-                st.markdown(f"""
-                <div class="pokemon-card" style="padding: 15px; margin-bottom: 10px; display: flex; align-items: center;">
-                    <div style="flex: 2; text-align: right;"><span {winner_style}>{team_a.name}</span></div>
-                    <div style="flex: 1; text-align: center; font-weight: bold;">vs</div>
-                    <div style="flex: 2; text-align: left;"><span {loser_style}>{team_b.name}</span></div>
-                    <div style="flex: 2; text-align: right; color: #666; font-size: 0.9em;">勝者: <span style="color: #FF0000; font-weight: bold;">{winner.name}</span></div>
-                    <div style="flex: 1; text-align: right; color: #999; font-size: 0.8em;">{match.date}</div>
-                </div>
-                """, unsafe_allow_html=True)
+            st.markdown(f"""
+            <div class="pokemon-card" style="padding: 15px; margin-bottom: 10px; display: flex; align-items: center;">
+                <div style="flex: 2; text-align: right;"><span {winner_style}>{row['team_a_name']}</span></div>
+                <div style="flex: 1; text-align: center; font-weight: bold;">vs</div>
+                <div style="flex: 2; text-align: left;"><span {loser_style}>{row['team_b_name']}</span></div>
+                <div style="flex: 2; text-align: right; color: #666; font-size: 0.9em;">勝者: <span style="color: #FF0000; font-weight: bold;">{row['winner_name']}</span></div>
+                <div style="flex: 1; text-align: right; color: #999; font-size: 0.8em;">{row['date']}</div>
+            </div>
+            """, unsafe_allow_html=True)
 else:
     # Instructions for new users with Pokemon styling
     st.markdown("""
@@ -198,3 +194,31 @@ else:
         <div style="position: absolute; right: 10px; top: 10px; width: 20px; height: 20px; border-radius: 50%; background: linear-gradient(to bottom, white 50%, #FF0000 50%); border: 1px solid black;"></div>
     </div>
     """, unsafe_allow_html=True)
+
+# シーズン（大会）の管理。統計などは選択中のシーズンの試合だけを読み込む
+with st.expander("シーズン管理"):
+    active_season = DataManager.get_active_season()
+    # 試合数は求めるときだけ数える（エキスパンダーは閉じていても毎回実行される）
+    if st.toggle("試合数を表示", key="show_season_match_counts"):
+        for season, match_count in DataManager.get_season_match_counts():
+            label = "（開催中）" if season.key == active_season.key else ""
+            shown = match_count if match_count is not None else "未集計（`python seasons.py list` で集計）"
+            st.markdown(f"- **{season.name}**{label} `{season.key}` 試合数: {shown}")
+    else:
+        for season in DataManager.get_seasons():
+            label = "（開催中）" if season.key == active_season.key else ""
+            st.markdown(f"- **{season.name}**{label} `{season.key}`")
+    
+    with st.form("new_season_form", clear_on_submit=True):
+        st.markdown("新しいシーズンを始めると、以降の試合はそのシーズンに登録されます。")
+        new_season_key = st.text_input("シーズンID（英数字・-・_）")
+        new_season_name = st.text_input("シーズン名（省略するとIDと同じ）")
+        carry_over = st.checkbox("チームとポケモンを引き継ぐ", value=True)
+        if st.form_submit_button("シーズンを開始"):
+            try:
+                DataManager.start_season(new_season_key.strip(), new_season_name.strip() or None, carry_over)
+            except ValueError as e:
+                st.error(str(e))
+            else:
+                # サイドバーのシーズン選択から作り直す
+                st.rerun()
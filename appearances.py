@@ -0,0 +1,198 @@
+from array import array
+from typing import Dict, List, NamedTuple, Tuple
+
+from entities import Match
+
+
+class IdCodes:
+    """UUID文字列を 0 から始まる整数コードに辞書エンコードする"""
+
+    def __init__(self):
+        self.code_by_id: Dict[str, int] = {}
+        self.ids: List[str] = []
+
+    def encode(self, item_id: str) -> int:
+        code = self.code_by_id.get(item_id)
+        if code is None:
+            code = self.code_by_id[item_id] = len(self.ids)
+            self.ids.append(item_id)
+        return code
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def copy(self) -> "IdCodes":
+        codes = IdCodes()
+        codes.code_by_id = self.code_by_id.copy()
+        codes.ids = list(self.ids)
+        return codes
+
+    @staticmethod
+    def from_ids(ids: List[str]) -> "IdCodes":
+        """ids[i] をコード i とする IdCodes を作る"""
+        codes = IdCodes()
+        codes.ids = list(ids)
+        codes.code_by_id = {item_id: code for code, item_id in enumerate(codes.ids)}
+        return codes
+
+
+class LineupCodes:
+    """
+    サイドの編成（ポケモンコードの昇順タプル）を整数コードに辞書エンコードする。
+
+    編成の照合は辞書引き1回で済む。さらにポケモンコードごとに、そのポケモンを
+    含む編成コードのリスト（転置インデックス）を持つ。コードは登録順に振るので
+    各リストは昇順に並び、「このポケモンを全部含む編成」はリストの共通部分で求まる。
+    """
+
+    def __init__(self):
+        self.code_by_lineup: Dict[Tuple[int, ...], int] = {}
+        self.lineups: List[Tuple[int, ...]] = []
+        # ポケモンコード -> そのポケモンを含む編成コード（昇順）
+        self.postings: List[array] = []
+
+    def encode(self, lineup: Tuple[int, ...]) -> int:
+        code = self.code_by_lineup.get(lineup)
+        if code is None:
+            code = self.code_by_lineup[lineup] = len(self.lineups)
+            self.lineups.append(lineup)
+            postings = self.postings
+            previous = None
+            for pokemon in lineup:
+                if pokemon == previous:  # 同じポケモンが2体いても1回だけ
+                    continue
+                previous = pokemon
+                while len(postings) <= pokemon:
+                    postings.append(array('i'))
+                postings[pokemon].append(code)
+        return code
+
+    def __len__(self) -> int:
+        return len(self.lineups)
+
+    def copy(self) -> "LineupCodes":
+        codes = LineupCodes()
+        codes.code_by_lineup = self.code_by_lineup.copy()
+        codes.lineups = list(self.lineups)
+        codes.postings = [array('i', postings) for postings in self.postings]
+        return codes
+
+    def to_columns(self) -> Tuple[array, array]:
+        """(全編成のポケモンコードを並べた列, 各編成の終わりの位置) にする"""
+        pokemons, ends = array('i'), array('i')
+        for lineup in self.lineups:
+            pokemons.extend(lineup)
+            ends.append(len(pokemons))
+        return pokemons, ends
+
+    @staticmethod
+    def from_columns(pokemons: array, ends: array) -> "LineupCodes":
+        """to_columns() の列から作り直す"""
+        codes = LineupCodes()
+        start = 0
+        for end in ends:
+            codes.encode(tuple(pokemons[start:end]))
+            start = end
+        return codes
+
+
+class AppearanceView(NamedTuple):
+    """スナップショット時点の出場テーブル（先頭から rows 行、sides 行）"""
+    table: "AppearanceTable"
+    rows: int
+    sides: int
+
+
+class AppearanceTable:
+    """
+    試合データを列指向に平坦化した出場テーブル。
+
+    appearances は1行が (試合, サイド, チーム, メンバー, ポケモン, 勝敗) で、
+    sides は1行が (試合, チーム, 編成, 勝敗)。ID は IdCodes で、編成は LineupCodes で整数化する。
+    列は追記専用の array なので、試合追加のたびに O(出場人数) で伸ばせる。
+    """
+
+    # 列名と array の型（保存・復元用）
+    COLUMNS = {
+        "match": 'i', "side": 'b', "team": 'i', "member": 'i', "pokemon": 'i', "won": 'b',
+        "side_match": 'i', "side_team": 'i', "side_lineup": 'i', "side_won": 'b',
+    }
+
+    def __init__(self):
+        self.teams = IdCodes()
+        self.members = IdCodes()
+        self.pokemons = IdCodes()
+        self.lineups = LineupCodes()
+
+        # 出場（1試合につき通常10行）
+        self.match = array('i')
+        self.side = array('b')
+        self.team = array('i')
+        self.member = array('i')
+        self.pokemon = array('i')
+        self.won = array('b')
+
+        # サイド（1試合につき2行）
+        self.side_match = array('i')
+        self.side_team = array('i')
+        self.side_lineup = array('i')
+        self.side_won = array('b')
+
+        self.match_count = 0
+
+    def add_match(self, match: Match) -> None:
+        """試合1件分の行を追加"""
+        match_index = self.match_count
+        self.match_count += 1
+        encode_member = self.members.encode
+        encode_pokemon = self.pokemons.encode
+        for side, team_data in enumerate((match.team_a_data, match.team_b_data)):
+            team_code = self.teams.encode(team_data.team_id)
+            won = 1 if match.winner_team_id == team_data.team_id else 0
+            selections = team_data.player_selections
+            pokemons = [encode_pokemon(selection.pokemon_id) for selection in selections]
+            self.side_match.append(match_index)
+            self.side_team.append(team_code)
+            self.side_lineup.append(self.lineups.encode(tuple(sorted(pokemons))))
+            self.side_won.append(won)
+            count = len(selections)
+            self.match.extend([match_index] * count)
+            self.side.extend([side] * count)
+            self.team.extend([team_code] * count)
+            self.member.extend([encode_member(selection.member_id) for selection in selections])
+            self.pokemon.extend(pokemons)
+            self.won.extend([won] * count)
+
+    @staticmethod
+    def from_columns(columns: Dict[str, array], teams: IdCodes, members: IdCodes, pokemons: IdCodes,
+                     lineups: LineupCodes) -> "AppearanceTable":
+        """保存しておいた列とIDコード・編成コードから復元する"""
+        table = AppearanceTable()
+        table.teams, table.members, table.pokemons = teams, members, pokemons
+        table.lineups = lineups
+        for name, typecode in AppearanceTable.COLUMNS.items():
+            if columns[name].typecode != typecode:
+                raise ValueError(f"column {name} has typecode {columns[name].typecode}")
+            setattr(table, name, columns[name])
+        lengths = {len(columns[name]) for name in ("match", "side", "team", "member", "pokemon", "won")}
+        side_lengths = {len(columns[name]) for name in ("side_match", "side_team", "side_lineup", "side_won")}
+        if len(lengths) != 1 or len(side_lengths) != 1:
+            raise ValueError("columns have different lengths")
+        table.match_count = len(table.side_match) // 2
+        return table
+
+    def copy(self) -> "AppearanceTable":
+        """
+        現時点の内容の複製（列はメモリのコピーだけで済む）。別スレッドで保存している
+        間も元のテーブルへの追記を止めないために使う。
+        """
+        table = AppearanceTable()
+        table.teams, table.members, table.pokemons = self.teams.copy(), self.members.copy(), self.pokemons.copy()
+        table.lineups = self.lineups.copy()
+        for name in AppearanceTable.COLUMNS:
+            setattr(table, name, getattr(self, name)[:])
+        table.match_count = self.match_count
+        return table
+
+    def view(self) -> AppearanceView:
+        return AppearanceView(self, len(self.match), len(self.side_match))
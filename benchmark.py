@@ -0,0 +1,320 @@
+"""
+合成データで DataManager の主要な操作を計測する。
+
+    python benchmark.py [--sizes 1000 10000 100000 1000000] [--backend json]
+                        [--output bench_baseline.json] [--compare bench_baseline.json]
+
+試合数ごとに synthetic_data でデータを作り、読み込み・保存・試合追加・ID検索・
+各統計の計算について、実時間（中央値）・ピークメモリ・読み書きしたバイト数を記録する。
+ワーカーの起動時間の目安として、新しいインタープリタでの主なモジュールの
+import 時間と、そのとき読み込まれた重いライブラリも記録する（results の "imports"）。
+--output で結果をJSONに保存し、--compare で保存済みの結果と比べて
+TOLERANCE より遅くなった操作があれば終了コード1で終わる。
+
+バイト数は /proc/self/io の rchar / wchar（Linux のみ、他の環境では null）。
+ピークメモリは tracemalloc で別に1回実行して測るので、実時間には影響しない。
+"""
+import argparse
+import datetime
+import importlib.util
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+import streamlit.logger
+
+import data_store
+import instrumentation
+from models import DataManager, clear_stats_cache
+from synthetic_data import generate_dataset, write_dataset
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000, 1_000_000)
+# 比較時、ベースラインからこの割合を超えて遅くなったら回帰とみなす
+TOLERANCE = 0.25
+# これより短い操作は揺れが大きいので回帰判定しない
+MIN_COMPARE_SECONDS = 0.005
+# ID検索1回分の件数
+LOOKUP_BATCH = 1000
+# 試合追加1回分の件数
+ADD_MATCH_BATCH = 20
+# import 時間を測るモジュール（コア・ページから使うモデル・統計）
+IMPORT_TARGETS = ("data_store", "models", "analytics")
+# import したときに読み込まれたかを記録する重いライブラリ
+HEAVY_MODULES = ("streamlit", "pandas", "numpy", "plotly")
+
+
+def _io_counters() -> Optional[Dict[str, int]]:
+    try:
+        with open("/proc/self/io") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+    except OSError:
+        return None
+    return {"read": int(fields["rchar"]), "written": int(fields["wchar"])}
+
+
+def measure(fn: Callable[[], object], repeat: int = 3, setup: Optional[Callable[[], object]] = None,
+            ops: int = 1, memory: bool = True) -> dict:
+    """
+    fn を repeat 回実行して実時間の中央値などを返す（setup は計測しない）。
+    statistics.py がページなので、標準ライブラリの statistics は使わない。
+    """
+    times = []
+    read_bytes = written_bytes = None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        before = _io_counters()
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+        after = _io_counters()
+        if before and after:
+            read_bytes = after["read"] - before["read"]
+            written_bytes = after["written"] - before["written"]
+
+    peak_bytes = None
+    if memory:
+        if setup:
+            setup()
+        tracemalloc.start()
+        try:
+            fn()
+            _, peak_bytes = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    return {
+        "seconds": sorted(times)[len(times) // 2],
+        "min_seconds": min(times),
+        "ops": ops,
+        "peak_bytes": peak_bytes,
+        "read_bytes": read_bytes,
+        "written_bytes": written_bytes,
+    }
+
+
+def _forget_store():
+    """次の load_data で全件を読み直すよう、プロセス共有のストアを捨てる"""
+    key = (os.path.abspath(DataManager.DATA_DIR), DataManager.STORAGE_BACKEND)
+    store = data_store._stores.pop(key, None)
+    if store is not None:
+        store.flush()
+
+
+def _random_match(rng: random.Random) -> dict:
+    """DataManager.add_match の引数"""
+    team_a, team_b = rng.sample(list(DataManager.get_teams()), 2)
+    pokemons = DataManager.get_pokemons()
+
+    def lineup(team):
+        return [(member.id, pokemon.id) for member, pokemon in zip(team.members, rng.sample(list(pokemons), 5))]
+
+    return {
+        "team_a_id": team_a.id,
+        "team_a_player_selections": lineup(team_a),
+        "team_b_id": team_b.id,
+        "team_b_player_selections": lineup(team_b),
+        "winner_team_id": rng.choice((team_a, team_b)).id,
+        "date": datetime.date.today().isoformat(),
+    }
+
+
+def run_size(match_count: int, work_dir: str, backend: str, seed: int, repeat: int, memory: bool) -> dict:
+    """1つのデータ規模について全操作を計測する"""
+    data_dir = os.path.join(work_dir, f"matches_{match_count}")
+    shutil.rmtree(data_dir, ignore_errors=True)
+    started = time.perf_counter()
+    write_dataset(generate_dataset(match_count, seed=seed), data_dir, backend)
+    print(f"[{match_count}] データ作成 {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    DataManager.DATA_DIR = data_dir
+    DataManager.STORAGE_BACKEND = backend
+    # Streamlit の再実行中と同じ経路で計測が記録されるようにする
+    instrumentation.start_rerun()
+    _forget_store()
+    DataManager.load_data()
+
+    rng = random.Random(seed)
+    teams = list(DataManager.get_teams())
+    team_ids = [rng.choice(teams).id for _ in range(LOOKUP_BATCH)]
+    member_ids = [rng.choice(rng.choice(teams).members).id for _ in range(LOOKUP_BATCH)]
+    pokemon_ids = [rng.choice(list(DataManager.get_pokemons())).id for _ in range(LOOKUP_BATCH)]
+    target_team_id = teams[0].id
+    match_dates = DataManager.get_match_dates()
+    # 全期間の中ほどの30日分くらい
+    window = (match_dates[len(match_dates) // 3], match_dates[len(match_dates) // 3 + min(29, len(match_dates) // 3)])
+
+    def add_matches():
+        for _ in range(ADD_MATCH_BATCH):
+            DataManager.add_match(**_random_match(rng))
+
+    def add_matches_durable():
+        add_matches()
+        DataManager.flush_writes()
+
+    def _clear_pair_stats():
+        import matchups
+        clear_stats_cache()
+        matchups._matrices.clear()
+
+    def _clear_exports():
+        import export
+        export._exports.clear()
+
+    # pyarrow がなければ CSV で書き出す
+    export_format = "parquet" if importlib.util.find_spec("pyarrow") else "csv"
+
+    operations = [
+        ("load_data", DataManager.load_data, _forget_store, 1),
+        ("load_data_unchanged", DataManager.load_data, None, 1),
+        ("save_data", DataManager.save_data, None, 1),
+        # 追加はメモリに反映した時点で戻る。durable はファイルに書き終わるまでを含む
+        ("add_match", add_matches, DataManager.flush_writes, ADD_MATCH_BATCH),
+        ("add_match_durable", add_matches_durable, None, ADD_MATCH_BATCH),
+        ("get_team_by_id", lambda: [DataManager.get_team_by_id(i) for i in team_ids], None, LOOKUP_BATCH),
+        ("get_member_by_id", lambda: [DataManager.get_member_by_id(i) for i in member_ids], None, LOOKUP_BATCH),
+        ("get_pokemon_by_id", lambda: [DataManager.get_pokemon_by_id(i) for i in pokemon_ids], None, LOOKUP_BATCH),
+        # 統計はバージョンごとにキャッシュされるので、毎回キャッシュを空にして計算させる
+        ("calculate_team_stats", DataManager.calculate_team_stats, clear_stats_cache, 1),
+        ("calculate_pokemon_stats", DataManager.calculate_pokemon_stats, clear_stats_cache, 1),
+        ("calculate_member_stats", DataManager.calculate_member_stats, clear_stats_cache, 1),
+        ("calculate_team_pokemon_stats", lambda: DataManager.calculate_team_pokemon_stats(target_team_id),
+         clear_stats_cache, 1),
+        # 期間つきの統計は Timeline の累積の差で求める（Timeline はスナップショットごとに1回作る）
+        ("calculate_member_stats_window", lambda: DataManager.calculate_member_stats(*window),
+         clear_stats_cache, 1),
+        ("calculate_win_rate_trend", lambda: DataManager.calculate_win_rate_trend("team", target_team_id, 7),
+         clear_stats_cache, 1),
+        # ペアの行列は出場テーブルごとに増分更新されるので、そちらも捨てて作り直させる
+        ("calculate_pokemon_synergy_stats", DataManager.calculate_pokemon_synergy_stats,
+         _clear_pair_stats, 1),
+        ("calculate_pokemon_counter_stats", DataManager.calculate_pokemon_counter_stats,
+         _clear_pair_stats, 1),
+        # 編成ごとの集計はキャッシュ済みの状態で、検索（転置インデックスの共通部分）だけを測る
+        ("find_lineups", lambda: [DataManager.find_lineups(pokemon_ids[i:i + 2]) for i in range(LOOKUP_BATCH // 10)],
+         None, LOOKUP_BATCH // 10),
+        # エクスポートはバージョンごとにファイルを使い回すので、毎回書き直させる
+        ("export_appearances", lambda: DataManager.export_data("appearances", export_format), _clear_exports, 1),
+    ]
+
+    results = {}
+    for name, fn, setup, ops in operations:
+        results[name] = measure(fn, repeat, setup, ops, memory)
+        print(f"[{match_count}] {name:30s} {results[name]['seconds'] * 1000:10.2f} ms", file=sys.stderr)
+    return results
+
+
+def measure_imports(repeat: int) -> dict:
+    """IMPORT_TARGETS をそれぞれ新しいインタープリタで import する時間"""
+    results = {}
+    for module in IMPORT_TARGETS:
+        code = (
+            "import json, sys, time\n"
+            "started = time.perf_counter()\n"
+            f"import {module}\n"
+            "seconds = time.perf_counter() - started\n"
+            f"loaded = [m for m in {HEAVY_MODULES!r} if m in sys.modules]\n"
+            "print(json.dumps({'seconds': seconds, 'loaded': loaded}))\n"
+        )
+        runs = []
+        for _ in range(repeat):
+            output = subprocess.run(
+                [sys.executable, "-c", code],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                capture_output=True, text=True, check=True
+            ).stdout
+            runs.append(json.loads(output.splitlines()[-1]))
+        times = [run["seconds"] for run in runs]
+        results[f"import_{module}"] = {
+            "seconds": sorted(times)[len(times) // 2],
+            "min_seconds": min(times),
+            "ops": 1,
+            "loaded": runs[-1]["loaded"],
+        }
+        print(f"[imports] {module:22s} {results[f'import_{module}']['seconds'] * 1000:10.2f} ms "
+              f"({', '.join(runs[-1]['loaded']) or '-'})", file=sys.stderr)
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float = TOLERANCE) -> List[str]:
+    """ベースラインより tolerance を超えて遅くなった操作の説明"""
+    regressions = []
+    for size, operations in results["results"].items():
+        for name, result in operations.items():
+            base = baseline.get("results", {}).get(size, {}).get(name)
+            if not base or base["seconds"] < MIN_COMPARE_SECONDS:
+                continue
+            ratio = result["seconds"] / base["seconds"]
+            if ratio > 1 + tolerance:
+                regressions.append(f"{size} 試合 {name}: {base['seconds'] * 1000:.2f} ms -> "
+                                   f"{result['seconds'] * 1000:.2f} ms ({ratio:.2f}倍)")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="合成データで DataManager の操作を計測します")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="試合数（複数可）")
+    parser.add_argument("--backend", default="json", choices=("json", "sqlite"))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="各操作の実行回数")
+    parser.add_argument("--no-memory", action="store_true", help="ピークメモリを測らない")
+    parser.add_argument("--work-dir", help="データを作るディレクトリ（省略時は一時ディレクトリ）")
+    parser.add_argument("--output", help="結果を保存するJSONファイル")
+    parser.add_argument("--compare", help="比べるベースラインのJSONファイル")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="回帰とみなす遅くなった割合")
+    parser.add_argument("--no-imports", action="store_true", help="import 時間を測らない")
+    args = parser.parse_args(argv)
+
+    # Streamlit のランタイムなしで DataManager を使うので、その警告は出さない
+    streamlit.logger.set_log_level("error")
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="unite-bench-")
+    try:
+        results = {
+            "meta": {
+                "created": datetime.datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "backend": args.backend,
+                "seed": args.seed,
+                "repeat": args.repeat,
+            },
+            "results": {
+                str(size): run_size(size, work_dir, args.backend, args.seed, args.repeat, not args.no_memory)
+                for size in args.sizes
+            },
+        }
+        if not args.no_imports:
+            results["results"]["imports"] = measure_imports(args.repeat)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("meta", {}).get("backend") != args.backend:
+            print(f"注意: ベースラインの保存形式は {baseline.get('meta', {}).get('backend')} です", file=sys.stderr)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("ベースラインより遅くなった操作があります:", file=sys.stderr)
+            for line in regressions:
+                print(f"  {line}", file=sys.stderr)
+            return 1
+        print("ベースラインからの回帰はありません", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
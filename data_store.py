@@ -0,0 +1,449 @@
+from collections.abc import Sequence
+from contextlib import contextmanager
+from dataclasses import dataclass
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Tuple
+import gc
+import os
+import threading
+
+from entities import Team, Pokemon, Match
+from indexes import DataIndex
+from aggregates import StatsAggregator
+from appearances import AppearanceTable, AppearanceView
+from storage import RECORD_TYPES, StorageBackend, create_backend
+from instrumentation import count
+from write_behind import WriteBehind
+
+# 追記の耐久性（環境変数 UNITE_DURABILITY）
+#   always: 追記はファイルに書いて fsync するまで待つ
+#   batch:  メモリに反映したら戻り、書き込みスレッドがまとめて書いて fsync する
+#   off:    batch と同じだが fsync しない（OS に任せる）
+DURABILITY_LEVELS = ("always", "batch", "off")
+DURABILITY = os.environ.get("UNITE_DURABILITY", "batch")
+
+
+class ConflictError(Exception):
+    """楽観的排他で、読んだ時点のバージョンから既にデータが更新されていた"""
+
+
+@contextmanager
+def _gc_paused():
+    """
+    全件読み込みの間は循環GCを止める。大量のオブジェクトを作ると世代GCが
+    何度も走り、そのたびに読み込み済みのオブジェクト全体を走査して遅くなる。
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class AppendOnlyView(Sequence):
+    """追記専用リストの先頭n件だけを見せる読み取り専用ビュー"""
+
+    __slots__ = ("_items", "_length")
+
+    def __init__(self, items: list, length: int):
+        self._items = items
+        self._length = length
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._items[i] for i in range(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("index out of range")
+        return self._items[index]
+
+    def __iter__(self) -> Iterator:
+        return islice(self._items, self._length)
+
+
+@dataclass(frozen=True)
+class DataSnapshot:
+    """
+    ある時点で読み込まれたデータ一式（再実行中はこれを共有する）。
+
+    teams・pokemons・matches・appearances はその時点の件数で区切ったビューだが、
+    index と stats はストアと共有していて、後から追記された分も入る。
+    日付インデックスは len(matches) を size に渡して読み、カウンタは
+    DataStore.stats_at() でその時点の複製を取る。
+    """
+    teams: Sequence[Team]
+    pokemons: Sequence[Pokemon]
+    matches: Sequence[Match]
+    index: DataIndex
+    stats: StatsAggregator
+    appearances: AppearanceView
+    version: int
+
+
+class DataStore:
+    """
+    プロセス全体で共有する読み込み済みデータ。
+
+    全セッションが同じスナップショットを読む。スナップショットは追記専用の
+    リストに対するビューなので、書き込みはコピーせずに新しいバージョンを
+    公開するだけで、既存のスナップショットの中身は変わらない。
+
+    永続化は StorageBackend（JSON または SQLite）に任せ、ここでは読み込んだ
+    エンティティとインデックス・集計を保持してスナップショットとして公開する。
+    バックエンドに変更がなければ何も読まず、追加分があればその分だけ取り込む。
+
+    追記はメモリ上のデータにすぐ反映して新しいスナップショットを公開し、ファイルへは
+    書き込みスレッド（WriteBehind）がまとめて書く（write-behind）。書き込み中に来た
+    追記は次の1回にまとまり、圧縮もそのスレッドで行うので、追記を呼んだ側は
+    データ量によらず待たされない。書き終わるまでのレコードは _pending に持ち、
+    全件を読み直したときも反映し直すので、自分の書き込みは常に読める。
+
+    ロックは _io_lock（バックエンドを使う処理）→ backend.write_lock()（プロセス間）
+    → _lock（メモリ上の状態）の順に取る。
+    """
+
+    # セッションが参照できるよう保持しておく直近のスナップショット数
+    RETAINED_SNAPSHOTS = 16
+
+    def __init__(self, backend: StorageBackend, durability: Optional[str] = None):
+        self.durability = durability or DURABILITY
+        if self.durability not in DURABILITY_LEVELS:
+            raise ValueError(f"unknown durability: {self.durability}")
+        self.backend = backend
+        backend.fsync = self.durability != "off"
+        self._lock = threading.RLock()
+        self._io_lock = threading.Lock()
+
+        self._items: Dict[str, list] = {kind: [] for kind in RECORD_TYPES}
+        self._index = DataIndex()
+        self._stats = StatsAggregator()
+        self._appearances = AppearanceTable()
+        self._loaded = False
+
+        self._snapshot: Optional[DataSnapshot] = None
+        self._version = 0
+        # deferred_maintenance() の入れ子の深さ（0 でなければ追記後のメンテナンスを後回しにする）
+        self._maintenance_deferred = 0
+        # version -> スナップショット（古いものから破棄）
+        self._retained: Dict[int, DataSnapshot] = {}
+        # メモリに反映済みで、まだ書き込んでいないレコード（追記した順）
+        self._pending: List[Tuple[str, object]] = []
+        self._writer = WriteBehind(self._write_pending, name="unite-write-behind", after_flush=self._after_write)
+
+    def _apply(self, kind: str, item, aggregate: bool = True) -> bool:
+        """レコードを反映する。同じIDが既にあれば無視（圧縮途中の再生に備える）"""
+        if self._index.contains(kind, item.id):
+            return False
+        self._index.add(kind, item)
+        self._items[kind].append(item)
+        if kind == "match":
+            self._appearances.add_match(item)
+            if aggregate:
+                self._stats.add_match(item)
+        return True
+
+    def _apply_loaded(self, kind: str, items: list, aggregate: bool, tabulate: bool):
+        """全件読み込みの結果を反映する（試合は日付インデックスをまとめて作る）"""
+        if kind != "match":
+            for item in items:
+                self._apply(kind, item)
+            return
+        added = self._index.add_matches(items)
+        self._items["match"].extend(added)
+        for match in added:
+            if tabulate:
+                self._appearances.add_match(match)
+            if aggregate:
+                self._stats.add_match(match)
+
+    def _reset(self, stats: Optional[StatsAggregator] = None, appearances: Optional[AppearanceTable] = None):
+        # 古いスナップショットが参照しているリストは触らず、新しいものに差し替える
+        self._items = {kind: [] for kind in RECORD_TYPES}
+        self._index = DataIndex()
+        self._stats = stats or StatsAggregator()
+        self._appearances = appearances or AppearanceTable()
+
+    def _apply_records(self, records: List[Tuple[str, object]]):
+        for kind, item in records:
+            self._apply(kind, item)
+
+    def _reload_all(self):
+        """全件を読み直す"""
+        records = None
+        while records is None:
+            count("store_full_reloads")
+            with _gc_paused():
+                result = self.backend.load()
+                # 保存済みのカウンタや出場テーブルがあれば、その分の集計を省く
+                self._reset(result.stats, result.appearances)
+                for kind, kind_items in result.items.items():
+                    self._apply_loaded(kind, kind_items, aggregate=result.stats is None,
+                                       tabulate=result.appearances is None)
+            self.backend.after_load(self._items, self._appearances)
+            # 読み込み後に追加された分（JSONならジャーナル）
+            records = self.backend.poll()
+        self._apply_records(records)
+        # まだ書いていない自分の追記も見えるようにする
+        self._apply_records(self._pending)
+        self._loaded = True
+
+    def _refresh(self) -> bool:
+        """バックエンドの変更を取り込む。何か読み込んだらTrue"""
+        if not self._loaded:
+            self._reload_all()
+            return True
+        records = self.backend.poll()
+        if records is None:
+            self._reload_all()
+            return True
+        self._apply_records(records)
+        return bool(records)
+
+    def _publish(self) -> DataSnapshot:
+        self._version += 1
+        self._snapshot = DataSnapshot(
+            teams=AppendOnlyView(self._items["team"], len(self._items["team"])),
+            pokemons=AppendOnlyView(self._items["pokemon"], len(self._items["pokemon"])),
+            matches=AppendOnlyView(self._items["match"], len(self._items["match"])),
+            index=self._index,
+            stats=self._stats,
+            appearances=self._appearances.view(),
+            version=self._version
+        )
+        self._retained[self._version] = self._snapshot
+        if len(self._retained) > self.RETAINED_SNAPSHOTS:
+            del self._retained[min(self._retained)]
+        return self._snapshot
+
+    def get_snapshot(self, version: int) -> Optional[DataSnapshot]:
+        """
+        保持している指定バージョンのスナップショット（破棄済みならNone）。
+        ロックを取らないので、書き込み中でも読み込みは待たされない。
+        """
+        return self._retained.get(version)
+
+    def stats_at(self, snapshot: DataSnapshot) -> StatsAggregator:
+        """
+        snapshot の時点のカウンタの複製。共有のカウンタを複製し、
+        snapshot より後に追記された試合の分を戻す。
+        """
+        with self._lock:
+            stats = snapshot.stats.copy()
+            # 全件を読み直した後も、古いスナップショットのリストとカウンタは一緒に残っている
+            matches = snapshot.matches._items
+            for match in islice(matches, len(snapshot.matches), None):
+                stats.remove_match(match)
+            return stats
+
+    def snapshot(self) -> DataSnapshot:
+        """
+        最新のスナップショットを返す（変更がなければ何も読まない）。
+        書き込みスレッドがバックエンドを使っている間は待たずに、メモリ上の最新を返す
+        （自分の追記はメモリに反映済みなので、それで読める）。
+        """
+        if not self._io_lock.acquire(blocking=self._snapshot is None):
+            count("store_busy_reads")
+            return self._snapshot
+        try:
+            with self._lock:
+                if self._refresh() or self._snapshot is None:
+                    return self._publish()
+                return self._snapshot
+        finally:
+            self._io_lock.release()
+
+    def append(self, kind: str, item) -> DataSnapshot:
+        """エンティティ1件を追記し、新しいスナップショットを返す"""
+        return self.append_many(kind, [item])
+
+    def append_many(self, kind: str, items: Sequence) -> DataSnapshot:
+        """
+        複数のエンティティを追記する。メモリ上のデータにすぐ反映して新しい
+        スナップショットを返し、ファイルへは書き込みスレッドが書く（durability が
+        always なら書き終わるまで待つ）。書き込み待ちが溜まりすぎていれば減るまで待つ。
+        """
+        if self._snapshot is None:
+            self.snapshot()
+        records = [(kind, item) for item in items]
+        if not records:
+            return self._snapshot
+        # 書き込み待ちが溜まりすぎていれば、メモリに反映する前に（ロックの外で）減るまで待つ
+        self._writer.reserve(len(records))
+        ticket = None
+        try:
+            with self._lock:
+                self._apply_records(records)
+                self._pending.extend(records)
+                snapshot = self._publish()
+                # 番号は _pending の並びでのこの追記の終わりの位置（他のスレッドの追記と前後しない）
+                ticket = self._writer.submit(len(records))
+        finally:
+            if ticket is None:
+                self._writer.release(len(records))
+        if self.durability == "always":
+            self._writer.wait(ticket)
+        return snapshot
+
+    def append_unique(self, kind: str, items: Sequence) -> Tuple[DataSnapshot, list]:
+        """
+        チームまたはポケモンのうち、名前が登録済みのものとも互いとも重複しないものだけを
+        追記し、(新しいスナップショット, 追記したもの) を返す。重複は書き込みロックの中で
+        他プロセスの追記を取り込んでから調べるので、同時に同じ名前を登録しても1件しか
+        残らず、試合など他の追記とは衝突しない。書き込み待ちを書いてから同期で書く。
+        """
+        self.flush()
+        with self._io_lock, self.backend.write_lock(), self._lock:
+            refreshed = self._refresh()
+            known_names = {"team": self._index.team_by_name, "pokemon": self._index.pokemon_by_name}[kind]
+            seen_names = set()
+            new_items = []
+            for item in items:
+                if item.name in known_names or item.name in seen_names:
+                    continue
+                seen_names.add(item.name)
+                new_items.append(item)
+            if new_items:
+                records = [(kind, item) for item in new_items]
+                if self.backend.append(records):
+                    # 書いた分は読み直さずにそのまま取り込む
+                    self._apply_records(records)
+                # 読み込み済みにできなかった自分の追記分を取り込む
+                self._refresh()
+                self._maintain()
+            elif not refreshed and self._snapshot is not None:
+                return self._snapshot, new_items
+            return self._publish(), new_items
+
+    def _write_pending(self, n: int):
+        """書き込みスレッド: 書き込み待ちの先頭 n 件を1回で追記する"""
+        with self._io_lock:
+            with self.backend.write_lock():
+                with self._lock:
+                    # 他プロセスの追記分を先に取り込んでおくと、自分の追記を読み直さずに済む
+                    if self._refresh():
+                        self._publish()
+                    records = self._pending[:n]
+                # ファイルへの書き込み中もメモリ上のデータへの追記は止めない
+                self.backend.append(records)
+            # コミットできてから書き込み待ちから外す
+            with self._lock:
+                del self._pending[:n]
+                # 読み込み済みにできなかった自分の追記は読み直すが、IDが同じなので無視される
+                if self._refresh():
+                    self._publish()
+
+    def _after_write(self):
+        """書き込みスレッド: 追記が済んだと知らせた後で圧縮などを行う（always でも待たせない）"""
+        if self.backend.needs_maintenance():
+            with self._io_lock, self.backend.write_lock():
+                self._maintain()
+
+    def _maintain(self):
+        """
+        追記後のメンテナンス（圧縮など）。_io_lock と write_lock() の中で呼ぶ。
+        保存に時間がかかっても追記を止めないよう、その時点の複製を渡す。
+        """
+        if self._maintenance_deferred:
+            return
+        with self._lock:
+            # 書き込みロックを取り直す間に他プロセスが追記していれば、圧縮の前に取り込む
+            if self._refresh():
+                self._publish()
+            if not self.backend.needs_maintenance():
+                return
+            items = {kind: AppendOnlyView(kind_items, len(kind_items)) for kind, kind_items in self._items.items()}
+            stats = self._stats.copy()
+            appearances = self._appearances.copy()
+        # 全件を書き出す間に世代GCが読み込み済みのオブジェクト全体を走査すると、
+        # その間（GIL を持ったまま）追記するスレッドが止まる
+        with _gc_paused():
+            self.backend.after_append(items, stats, appearances)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        これまでの追記がファイルに書かれる（durability が off でなければ fsync される）まで待つ。
+        タイムアウトしたら False。書き込みに失敗していればその例外を送出する
+        （レコードはメモリに残り、書き込みスレッドが再試行する）。
+        """
+        return self._writer.wait(timeout=timeout)
+
+    def fingerprint(self) -> Optional[list]:
+        """backend.fingerprint()（書き込みスレッドと同時にバックエンドを使わないよう排他する）"""
+        with self._io_lock:
+            return self.backend.fingerprint()
+
+    @property
+    def pending_writes(self) -> int:
+        """書き込み待ちのレコード数"""
+        return self._writer.pending
+
+    @contextmanager
+    def deferred_maintenance(self):
+        """
+        ブロック内の追記では圧縮などのメンテナンス（after_append）を行わず、
+        抜けるときに書き込み待ちを書いてから1回だけ行う。一括インポートで
+        全件の書き直しを繰り返さないため。
+        """
+        with self._lock:
+            self._maintenance_deferred += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._maintenance_deferred -= 1
+                deferred = self._maintenance_deferred
+            if not deferred:
+                self.flush()
+                with self._io_lock, self.backend.write_lock():
+                    self._maintain()
+
+    def save(self, teams: Sequence[Team], pokemons: Sequence[Pokemon], matches: Sequence[Match],
+             expected_version: Optional[int] = None) -> DataSnapshot:
+        """
+        データ一式で書き直し、新しいスナップショットを公開する。
+        expected_version を渡すと、ロックを取った時点の最新データがそのバージョンの
+        スナップショットから変わっていれば ConflictError を送出する。
+        書き込み待ちの追記は先に書く。
+        """
+        self.flush()
+        with self._io_lock, self.backend.write_lock(), self._lock:
+            if expected_version is not None:
+                if self._refresh() or self._snapshot is None:
+                    self._publish()
+                if expected_version != self._snapshot.version:
+                    raise ConflictError(f"data changed since version {expected_version}")
+            self._reset()
+            for kind, items in (("team", teams), ("pokemon", pokemons), ("match", matches)):
+                for item in items:
+                    self._apply(kind, item)
+            self.backend.replace_all(self._items, self._stats, self._appearances)
+            # 書き直しの後に来た追記は、この後で書き込みスレッドが追記する
+            self._apply_records(self._pending)
+            self._loaded = True
+            return self._publish()
+
+
+_stores: Dict[Tuple[str, str], DataStore] = {}
+_stores_lock = threading.Lock()
+
+def find_store(data_dir: str, backend: str = "json") -> Optional[DataStore]:
+    """このプロセスで既に使っている DataStore（なければ None。作らない）"""
+    with _stores_lock:
+        return _stores.get((os.path.abspath(data_dir), backend))
+
+
+def get_store(data_dir: str, backend: str = "json") -> DataStore:
+    """データディレクトリと保存形式ごとに1つのDataStoreを返す"""
+    key = (os.path.abspath(data_dir), backend)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = DataStore(create_backend(data_dir, backend))
+            _stores[key] = store
+        return store
@@ -0,0 +1,79 @@
+from typing import Sequence
+
+import streamlit as st
+
+from instrumentation import Metrics, to_json_line, to_prometheus
+
+# 表示するカウンタと見出し（ここにないカウンタは「その他」にまとめて出す）
+COUNTER_LABELS = {
+    "files_read": "読んだファイル",
+    "bytes_read": "読んだバイト数",
+    "records_parsed": "パースしたレコード",
+    "files_written": "書いたファイル",
+    "bytes_written": "書いたバイト数",
+    "records_written": "書いたレコード",
+    "store_full_reloads": "全件読み直し",
+}
+
+CACHE_LABELS = {
+    "snapshot": "スナップショット",
+    "stats": "統計",
+    "chart": "グラフ",
+    "binary": "バイナリスナップショット",
+    "api": "APIレスポンス",
+    "export": "エクスポート",
+}
+
+
+def _method_rows(metrics: Metrics) -> list:
+    rows = [
+        {"メソッド": name, "呼び出し": metrics.calls[name], "累積(ms)": round(metrics.seconds[name] * 1000, 2)}
+        for name in metrics.calls
+    ]
+    return sorted(rows, key=lambda row: row["累積(ms)"], reverse=True)
+
+
+def _counter_rows(metrics: Metrics) -> list:
+    rows = [
+        {"項目": label, "値": int(metrics.counters.get(name, 0))}
+        for name, label in COUNTER_LABELS.items()
+    ]
+    for cache, label in CACHE_LABELS.items():
+        rate = metrics.hit_rate(cache)
+        requests = int(metrics.counters.get(f"{cache}_cache_requests", 0))
+        rows.append({
+            "項目": f"{label}キャッシュ ヒット率",
+            "値": f"{rate:.0%} ({requests}回)" if rate is not None else "-",
+        })
+    rows += [
+        {"項目": name, "値": value}
+        for name, value in sorted(metrics.counters.items())
+        if name not in COUNTER_LABELS and not name.endswith(("_cache_requests", "_cache_misses"))
+    ]
+    return rows
+
+
+def render_metrics(history: Sequence[Metrics], totals: Metrics) -> None:
+    """サイドバーに直前の再実行の計測と、書き出し用のボタンを表示する"""
+    with st.sidebar.expander("計測（前回の再実行）", expanded=False):
+        if not history:
+            st.caption("次の再実行から表示されます。")
+        else:
+            previous = history[-1]
+            st.caption(f"DataManager の呼び出し {sum(previous.calls.values())} 回（入れ子の呼び出しも含む）")
+            st.dataframe(_method_rows(previous), hide_index=True, use_container_width=True)
+            st.dataframe(_counter_rows(previous), hide_index=True, use_container_width=True)
+
+        st.download_button(
+            "Prometheus 形式（プロセス累計）",
+            to_prometheus(totals),
+            file_name="unite_metrics.prom",
+            mime="text/plain",
+        )
+        st.download_button(
+            "JSON Lines（このセッションの再実行）",
+            "".join(to_json_line(metrics) + "\n" for metrics in history),
+            file_name="unite_metrics.jsonl",
+            mime="application/x-ndjson",
+            disabled=not history,
+        )
@@ -0,0 +1,40 @@
+from dataclasses import dataclass
+from typing import List
+
+# 1試合あたり Match 1 + TeamMatchData 2 + PlayerSelection 10 個のオブジェクトが
+# できるので、__dict__ を持たない slots にしてインスタンスを小さくする
+
+@dataclass(slots=True)
+class Member:
+    id: str
+    name: str
+
+@dataclass(slots=True)
+class Team:
+    id: str
+    name: str
+    members: List[Member]
+
+@dataclass(slots=True)
+class Pokemon:
+    id: str
+    name: str
+
+# 同じ (メンバー, ポケモン) の組は読み込み時に1つのインスタンスを共有するので不変にする
+@dataclass(slots=True, frozen=True)
+class PlayerSelection:
+    member_id: str
+    pokemon_id: str
+
+@dataclass(slots=True)
+class TeamMatchData:
+    team_id: str
+    player_selections: List[PlayerSelection]
+
+@dataclass(slots=True)
+class Match:
+    id: str
+    team_a_data: TeamMatchData
+    team_b_data: TeamMatchData
+    winner_team_id: str
+    date: str
@@ -0,0 +1,210 @@
+"""
+出場データと統計のエクスポート（Parquet / Arrow / CSV）。
+
+出場データ（1行1出場に平坦化した試合データ）は出場テーブルの列から CHUNK_ROWS 行
+ずつ作って書き出すので、ファイル全体をメモリに持たない。Parquet と Arrow（IPC
+ファイル）は pyarrow が入っているときだけ使え（pip install '.[export]'）、
+なければ CSV で書き出す。
+
+書き出したファイルはデータバージョンごとに一時ディレクトリに置いておき、
+同じバージョン・同じ条件のエクスポートはファイルを使い回す。
+"""
+import atexit
+import os
+import shutil
+import tempfile
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from data_store import DataSnapshot
+from instrumentation import count
+from models import cached_stats
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# 1回に作って書き出す行数
+CHUNK_ROWS = 100_000
+
+# テーブル名と見出し（stats は models.cached_stats の種別）
+TABLES = {
+    "appearances": "出場データ（1行1出場）",
+    "team_stats": "チーム統計",
+    "member_stats": "プレイヤー統計",
+    "pokemon_stats": "ポケモン統計",
+}
+STATS_KINDS = {"team_stats": "team", "member_stats": "member", "pokemon_stats": "pokemon"}
+
+# 形式と (拡張子, MIME タイプ)
+FORMATS = {
+    "parquet": (".parquet", "application/vnd.apache.parquet"),
+    "arrow": (".arrow", "application/vnd.apache.arrow.file"),
+    "csv": (".csv", "text/csv"),
+}
+
+DateRange = Optional[Tuple[Optional[str], Optional[str]]]
+
+APPEARANCE_COLUMNS = ["match_id", "date", "side", "team_id", "team_name",
+                      "member_id", "member_name", "pokemon_id", "pokemon_name", "won"]
+
+
+def available_formats() -> List[str]:
+    """使える形式（pyarrow がなければ CSV だけ）"""
+    if pa is None:
+        return ["csv"]
+    return list(FORMATS)
+
+
+def _names(ids: List[str], lookup) -> np.ndarray:
+    """コード順の ID 一覧を名前の配列にする（コードで引けるように）"""
+    return np.array([lookup(item_id) for item_id in ids] + [""], dtype=object)
+
+
+def appearance_chunks(snapshot: DataSnapshot, chunk_rows: int = CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """出場データを chunk_rows 行ずつの DataFrame（列は APPEARANCE_COLUMNS）で返す"""
+    view = snapshot.appearances
+    if view.rows == 0:
+        # 行がなくても列名だけは書き出す
+        yield pd.DataFrame(columns=APPEARANCE_COLUMNS)
+        return
+    table = view.table
+    index = snapshot.index
+    # 出場テーブルのコード -> ID・名前（ID一覧は追記専用なので、ここでコピーした分で足りる）
+    team_ids = np.array(list(table.teams.ids), dtype=object)
+    member_ids = np.array(list(table.members.ids), dtype=object)
+    pokemon_ids = np.array(list(table.pokemons.ids), dtype=object)
+    team_names = _names(team_ids, lambda item_id: getattr(index.team_by_id.get(item_id), "name", ""))
+    member_names = _names(member_ids, lambda item_id: index.member_by_id[item_id][1].name
+                          if item_id in index.member_by_id else "")
+    pokemon_names = _names(pokemon_ids, lambda item_id: getattr(index.pokemon_by_id.get(item_id), "name", ""))
+    sides = np.array(["A", "B"], dtype=object)
+
+    for lo in range(0, view.rows, chunk_rows):
+        hi = min(lo + chunk_rows, view.rows)
+        match = np.frombuffer(table.match[lo:hi], dtype=np.intc)
+        team = np.frombuffer(table.team[lo:hi], dtype=np.intc)
+        member = np.frombuffer(table.member[lo:hi], dtype=np.intc)
+        pokemon = np.frombuffer(table.pokemon[lo:hi], dtype=np.intc)
+        # 試合番号はスナップショットの試合の並びと同じ（行は試合順）
+        first_match = int(match[0])
+        matches = snapshot.matches[first_match:int(match[-1]) + 1]
+        local = match - first_match
+        yield pd.DataFrame({
+            "match_id": np.array([m.id for m in matches], dtype=object)[local],
+            "date": np.array([m.date for m in matches], dtype=object)[local],
+            "side": sides[np.frombuffer(table.side[lo:hi], dtype=np.int8)],
+            "team_id": team_ids[team],
+            "team_name": team_names[team],
+            "member_id": member_ids[member],
+            "member_name": member_names[member],
+            "pokemon_id": pokemon_ids[pokemon],
+            "pokemon_name": pokemon_names[pokemon],
+            "won": np.frombuffer(table.won[lo:hi], dtype=np.int8).astype(bool),
+        })
+
+
+def _stats_chunks(snapshot: DataSnapshot, data_dir: str, kind: str, date_range: DateRange,
+                  chunk_rows: int) -> Iterator[pd.DataFrame]:
+    stats = cached_stats(kind, data_dir, snapshot, date_range=date_range)
+    # 行がなくても列名だけの1チャンクは返す
+    for lo in range(0, max(len(stats), 1), chunk_rows):
+        yield stats.iloc[lo:lo + chunk_rows]
+
+
+def table_chunks(snapshot: DataSnapshot, data_dir: str, table: str, date_range: DateRange = None,
+                 chunk_rows: int = CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """table の行を chunk_rows 行ずつ返す（date_range は統計のテーブルだけに使う）"""
+    if table == "appearances":
+        return appearance_chunks(snapshot, chunk_rows)
+    if table in STATS_KINDS:
+        return _stats_chunks(snapshot, data_dir, STATS_KINDS[table], date_range, chunk_rows)
+    raise ValueError(f"unknown table: {table}")
+
+
+def write_csv(chunks: Iterator[pd.DataFrame], path: str) -> None:
+    # Excel でも文字化けしないよう BOM を付ける（match_import も BOM 付きを読める）
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        header = True
+        for chunk in chunks:
+            chunk.to_csv(f, header=header, index=False)
+            header = False
+
+
+def write_arrow(chunks: Iterator[pd.DataFrame], path: str, file_format: str) -> None:
+    """Parquet か Arrow IPC ファイルに、チャンクごとに行グループ（レコードバッチ）として書く"""
+    writer = None
+    schema = None
+    try:
+        for chunk in chunks:
+            # 2つ目以降のチャンクは最初のチャンクの型に揃える
+            batch = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+            if writer is None:
+                schema = batch.schema
+                writer = (pq.ParquetWriter(path, schema) if file_format == "parquet"
+                          else pa.ipc.new_file(path, schema, options=pa.ipc.IpcWriteOptions(compression="zstd")))
+            writer.write_table(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def write_export(chunks: Iterator[pd.DataFrame], path: str, file_format: str) -> None:
+    if file_format == "csv":
+        write_csv(chunks, path)
+    elif file_format in FORMATS:
+        if pa is None:
+            raise ValueError(f"{file_format} で書き出すには pyarrow が必要です")
+        write_arrow(chunks, path, file_format)
+    else:
+        raise ValueError(f"unknown format: {file_format}")
+
+
+# (data_dir, テーブル, 形式, 期間) -> (データバージョン, ファイルのパス)
+_exports: Dict[tuple, Tuple[int, str]] = {}
+_exports_lock = threading.Lock()
+_export_dir: Optional[str] = None
+
+
+def _directory() -> str:
+    global _export_dir
+    if _export_dir is None:
+        _export_dir = tempfile.mkdtemp(prefix="unite-export-")
+        atexit.register(shutil.rmtree, _export_dir, True)
+    return _export_dir
+
+
+def export_file(snapshot: DataSnapshot, data_dir: str, table: str, file_format: str,
+                date_range: DateRange = None) -> str:
+    """
+    snapshot 時点の table を file_format で書き出したファイルのパス。
+    同じデータバージョン・同じ条件なら前に書いたファイルを返し、古いバージョンのファイルは消す。
+    """
+    if table not in STATS_KINDS:
+        date_range = None
+    key = (data_dir, table, file_format, date_range)
+    count("export_cache_requests")
+    with _exports_lock:
+        cached = _exports.get(key)
+        if cached is not None and cached[0] == snapshot.version and os.path.exists(cached[1]):
+            return cached[1]
+
+        count("export_cache_misses")
+        extension = FORMATS[file_format][0] if file_format in FORMATS else ""
+        fd, path = tempfile.mkstemp(prefix=f"{table}-", suffix=extension, dir=_directory())
+        os.close(fd)
+        try:
+            write_export(table_chunks(snapshot, data_dir, table, date_range), path, file_format)
+        except BaseException:
+            os.remove(path)
+            raise
+        _exports[key] = (snapshot.version, path)
+        if cached is not None and os.path.exists(cached[1]):
+            os.remove(cached[1])
+        return path
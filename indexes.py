@@ -0,0 +1,211 @@
+from bisect import bisect_left, bisect_right
+from operator import itemgetter
+from typing import Callable, Dict, List, Optional, Set, Tuple, TypeVar
+
+from entities import Member, Team, Pokemon, Match
+
+T = TypeVar("T")
+
+
+class MatchDateIndex:
+    """
+    試合を日付順に並べたインデックス。
+
+    キーは (日付, 追加順) で、新しいほうから辿ると日付の降順・同じ日付の中は
+    後から登録したものが先になる。試合はほぼ日付順に追加されるので、
+    挿入位置はほぼ末尾になる（同じ日付の試合が大量にあっても末尾に入る）。
+
+    インデックスはストアの最新の状態に合わせて伸びるので、古いスナップショットから
+    読むときは size（そのスナップショットの試合数）を渡し、追加順が size 以降の試合を除く。
+    後から追加された試合は通常ごく少ないので、除く手間はその件数分で済む。
+    """
+
+    def __init__(self):
+        self._keys: List[Tuple[str, int]] = []
+        self._matches: List[Match] = []
+        # キーを追加した順（追加順の昇順）
+        self._added: List[Tuple[str, int]] = []
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, match: Match, position: int) -> None:
+        key = (match.date, position)
+        i = bisect_right(self._keys, key)
+        self._keys.insert(i, key)
+        self._matches.insert(i, match)
+        self._added.append(key)
+
+    def extend(self, entries: List[Tuple[Match, int]]) -> None:
+        """
+        (試合, 追加順) をまとめて追加する（全件読み込み用）。
+        末尾に足してから1回だけ並べ直すので、ほぼ日付順なら O(n) で済む。
+        """
+        added = [(match.date, position) for match, position in entries]
+        keys = self._keys + added
+        matches = self._matches + [match for match, _ in entries]
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self._keys = [keys[i] for i in order]
+        self._matches = [matches[i] for i in order]
+        self._added.extend(added)
+
+    def _read(self, read: Callable[[], T]) -> T:
+        """
+        ロックなしで読む。読んでいる間に追加があると位置がずれるので、
+        追加の途中でなく、読む前後で件数が変わらなかった結果だけを返す。
+        """
+        while True:
+            length = len(self._keys)
+            if length == len(self._matches) == len(self._added):
+                result = read()
+                if length == len(self._keys) == len(self._matches):
+                    return result
+
+    def _hidden(self, lo: int, hi: int, size: Optional[int]) -> List[int]:
+        """[lo, hi) のうち、追加順が size 以降の試合の位置（昇順。size が None なら空）"""
+        if size is None:
+            return []
+        start = bisect_left(self._added, size, key=itemgetter(1))
+        return sorted(i for i in (bisect_left(self._keys, key) for key in self._added[start:]) if lo <= i < hi)
+
+    def bounds(self, date_from: Optional[str] = None, date_to: Optional[str] = None) -> Tuple[int, int]:
+        """日付範囲（両端を含む）に入る位置の範囲 [lo, hi)"""
+        lo = bisect_left(self._keys, (date_from, float('-inf'))) if date_from else 0
+        hi = bisect_right(self._keys, (date_to, float('inf'))) if date_to else len(self._keys)
+        return lo, max(lo, hi)
+
+    def count(self, date_from: Optional[str] = None, date_to: Optional[str] = None,
+              size: Optional[int] = None) -> int:
+        def read() -> int:
+            lo, hi = self.bounds(date_from, date_to)
+            return hi - lo - len(self._hidden(lo, hi, size))
+        return self._read(read)
+
+    def _newest(self, lo: int, hi: int, offset: int, limit: int, size: Optional[int]) -> List[int]:
+        """[lo, hi) のうち size 未満の試合の位置を、新しい順に offset 件目から limit 件"""
+        hidden = self._hidden(lo, hi, size)
+        # 除く試合が offset 件の中にあれば、その分だけ古いほうにずらす
+        end = hi - offset
+        for i in reversed(hidden):
+            if i >= end:
+                end -= 1
+        positions = []
+        skip = set(hidden)
+        i = end - 1
+        while i >= lo and len(positions) < limit:
+            if i not in skip:
+                positions.append(i)
+            i -= 1
+        return positions
+
+    def latest(self, offset: int = 0, limit: int = 10,
+               date_from: Optional[str] = None, date_to: Optional[str] = None,
+               size: Optional[int] = None) -> List[Match]:
+        """新しい順に offset 件目から limit 件（O(limit)）"""
+        def read() -> List[Match]:
+            lo, hi = self.bounds(date_from, date_to)
+            return [self._matches[i] for i in self._newest(lo, hi, offset, limit, size)]
+        return self._read(read)
+
+    def page(self, limit: int, before: Optional[Tuple[str, int]] = None,
+             date_from: Optional[str] = None, date_to: Optional[str] = None,
+             size: Optional[int] = None) -> List[Tuple[Tuple[str, int], Match]]:
+        """
+        新しい順に、キーが before より前の試合から limit 件を (キー, 試合) で返す。
+        最後のキーを次の before にすれば、途中で試合が追加されてもページがずれない。
+        """
+        def read() -> List[Tuple[Tuple[str, int], Match]]:
+            lo, hi = self.bounds(date_from, date_to)
+            if before is not None:
+                hi = max(lo, min(hi, bisect_left(self._keys, tuple(before))))
+            return [(self._keys[i], self._matches[i]) for i in self._newest(lo, hi, 0, limit, size)]
+        return self._read(read)
+
+
+class DataIndex:
+    """
+    IDと名前で引くためのハッシュインデックス。
+
+    読み込んだデータに対して一度だけ構築し、以降は追加のたびに
+    add() で差分更新する。データは追記のみなので削除は扱わない。
+    """
+
+    def __init__(self):
+        self.team_by_id: Dict[str, Team] = {}
+        self.team_by_name: Dict[str, Team] = {}
+        # member_id -> (チーム, メンバー)
+        self.member_by_id: Dict[str, Tuple[Team, Member]] = {}
+        self.pokemon_by_id: Dict[str, Pokemon] = {}
+        self.pokemon_by_name: Dict[str, Pokemon] = {}
+        self.match_ids: Set[str] = set()
+        # 日付順の試合（全体とチーム別）
+        self.matches_by_date = MatchDateIndex()
+        self.matches_by_team_date: Dict[str, MatchDateIndex] = {}
+
+    def contains(self, kind: str, item_id: str) -> bool:
+        """指定種別のIDが登録済みか"""
+        if kind == "team":
+            return item_id in self.team_by_id
+        if kind == "pokemon":
+            return item_id in self.pokemon_by_id
+        return item_id in self.match_ids
+
+    def add(self, kind: str, item) -> None:
+        """追加されたエンティティをインデックスに反映"""
+        if kind == "team":
+            self.add_team(item)
+        elif kind == "pokemon":
+            self.add_pokemon(item)
+        else:
+            self.add_match(item)
+
+    def add_team(self, team: Team) -> None:
+        self.team_by_id[team.id] = team
+        self.team_by_name.setdefault(team.name, team)
+        for member in team.members:
+            self.member_by_id[member.id] = (team, member)
+
+    def add_pokemon(self, pokemon: Pokemon) -> None:
+        self.pokemon_by_id[pokemon.id] = pokemon
+        self.pokemon_by_name.setdefault(pokemon.name, pokemon)
+
+    def add_match(self, match: Match) -> None:
+        position = len(self.match_ids)
+        self.match_ids.add(match.id)
+        self.matches_by_date.add(match, position)
+        for team_id in {match.team_a_data.team_id, match.team_b_data.team_id}:
+            team_index = self.matches_by_team_date.get(team_id)
+            if team_index is None:
+                team_index = self.matches_by_team_date[team_id] = MatchDateIndex()
+            team_index.add(match, position)
+
+    def add_matches(self, matches: List[Match]) -> List[Match]:
+        """
+        試合をまとめて追加し、追加した（未登録だった）試合を返す（全件読み込み用）。
+        日付インデックスは1件ずつ挿入せず、最後にまとめて並べる。
+        """
+        added = []
+        entries = []
+        entries_by_team: Dict[str, List[Tuple[Match, int]]] = {}
+        position = len(self.match_ids)
+        for match in matches:
+            if match.id in self.match_ids:
+                continue
+            self.match_ids.add(match.id)
+            added.append(match)
+            entry = (match, position)
+            position += 1
+            entries.append(entry)
+            for team_id in {match.team_a_data.team_id, match.team_b_data.team_id}:
+                team_entries = entries_by_team.get(team_id)
+                if team_entries is None:
+                    team_entries = entries_by_team[team_id] = []
+                team_entries.append(entry)
+
+        self.matches_by_date.extend(entries)
+        for team_id, team_entries in entries_by_team.items():
+            team_index = self.matches_by_team_date.get(team_id)
+            if team_index is None:
+                team_index = self.matches_by_team_date[team_id] = MatchDateIndex()
+            team_index.extend(team_entries)
+        return added
@@ -0,0 +1,183 @@
+"""
+DataManager の呼び出し回数・累積時間と、読み書きやキャッシュのカウンタを記録する。
+
+記録先は2つある。
+- 再実行ごとの Metrics（Streamlit は再実行をスレッドで動かすので、スレッドごとに持つ）
+- プロセス全体の累計（Prometheus 形式で書き出す用）
+
+再実行中の記録はロックを取らずにスレッドの Metrics に足し、終わった再実行を
+add_to_totals() でまとめて累計に足す。再実行の外（CLI など）の記録は直接累計に足す。
+
+streamlit には依存しないので、storage などの下の層からも count() を呼べる。
+"""
+import functools
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+# 設定すると、再実行ごとの記録をこのファイルに JSON Lines で追記する
+LOG_FILE = os.environ.get("UNITE_METRICS_LOG")
+
+
+class Metrics:
+    """メソッドごとの呼び出し回数・累積秒数と、名前付きカウンタ"""
+
+    def __init__(self):
+        self.started = time.time()
+        self.calls: Dict[str, int] = {}
+        self.seconds: Dict[str, float] = {}
+        self.counters: Dict[str, float] = {}
+
+    def record_call(self, name: str, seconds: float) -> None:
+        self.calls[name] = self.calls.get(name, 0) + 1
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    def count(self, name: str, value: float = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge(self, other: "Metrics") -> None:
+        for name, calls in other.calls.items():
+            self.calls[name] = self.calls.get(name, 0) + calls
+            self.seconds[name] = self.seconds.get(name, 0.0) + other.seconds[name]
+        for name, value in other.counters.items():
+            self.count(name, value)
+
+    def hit_rate(self, cache: str) -> Optional[float]:
+        """
+        キャッシュのヒット率。{cache}_cache_requests と {cache}_cache_misses の
+        カウンタから求める（要求がなければNone）。
+        """
+        requests = self.counters.get(f"{cache}_cache_requests", 0)
+        if not requests:
+            return None
+        return 1 - self.counters.get(f"{cache}_cache_misses", 0) / requests
+
+    def to_dict(self) -> dict:
+        return {
+            "started": self.started,
+            "methods": {
+                name: {"calls": self.calls[name], "seconds": self.seconds[name]}
+                for name in sorted(self.calls)
+            },
+            "counters": dict(sorted(self.counters.items())),
+        }
+
+
+_local = threading.local()
+_totals = Metrics()
+_totals_lock = threading.Lock()
+
+
+def current() -> Optional[Metrics]:
+    """このスレッドで実行中の再実行の記録（start_rerun() 前ならNone）"""
+    return getattr(_local, "metrics", None)
+
+
+def start_rerun() -> Metrics:
+    """このスレッドで新しい再実行の記録を始める"""
+    metrics = _local.metrics = Metrics()
+    return metrics
+
+
+def add_to_totals(metrics: Metrics) -> None:
+    """終わった再実行の記録をプロセス全体の累計に足す"""
+    with _totals_lock:
+        _totals.merge(metrics)
+
+
+def totals() -> Metrics:
+    """プロセス全体の累計のコピー"""
+    with _totals_lock:
+        copy = Metrics()
+        copy.started = _totals.started
+        copy.calls = dict(_totals.calls)
+        copy.seconds = dict(_totals.seconds)
+        copy.counters = dict(_totals.counters)
+    return copy
+
+
+def record_call(name: str, seconds: float) -> None:
+    # 呼び出しのたびに通るので current() を経由しない
+    metrics = getattr(_local, "metrics", None)
+    if metrics is not None:
+        metrics.record_call(name, seconds)
+        return
+    with _totals_lock:
+        _totals.record_call(name, seconds)
+
+
+def count(name: str, value: float = 1) -> None:
+    """カウンタを加算する（bytes_read など）"""
+    metrics = getattr(_local, "metrics", None)
+    if metrics is not None:
+        counters = metrics.counters
+        counters[name] = counters.get(name, 0) + value
+        return
+    with _totals_lock:
+        _totals.count(name, value)
+
+
+def timed(name: str) -> Callable:
+    """関数の呼び出し回数と累積時間を name で記録するデコレーター"""
+    def decorator(fn: Callable) -> Callable:
+        perf_counter = time.perf_counter
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record_call(name, perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def instrument_methods(cls):
+    """
+    クラスの公開 staticmethod を timed で包むクラスデコレーター。
+    _ で始まる内部用のメソッドは呼び出しが多く入れ子にもなるので包まない。
+    """
+    for name, value in list(vars(cls).items()):
+        if isinstance(value, staticmethod) and not name.startswith("_"):
+            setattr(cls, name, staticmethod(timed(f"{cls.__name__}.{name}")(value.__func__)))
+    return cls
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def to_prometheus(metrics: Metrics, prefix: str = "unite") -> str:
+    """Prometheus のテキスト形式"""
+    lines = [
+        f"# HELP {prefix}_method_calls_total Number of calls per method.",
+        f"# TYPE {prefix}_method_calls_total counter",
+    ]
+    lines += [f'{prefix}_method_calls_total{{method="{_label(name)}"}} {calls}'
+              for name, calls in sorted(metrics.calls.items())]
+    lines += [
+        f"# HELP {prefix}_method_seconds_total Cumulative wall time per method.",
+        f"# TYPE {prefix}_method_seconds_total counter",
+    ]
+    lines += [f'{prefix}_method_seconds_total{{method="{_label(name)}"}} {seconds:.6f}'
+              for name, seconds in sorted(metrics.seconds.items())]
+    for name, value in sorted(metrics.counters.items()):
+        lines.append(f"# TYPE {prefix}_{name}_total counter")
+        lines.append(f"{prefix}_{name}_total {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+def to_json_line(metrics: Metrics, **extra) -> str:
+    """1回分の記録を JSON Lines の1行にする（extra はページ名など）"""
+    return json.dumps({**extra, **metrics.to_dict()}, ensure_ascii=False, separators=(',', ':'))
+
+
+def log_rerun(metrics: Metrics, **extra) -> None:
+    """LOG_FILE が設定されていれば1行追記する"""
+    if not LOG_FILE:
+        return
+    with open(LOG_FILE, "a", encoding="utf-8") as f:
+        f.write(to_json_line(metrics, **extra) + "\n")
@@ -0,0 +1,300 @@
+"""
+大会結果の一括インポート（CSV / JSON Lines）。
+
+ファイルを1行ずつ読み、CHUNK_SIZE 行ごとにまとめて検証して1回の書き込みで
+登録する。読み込み中に持つのは1チャンク分だけなので、ファイルの大きさに
+関係なくメモリ使用量は一定になる。チーム・メンバー・ポケモンは名前で書き、
+スナップショットのインデックスでIDに変換する。
+
+CSV は1行1試合で、列は CSV_COLUMNS（ヘッダー行が必要）:
+    date, team_a, team_b, winner,
+    a1_member, a1_pokemon, ..., a5_member, a5_pokemon,
+    b1_member, b1_pokemon, ..., b5_member, b5_pokemon
+
+JSON Lines は1行1試合で:
+    {"date": "2024-01-01", "team_a": "...", "team_b": "...", "winner": "...",
+     "team_a_players": [{"member": "...", "pokemon": "..."}, ...],
+     "team_b_players": [["メンバー", "ポケモン"], ...]}
+
+使い方:
+    python match_import.py results.csv [more.jsonl ...] [--chunk-size 5000] [--dry-run]
+"""
+import argparse
+import csv
+import datetime
+import io
+import json
+import os
+import sys
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from data_store import DataSnapshot
+from models import DataManager
+
+# 1チームの出場人数
+PLAYERS_PER_TEAM = 5
+# 1回の書き込みで登録する行数
+CHUNK_SIZE = 5000
+# 結果に残すエラーの件数（件数自体はすべて数える）
+MAX_ERRORS = 100
+
+CSV_COLUMNS = ["date", "team_a", "team_b", "winner"] + [
+    f"{side}{i}_{field}"
+    for side in ("a", "b")
+    for i in range(1, PLAYERS_PER_TEAM + 1)
+    for field in ("member", "pokemon")
+]
+
+# (行番号, 試合の項目)。項目は date, team_a, team_b, winner と
+# team_a_players / team_b_players（(メンバー名, ポケモン名) のリスト）
+Row = Tuple[int, dict]
+
+
+class ImportResult:
+    """インポートの集計（エラーは先頭 MAX_ERRORS 件だけ保持する）"""
+
+    def __init__(self):
+        self.rows_read = 0
+        self.imported = 0
+        self.error_count = 0
+        self.errors: List[Tuple[int, str]] = []
+
+    def add_error(self, line: int, message: str) -> None:
+        self.error_count += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append((line, message))
+
+
+def read_csv(lines: Iterable[str]) -> Iterator[Row]:
+    reader = csv.DictReader(lines)
+    missing = [column for column in CSV_COLUMNS if column not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"CSVに必要な列がありません: {', '.join(missing)}")
+    for record in reader:
+        players = {
+            side: [(record[f"{side}{i}_member"] or "", record[f"{side}{i}_pokemon"] or "")
+                   for i in range(1, PLAYERS_PER_TEAM + 1)]
+            for side in ("a", "b")
+        }
+        # line_num は行の終わりの行番号（引用符内の改行も数える）
+        yield reader.line_num, {
+            "date": record["date"],
+            "team_a": record["team_a"],
+            "team_b": record["team_b"],
+            "winner": record["winner"],
+            "team_a_players": players["a"],
+            "team_b_players": players["b"],
+        }
+
+
+def read_jsonl(lines: Iterable[str]) -> Iterator[Row]:
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield line_number, {"error": "JSONとして読めません"}
+            continue
+        if not isinstance(record, dict):
+            yield line_number, {"error": "1行に1つのオブジェクトを書いてください"}
+            continue
+        for key in ("team_a_players", "team_b_players"):
+            players = record.get(key)
+            if isinstance(players, list):
+                record[key] = [
+                    (player.get("member", ""), player.get("pokemon", "")) if isinstance(player, dict)
+                    else tuple(player) if isinstance(player, (list, tuple)) and len(player) == 2
+                    else ("", "")
+                    for player in players
+                ]
+        yield line_number, record
+
+
+def read_rows(lines: Iterable[str], file_format: str) -> Iterator[Row]:
+    """file_format は "csv" か "jsonl" """
+    if file_format == "csv":
+        return read_csv(lines)
+    if file_format == "jsonl":
+        return read_jsonl(lines)
+    raise ValueError(f"unknown format: {file_format}")
+
+
+def format_from_name(file_name: str) -> str:
+    """拡張子から形式を決める（.jsonl / .ndjson / .json は JSON Lines、それ以外は CSV）"""
+    extension = os.path.splitext(file_name)[1].lower()
+    return "jsonl" if extension in (".jsonl", ".ndjson", ".json") else "csv"
+
+
+class MatchValidator:
+    """
+    名前で書かれた試合をスナップショットのインデックスでIDに変換し、検証する。
+    チームごとのメンバー名 -> ID の辞書は最初に使うときに1回だけ作る。
+    """
+
+    def __init__(self, snapshot: DataSnapshot):
+        self.team_by_name = snapshot.index.team_by_name
+        self.pokemon_by_name = snapshot.index.pokemon_by_name
+        self._members: Dict[str, Dict[str, str]] = {}
+        self._dates: Dict[str, str] = {}
+
+    def _member_ids(self, team) -> Dict[str, str]:
+        members = self._members.get(team.id)
+        if members is None:
+            members = self._members[team.id] = {member.name: member.id for member in team.members}
+        return members
+
+    def _date(self, value) -> str:
+        """YYYY-MM-DD（YYYY/MM/DD も可）に揃える。同じ日付の文字列は共有する"""
+        date = self._dates.get(value)
+        if date is None:
+            try:
+                date = datetime.date.fromisoformat(str(value).strip().replace("/", "-")).isoformat()
+            except ValueError:
+                raise ValueError(f"日付が不正です: {value}")
+            self._dates[value] = date = sys.intern(date)
+        return date
+
+    def _selections(self, team, players, label: str) -> List[Tuple[str, str]]:
+        if not isinstance(players, list) or len(players) != PLAYERS_PER_TEAM:
+            raise ValueError(f"{label}の出場メンバーは{PLAYERS_PER_TEAM}人必要です")
+        member_ids = self._member_ids(team)
+        selections = []
+        seen = set()
+        for member_name, pokemon_name in players:
+            member_id = member_ids.get(member_name)
+            if member_id is None:
+                raise ValueError(f"{member_name} は {team.name} のメンバーではありません")
+            if member_id in seen:
+                raise ValueError(f"{member_name} が{label}に2回出場しています")
+            seen.add(member_id)
+            pokemon = self.pokemon_by_name.get(pokemon_name)
+            if pokemon is None:
+                raise ValueError(f"ポケモン {pokemon_name} は登録されていません")
+            selections.append((member_id, pokemon.id))
+        return selections
+
+    def validate(self, record: dict) -> dict:
+        """add_match のキーワード引数にする（不正なら ValueError）"""
+        if "error" in record:
+            raise ValueError(record["error"])
+        team_a = self.team_by_name.get(record.get("team_a"))
+        team_b = self.team_by_name.get(record.get("team_b"))
+        if team_a is None or team_b is None:
+            missing = record.get("team_a") if team_a is None else record.get("team_b")
+            raise ValueError(f"チーム {missing} は登録されていません")
+        if team_a.id == team_b.id:
+            raise ValueError("チームAとチームBが同じです")
+        winner = record.get("winner")
+        if winner not in (team_a.name, team_b.name):
+            raise ValueError(f"勝者 {winner} はこの試合のチームではありません")
+        return {
+            "team_a_id": team_a.id,
+            "team_a_player_selections": self._selections(team_a, record.get("team_a_players"), "チームA"),
+            "team_b_id": team_b.id,
+            "team_b_player_selections": self._selections(team_b, record.get("team_b_players"), "チームB"),
+            "winner_team_id": team_a.id if winner == team_a.name else team_b.id,
+            "date": self._date(record.get("date")),
+        }
+
+
+def import_matches(rows: Iterable[Row], chunk_size: int = CHUNK_SIZE, dry_run: bool = False,
+                   progress: Optional[Callable[[ImportResult], None]] = None) -> ImportResult:
+    """
+    rows を chunk_size 行ずつ検証し、正しい行だけをチャンクごとに1回の書き込みで登録する。
+    不正な行は登録せず、行番号とエラーを結果に残す。dry_run なら検証だけ行う。
+    """
+    result = ImportResult()
+    rows = iter(rows)
+    # ジャーナルの圧縮は最後に1回だけ
+    with DataManager.deferred_maintenance():
+        _import_chunks(rows, chunk_size, dry_run, progress, result)
+    return result
+
+
+def _import_chunks(rows: Iterator[Row], chunk_size: int, dry_run: bool,
+                   progress: Optional[Callable[[ImportResult], None]], result: ImportResult) -> None:
+    validator = None
+    validator_version = None
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        DataManager.load_data()
+        snapshot = DataManager.get_snapshot()
+        # チームやポケモンが追加されていたら辞書を作り直す（試合の追加だけなら使い回す）
+        if validator is None or (len(snapshot.teams), len(snapshot.pokemons)) != validator_version:
+            validator = MatchValidator(snapshot)
+            validator_version = (len(snapshot.teams), len(snapshot.pokemons))
+
+        matches = []
+        for line, record in chunk:
+            try:
+                matches.append(validator.validate(record))
+            except ValueError as e:
+                result.add_error(line, str(e))
+            except TypeError:
+                # JSON Lines で名前の代わりに数値やリストが書かれている
+                result.add_error(line, "項目の形式が不正です")
+        result.rows_read += len(chunk)
+        if matches and not dry_run:
+            result.imported += DataManager.bulk_add_matches(matches)
+        elif dry_run:
+            result.imported += len(matches)
+        if progress:
+            progress(result)
+
+
+def import_file(path: str, chunk_size: int = CHUNK_SIZE, dry_run: bool = False,
+                file_format: Optional[str] = None,
+                progress: Optional[Callable[[ImportResult], None]] = None) -> ImportResult:
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        return import_matches(read_rows(f, file_format or format_from_name(path)), chunk_size, dry_run, progress)
+
+
+def import_upload(uploaded_file, chunk_size: int = CHUNK_SIZE, dry_run: bool = False,
+                  progress: Optional[Callable[[ImportResult], None]] = None) -> ImportResult:
+    """st.file_uploader のファイル（バイナリのファイルオブジェクト）を読み込む"""
+    lines = io.TextIOWrapper(uploaded_file, encoding="utf-8-sig", newline="")
+    try:
+        return import_matches(read_rows(lines, format_from_name(uploaded_file.name)), chunk_size, dry_run, progress)
+    finally:
+        # アップロードされたファイル自体は閉じない
+        lines.detach()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CSV / JSON Lines の試合結果を一括登録する")
+    parser.add_argument("files", nargs="+", help="CSV または JSON Lines のファイル")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="形式（省略時は拡張子で判断）")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="1回の書き込みで登録する行数")
+    parser.add_argument("--dry-run", action="store_true", help="検証だけ行い、登録しない")
+    args = parser.parse_args()
+
+    import streamlit.logger
+    streamlit.logger.set_log_level("error")
+
+    failed = False
+    for path in args.files:
+        def report(result: ImportResult):
+            print(f"\r{path}: {result.rows_read} 行 / 登録 {result.imported} / エラー {result.error_count}",
+                  end="", file=sys.stderr)
+
+        try:
+            result = import_file(path, args.chunk_size, args.dry_run, args.format, report)
+        except ValueError as e:
+            print(f"{path}: {e}", file=sys.stderr)
+            failed = True
+            continue
+        print(file=sys.stderr)
+        for line, message in result.errors:
+            print(f"{path}:{line}: {message}", file=sys.stderr)
+        if result.error_count > len(result.errors):
+            print(f"... ほか {result.error_count - len(result.errors)} 件のエラー", file=sys.stderr)
+        failed = failed or result.error_count > 0
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 import streamlit as st
-from models import DataManager
+from models import DataManager, STORAGE_ERRORS
 from datetime import datetime
+import match_import
 
 # Page config
 st.set_page_config(
@@ -16,11 +17,11 @@ st.title("試合登録")
 st.markdown("チーム間の試合を登録します。")
 
 # Check if there are enough teams and Pokémon registered
-if len(st.session_state.teams) < 2:
+if len(DataManager.get_teams()) < 2:
     st.warning("試合を記録するには少なくとも2つのチームが必要です。まずチーム登録ページからチームを登録してください。")
     st.stop()
 
-if not st.session_state.pokemons:
+if not DataManager.get_pokemons():
     st.warning("試合を記録する前にポケモンを登録する必要があります。ポケモン登録ページからポケモンを登録してください。")
     st.stop()
 
@@ -30,9 +31,9 @@ def create_team_selection_form(team_key, other_team_id=None):
     st.subheader(f"チーム{team_label}")
     
     # Filter out the other team if it's already selected
-    available_teams = st.session_state.teams
+    available_teams = DataManager.get_teams()
     if other_team_id:
-        available_teams = [team for team in st.session_state.teams if team.id != other_team_id]
+        available_teams = [team for team in DataManager.get_teams() if team.id != other_team_id]
     
     team_options = {team.name: team.id for team in available_teams}
     
@@ -52,7 +53,7 @@ def create_team_selection_form(team_key, other_team_id=None):
     # Pokemon selections for each team member
     st.write("各メンバーが使用するポケモンを選択してください：")
     
-    pokemon_options = {pokemon.name: pokemon.id for pokemon in st.session_state.pokemons}
+    pokemon_options = {pokemon.name: pokemon.id for pokemon in DataManager.get_pokemons()}
     player_selections = []
     
     cols = st.columns(5)
@@ -119,60 +120,101 @@ with st.form("match_registration_form"):
         else:
             # Add match to session state
             date_str = match_date.strftime("%Y-%m-%d")
-            success = DataManager.add_match(
-                team_a_id=team_a_id,
-                team_a_player_selections=team_a_selections,
-                team_b_id=team_b_id,
-                team_b_player_selections=team_b_selections,
-                winner_team_id=winner_id,
-                date=date_str
-            )
-            
-            if success:
+            try:
+                DataManager.add_match(
+                    team_a_id=team_a_id,
+                    team_a_player_selections=team_a_selections,
+                    team_b_id=team_b_id,
+                    team_b_player_selections=team_b_selections,
+                    winner_team_id=winner_id,
+                    date=date_str
+                )
+            except STORAGE_ERRORS as e:
+                st.error(f"試合を保存できませんでした: {e}")
+            else:
                 st.success("試合が正常に登録されました！")
                 st.rerun()
+
+# Bulk import from CSV / JSON Lines
+with st.expander("ファイルから一括登録（CSV / JSON Lines）"):
+    st.markdown(
+        "1行1試合で、チーム・メンバー・ポケモンは名前で書きます。"
+        "CSVはヘッダー行が必要です（列: `" + ", ".join(match_import.CSV_COLUMNS[:6]) + ", ..., b5_pokemon`）。"
+    )
+    uploaded_file = st.file_uploader("ファイル", type=["csv", "jsonl", "ndjson"], key="import_file")
+    dry_run = st.checkbox("検証のみ（登録しない）", key="import_dry_run")
+    
+    if uploaded_file is not None and st.button("インポート", key="import_button"):
+        progress_bar = st.progress(0.0)
+        total_bytes = max(uploaded_file.size, 1)
+        
+        def report_progress(result):
+            progress_bar.progress(min(uploaded_file.tell() / total_bytes, 1.0),
+                                  text=f"{result.rows_read} 行を処理（登録 {result.imported} 件）")
+        
+        try:
+            result = match_import.import_upload(uploaded_file, dry_run=dry_run, progress=report_progress)
+        except ValueError as e:
+            st.error(str(e))
+        except STORAGE_ERRORS as e:
+            st.error(f"試合を保存できませんでした: {e}")
+        else:
+            progress_bar.progress(1.0, text=f"{result.rows_read} 行を処理しました")
+            verb = "登録できます" if dry_run else "登録しました"
+            if result.error_count:
+                st.warning(f"{result.imported} 試合を{verb}。{result.error_count} 行はエラーのため登録していません。")
+                st.dataframe([{"行": line, "エラー": message} for line, message in result.errors], hide_index=True)
+                if result.error_count > len(result.errors):
+                    st.caption(f"先頭 {len(result.errors)} 件のエラーを表示しています。")
             else:
-                st.error("試合の登録に失敗しました。")
+                st.success(f"{result.imported} 試合を{verb}。")
 
 # Display registered matches
-if st.session_state.matches:
+if DataManager.get_matches():
     st.header("登録済み試合")
     
-    # Sort matches by date (recent first)
-    sorted_matches = sorted(st.session_state.matches, key=lambda x: x.date, reverse=True)
+    # Filters for match history
+    filter_col1, filter_col2, filter_col3 = st.columns([2, 2, 1])
     
-    for i, match in enumerate(sorted_matches):
-        # Get team names
-        team_a = DataManager.get_team_by_id(match.team_a_data.team_id)
-        team_b = DataManager.get_team_by_id(match.team_b_data.team_id)
-        winner = DataManager.get_team_by_id(match.winner_team_id)
-        
-        if team_a and team_b and winner:
-            with st.expander(f"試合 {i+1}: {team_a.name} vs {team_b.name} ({match.date})"):
-                st.write(f"**勝者: {winner.name}**")
-                
-                col1, col2 = st.columns(2)
-                
-                # Display Team A details
-                with col1:
-                    st.subheader(f"{team_a.name}")
-                    for selection in match.team_a_data.player_selections:
-                        member_data = DataManager.get_member_by_id(selection.member_id)
-                        pokemon = DataManager.get_pokemon_by_id(selection.pokemon_id)
-                        
-                        if member_data and pokemon:
-                            team, member = member_data
-                            st.write(f"• {member.name}: {pokemon.name}")
-                
-                # Display Team B details
-                with col2:
-                    st.subheader(f"{team_b.name}")
-                    for selection in match.team_b_data.player_selections:
-                        member_data = DataManager.get_member_by_id(selection.member_id)
-                        pokemon = DataManager.get_pokemon_by_id(selection.pokemon_id)
-                        
-                        if member_data and pokemon:
-                            team, member = member_data
-                            st.write(f"• {member.name}: {pokemon.name}")
+    with filter_col1:
+        history_team_options = {"すべてのチーム": None}
+        history_team_options.update({team.name: team.id for team in DataManager.get_teams()})
+        history_team_name = st.selectbox("チームで絞り込み", options=list(history_team_options.keys()), key="history_team")
+        history_team_id = history_team_options[history_team_name]
+    
+    with filter_col2:
+        history_dates = st.date_input("期間で絞り込み", value=(), key="history_dates")
+        date_from = history_dates[0].strftime("%Y-%m-%d") if len(history_dates) > 0 else None
+        date_to = history_dates[-1].strftime("%Y-%m-%d") if len(history_dates) > 0 else None
+    
+    with filter_col3:
+        page_size = st.selectbox("表示件数", options=[10, 20, 50], index=1, key="history_page_size")
+    
+    # Only the visible page is fetched and rendered
+    total_matches, _ = DataManager.get_match_history(0, 0, date_from, date_to, history_team_id)
+    num_pages = max(1, (total_matches + page_size - 1) // page_size)
+    page = st.number_input(f"ページ（全{num_pages}ページ・{total_matches}試合）", min_value=1, max_value=num_pages, value=1, key="history_page") - 1
+    _, match_rows = DataManager.get_match_history(page, page_size, date_from, date_to, history_team_id)
+    
+    if not match_rows:
+        st.info("条件に一致する試合はありません。")
+    
+    for i, row in enumerate(match_rows):
+        with st.expander(f"試合 {page * page_size + i + 1}: {row['team_a_name']} vs {row['team_b_name']} ({row['date']})"):
+            st.write(f"**勝者: {row['winner_name']}**")
+            
+            col1, col2 = st.columns(2)
+            
+            # Display Team A details
+            with col1:
+                st.subheader(f"{row['team_a_name']}")
+                for member_name, pokemon_name in row['team_a_players']:
+                    st.write(f"• {member_name}: {pokemon_name}")
+            
+            # Display Team B details
+            with col2:
+                st.subheader(f"{row['team_b_name']}")
+                for member_name, pokemon_name in row['team_b_players']:
+                    st.write(f"• {member_name}: {pokemon_name}")
 else:
     st.info("まだ試合が登録されていません。上記のフォームから試合を登録してください。")
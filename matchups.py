@@ -0,0 +1,118 @@
+import threading
+import weakref
+from typing import Optional
+
+import numpy as np
+
+from appearances import AppearanceTable, AppearanceView
+
+# 1回の行列積で扱う試合数（サイド数 × ポケモン数 の one-hot 行列の大きさを抑える）
+CHUNK_MATCHES = 50_000
+
+
+class PairMatrices:
+    """
+    ポケモンの組ごとの試合数・勝利数の P×P 行列。
+
+    ally[i, j]     : i と j が同じサイドで出場した試合（i != j）
+    opponent[i, j] : i のサイドが j のサイドと対戦した試合
+    *_won は i のサイドが勝った試合数。
+
+    サイドごとの one-hot 行列 X（サイド × ポケモン）と勝敗 w から
+        ally = Xᵀ X,  ally_won = Xᵀ (w * X)
+        opponent = Xᵀ Y,  opponent_won = Xᵀ (w * Y)   （Y は対戦相手のサイドの行）
+    を行列積で求める。出場テーブルは追記専用なので、前回以降に増えた行だけを
+    足し込めば更新できる。
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.size = 0
+        self.ally = np.zeros((0, 0), dtype=np.int64)
+        self.ally_won = np.zeros((0, 0), dtype=np.int64)
+        self.opponent = np.zeros((0, 0), dtype=np.int64)
+        self.opponent_won = np.zeros((0, 0), dtype=np.int64)
+
+    def _grow(self, size: int) -> None:
+        """ポケモンのコードが増えたら行列を広げる"""
+        if size <= self.size:
+            return
+        for name in ("ally", "ally_won", "opponent", "opponent_won"):
+            grown = np.zeros((size, size), dtype=np.int64)
+            grown[:self.size, :self.size] = getattr(self, name)
+            setattr(self, name, grown)
+        self.size = size
+
+    def update(self, view: AppearanceView) -> None:
+        """view までの出場行のうち、まだ数えていない分を足し込む"""
+        table = view.table
+        self._grow(len(table.pokemons))
+        if view.rows <= self.rows:
+            return
+
+        match = np.frombuffer(table.match[self.rows:view.rows], dtype=np.intc)
+        side = np.frombuffer(table.side[self.rows:view.rows], dtype=np.int8)
+        pokemon = np.frombuffer(table.pokemon[self.rows:view.rows], dtype=np.intc)
+        won = np.frombuffer(table.won[self.rows:view.rows], dtype=np.int8)
+
+        # 行は試合順に並んでいるので、試合数で区切って処理する
+        first = int(match[0])
+        bounds = np.searchsorted(match, np.arange(first, int(match[-1]) + 1, CHUNK_MATCHES))
+        bounds = np.append(bounds, len(match))
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            if lo < hi:
+                self._add_rows(match[lo:hi], side[lo:hi], pokemon[lo:hi], won[lo:hi])
+        self.rows = view.rows
+
+    def _add_rows(self, match: np.ndarray, side: np.ndarray, pokemon: np.ndarray, won: np.ndarray) -> None:
+        base = int(match[0])
+        sides = (int(match[-1]) - base + 1) * 2
+        side_index = (match - base) * 2 + side
+
+        # 同じサイドに同じポケモンが2体いても1回として数える
+        picks = np.zeros((sides, self.size), dtype=np.float64)
+        picks[side_index, pokemon] = 1
+        side_won = np.zeros(sides, dtype=np.float64)
+        side_won[side_index] = won
+        # 各サイドの行と、対戦相手のサイドの行（試合内の2行を入れ替える）
+        opponents = picks.reshape(-1, 2, self.size)[:, ::-1, :].reshape(sides, self.size)
+        won_picks = picks * side_won[:, None]
+
+        ally = picks.T @ picks
+        ally_won = won_picks.T @ picks
+        # 自分自身との組は数えない
+        np.fill_diagonal(ally, 0)
+        np.fill_diagonal(ally_won, 0)
+        self.ally += np.rint(ally).astype(np.int64)
+        self.ally_won += np.rint(ally_won).astype(np.int64)
+        self.opponent += np.rint(picks.T @ opponents).astype(np.int64)
+        self.opponent_won += np.rint(won_picks.T @ opponents).astype(np.int64)
+
+    def copy(self) -> "PairMatrices":
+        other = PairMatrices()
+        other.rows, other.size = self.rows, self.size
+        for name in ("ally", "ally_won", "opponent", "opponent_won"):
+            setattr(other, name, getattr(self, name).copy())
+        return other
+
+
+# 出場テーブルごとに増分更新する行列（テーブルが作り直されたら一緒に捨てる）
+_matrices: "weakref.WeakKeyDictionary[AppearanceTable, PairMatrices]" = weakref.WeakKeyDictionary()
+_matrices_lock = threading.Lock()
+
+
+def pair_matrices(view: AppearanceView) -> PairMatrices:
+    """
+    view 時点の行列。最新のスナップショットなら前回の結果に増えた行だけを足し、
+    それより古いスナップショットなら作り直す。返す行列は呼び出し側で変更しない。
+    """
+    with _matrices_lock:
+        matrices: Optional[PairMatrices] = _matrices.get(view.table)
+        if matrices is None:
+            matrices = _matrices[view.table] = PairMatrices()
+        if matrices.rows > view.rows:
+            fresh = PairMatrices()
+            fresh.update(view)
+            return fresh
+        matrices.update(view)
+        return matrices.copy()
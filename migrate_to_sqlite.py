@@ -0,0 +1,83 @@
+"""
+data/*.json（とジャーナル）の内容を SQLite に移行する。
+
+    python migrate_to_sqlite.py [--data-dir data] [--output data/unite.sqlite3] [--force]
+
+seasons.json でシーズンを分けている場合は、すべてのシーズンをそれぞれのディレクトリの
+unite.sqlite3 に移行する（--output はシーズンが1つのときだけ使える）。
+移行後は環境変数 UNITE_STORAGE_BACKEND=sqlite で起動すると SQLite を使う。
+"""
+import argparse
+import sys
+from typing import List, Tuple
+
+import seasons
+from data_store import DataSnapshot, DataStore
+from storage import JsonStorage, SqliteStorage, create_backend
+
+
+def _check_empty(output: str) -> None:
+    existing = DataStore(SqliteStorage(output)).snapshot()
+    if existing.teams or existing.pokemons or existing.matches:
+        raise ValueError(f"{output} にはすでにデータがあります（上書きするには --force）")
+
+
+def migrate(data_dir: str, output: str, force: bool = False) -> DataStore:
+    """JSONの保存データを読み、SQLite に書き直す"""
+    source = DataStore(JsonStorage(data_dir)).snapshot()
+    if not force:
+        _check_empty(output)
+
+    target = DataStore(SqliteStorage(output))
+    target.save(source.teams, source.pokemons, source.matches)
+    return target
+
+
+def migrate_seasons(data_dir: str, force: bool = False) -> List[Tuple[seasons.Season, DataSnapshot]]:
+    """
+    すべてのシーズンを、それぞれのディレクトリの SQLite（sqlite のバックエンドが読む場所）に
+    移行し、古い順の (シーズン, 移行後のスナップショット) を返す。どれかにデータがあれば
+    何も書かない。
+    """
+    targets = [(season, seasons.season_dir(data_dir, season)) for season in seasons.list_seasons(data_dir)]
+    outputs = [create_backend(directory, "sqlite").path for _, directory in targets]
+    if not force:
+        for output in outputs:
+            _check_empty(output)
+    results = [(season, migrate(directory, output, force=True).snapshot())
+               for (season, directory), output in zip(targets, outputs)]
+    # 過去のシーズンの集計（summary.json）を SQLite の内容で作り直しておく
+    seasons.season_summaries(data_dir, "sqlite")
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="JSONの保存データを SQLite に移行します")
+    parser.add_argument("--data-dir", default="data", help="teams.json（または seasons.json）があるディレクトリ")
+    parser.add_argument("--output", help="SQLite ファイル（省略時は各シーズンのディレクトリの unite.sqlite3）")
+    parser.add_argument("--force", action="store_true", help="既存の SQLite のデータを上書きする")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.output:
+            if len(seasons.list_seasons(args.data_dir)) > 1:
+                raise ValueError("シーズンが複数あるので --output は使えません"
+                                 "（省略すると各シーズンのディレクトリに移行します）")
+            directory = seasons.season_dir(args.data_dir, seasons.active_season(args.data_dir))
+            results = [(seasons.active_season(args.data_dir),
+                        migrate(directory, args.output, args.force).snapshot())]
+        else:
+            results = migrate_seasons(args.data_dir, args.force)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    for season, snapshot in results:
+        output = args.output or create_backend(seasons.season_dir(args.data_dir, season), "sqlite").path
+        print(f"{season.name}（{season.key}）を {output} に移行しました: チーム {len(snapshot.teams)}、"
+              f"ポケモン {len(snapshot.pokemons)}、試合 {len(snapshot.matches)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,245 +1,313 @@
-from dataclasses import dataclass, field
-from typing import List, Dict, Optional, Tuple
-import pandas as pd
+from collections import deque
+from typing import TYPE_CHECKING, List, Optional, Sequence, Tuple
 import streamlit as st
+import datetime
 import uuid
-import json
 import os
 
-@dataclass
-class Member:
-    id: str
-    name: str
-    
-@dataclass
-class Team:
-    id: str
-    name: str
-    members: List[Member]
-    
-@dataclass
-class Pokemon:
-    id: str
-    name: str
+from entities import Member, Team, Pokemon, PlayerSelection, TeamMatchData, Match
+from data_store import DataSnapshot, get_store
+from storage import STORAGE_ERRORS
+from instrumentation import count
+import debug_panel
+import instrumentation
+import seasons
 
-@dataclass
-class PlayerSelection:
-    member_id: str
-    pokemon_id: str
-    
-@dataclass
-class TeamMatchData:
-    team_id: str
-    player_selections: List[PlayerSelection]
-    
-@dataclass
-class Match:
-    id: str
-    team_a_data: TeamMatchData
-    team_b_data: TeamMatchData
-    winner_team_id: str
-    date: str
+# pandas（と analytics）は統計を計算するときに初めて読み込む。
+# ホームや登録ページは pandas を使わないので、ワーカーの起動が速くなる。
+if TYPE_CHECKING:
+    import pandas as pd
 
+# 公開メソッドの呼び出し回数と累積時間を再実行ごとに記録する
+@instrumentation.instrument_methods
 class DataManager:
     # データファイルのパス
     DATA_DIR = "data"
     TEAMS_FILE = os.path.join(DATA_DIR, "teams.json")
     POKEMONS_FILE = os.path.join(DATA_DIR, "pokemons.json")
     MATCHES_FILE = os.path.join(DATA_DIR, "matches.json")
+    JOURNAL_FILE = os.path.join(DATA_DIR, "journal.jsonl")
+    # 保存形式（"json" または "sqlite"）
+    STORAGE_BACKEND = os.environ.get("UNITE_STORAGE_BACKEND", "json")
+    # 追記をファイルに書くのを待つかは data_store.DURABILITY（UNITE_DURABILITY）で決める
+    # サイドバーに計測パネルを出すか（URL に ?debug=metrics を付けても出る）
+    DEBUG_METRICS = os.environ.get("UNITE_DEBUG_METRICS") == "1"
+    # 設定すると、このプロセスで JSON API（api.py）をこのポートで動かす
+    API_PORT = os.environ.get("UNITE_API_PORT")
+    # セッションに残す再実行ごとの計測の件数
+    METRICS_HISTORY = 50
+    # 一括インポートの初期値にするポケモン一覧
+    DEFAULT_POKEMON_NAMES = (
+        "ピカチュウ",
+        "リザードン",
+        "カメックス",
+        "フシギバナ",
+        "カビゴン",
+        "ルカリオ",
+        "ゼラオラ",
+        "ゲッコウガ",
+        "エースバーン",
+        "ウッウ",
+        "ガブリアス",
+        "アブソル",
+        "ゲンガー",
+        "ファイアロー",
+        "ワタシラガ",
+        "ヤドラン",
+        "プクリン",
+        "アローラキュウコン",
+        "ツボツボ",
+        "カイリキー",
+        "サーナイト",
+        "ハピナス",
+        "ニンフィア",
+        "マンムー",
+        "カイリュー",
+        "アマージョ",
+        "フーパ",
+        "オーロット",
+        "ギルガルド",
+        "ジュラルドン",
+        "マフォクシー",
+        "エーフィ",
+        "グレイシア",
+        "ベベノム",
+        "バンギラス",
+        "ドードリオ",
+        "ハッサム",
+        "ミュウ",
+        "ピクシー",
+        "コンパン",
+        "ザシアン",
+        "リーフィア",
+        "ゾロアーク",
+        "ドラパルト",
+        "ブラッキー",
+        "ミュウツーX",
+        "ミュウツーY",
+        "ニャオハ",
+        "ラウドボーン",
+        "ウーラオス",
+        "インテレオン",
+    )
     
     @staticmethod
-    def _ensure_data_dir():
-        """データディレクトリが存在することを確認"""
-        if not os.path.exists(DataManager.DATA_DIR):
-            os.makedirs(DataManager.DATA_DIR)
+    def _store():
+        """プロセス共有のデータストア（選択中のシーズンのもの）"""
+        return get_store(DataManager._data_dir(), DataManager.STORAGE_BACKEND)
+    
+    @staticmethod
+    def _data_dir() -> str:
+        """この再実行で読むシーズンのデータディレクトリ（load_data で決める）"""
+        data_dir = st.session_state.get('data_dir')
+        if data_dir is None:
+            data_dir = st.session_state.data_dir = DataManager._season_dir()
+        return data_dir
+    
+    @staticmethod
+    def _season_dir() -> str:
+        # 過去のシーズンを選んでいなければ開催中のシーズン（新しいシーズンが始まればそちらに移る）
+        season = seasons.resolve(DataManager.DATA_DIR, st.session_state.get('season'))
+        return seasons.season_dir(DataManager.DATA_DIR, season)
+    
+    @staticmethod
+    def _set_snapshot(snapshot: DataSnapshot):
+        """
+        セッションにはスナップショットのバージョンだけを持たせる。
+        データ本体はプロセス共有のストアが持ち、全セッションで共有する。
+        """
+        st.session_state.data_version = snapshot.version
+    
+    @staticmethod
+    def _snapshot() -> DataSnapshot:
+        """この再実行で共有するスナップショット（ファイルは読み直さない）"""
+        store = DataManager._store()
+        version = st.session_state.get('data_version')
+        snapshot = store.get_snapshot(version) if version is not None else None
+        count("snapshot_cache_requests")
+        if snapshot is None:
+            # 初回、または古いバージョンがストアから破棄された
+            count("snapshot_cache_misses")
+            snapshot = store.snapshot()
+            DataManager._set_snapshot(snapshot)
+        return snapshot
+    
+    @staticmethod
+    def get_snapshot() -> DataSnapshot:
+        """The snapshot this rerun reads: teams, pokemon, matches and indexes (read-only, shared across sessions)"""
+        return DataManager._snapshot()
+    
+    @staticmethod
+    def get_teams() -> Sequence[Team]:
+        """All registered teams (read-only, shared across sessions)"""
+        return DataManager._snapshot().teams
+    
+    @staticmethod
+    def get_pokemons() -> Sequence[Pokemon]:
+        """All registered pokemon (read-only, shared across sessions)"""
+        return DataManager._snapshot().pokemons
+    
+    @staticmethod
+    def get_matches() -> Sequence[Match]:
+        """All registered matches (read-only, shared across sessions)"""
+        return DataManager._snapshot().matches
     
     @staticmethod
     def save_data():
-        """セッションからデータを永続化"""
-        DataManager._ensure_data_dir()
-        
-        # チームの保存
-        with open(DataManager.TEAMS_FILE, 'w', encoding='utf-8') as f:
-            teams_data = []
-            for team in st.session_state.teams:
-                team_data = {
-                    "id": team.id,
-                    "name": team.name,
-                    "members": [{"id": m.id, "name": m.name} for m in team.members]
-                }
-                teams_data.append(team_data)
-            json.dump(teams_data, f, ensure_ascii=False, indent=2)
-        
-        # ポケモンの保存
-        with open(DataManager.POKEMONS_FILE, 'w', encoding='utf-8') as f:
-            pokemons_data = [{"id": p.id, "name": p.name} for p in st.session_state.pokemons]
-            json.dump(pokemons_data, f, ensure_ascii=False, indent=2)
-        
-        # 試合の保存
-        with open(DataManager.MATCHES_FILE, 'w', encoding='utf-8') as f:
-            matches_data = []
-            for match in st.session_state.matches:
-                match_data = {
-                    "id": match.id,
-                    "team_a_data": {
-                        "team_id": match.team_a_data.team_id,
-                        "player_selections": [
-                            {"member_id": ps.member_id, "pokemon_id": ps.pokemon_id}
-                            for ps in match.team_a_data.player_selections
-                        ]
-                    },
-                    "team_b_data": {
-                        "team_id": match.team_b_data.team_id,
-                        "player_selections": [
-                            {"member_id": ps.member_id, "pokemon_id": ps.pokemon_id}
-                            for ps in match.team_b_data.player_selections
-                        ]
-                    },
-                    "winner_team_id": match.winner_team_id,
-                    "date": match.date
-                }
-                matches_data.append(match_data)
-            json.dump(matches_data, f, ensure_ascii=False, indent=2)
+        """現在のスナップショットでデータ一式を書き直す（通常の追加は add_* が追記で行う）"""
+        snapshot = DataManager._snapshot()
+        DataManager._set_snapshot(DataManager._store().save(snapshot.teams, snapshot.pokemons, snapshot.matches))
     
     @staticmethod
     def load_data():
-        """保存されたデータをセッションに読み込む"""
-        DataManager._ensure_data_dir()
+        """保存されたデータをセッションに読み込む（変更がなければパースしない）"""
+        # シーズンとそのスナップショットのバージョンは一緒に切り替える
+        st.session_state.data_dir = DataManager._season_dir()
+        DataManager._set_snapshot(DataManager._store().snapshot())
+    
+    @staticmethod
+    def initialize_session_state():
+        """再実行の先頭で呼び、この再実行で使うスナップショットを確定する"""
+        DataManager._start_rerun_metrics()
         
-        # チームの読み込み
-        if os.path.exists(DataManager.TEAMS_FILE):
-            try:
-                with open(DataManager.TEAMS_FILE, 'r', encoding='utf-8') as f:
-                    teams_data = json.load(f)
-                    teams = []
-                    for team_data in teams_data:
-                        members = [Member(id=m["id"], name=m["name"]) for m in team_data["members"]]
-                        teams.append(Team(id=team_data["id"], name=team_data["name"], members=members))
-                    st.session_state.teams = teams
-            except (json.JSONDecodeError, FileNotFoundError):
-                if 'teams' not in st.session_state:
-                    st.session_state.teams = []
+        season_list = DataManager.get_seasons()
+        if len(season_list) > 1:
+            DataManager._render_season_selector(season_list)
+        
+        # 以前に保存されたデータがあれば読み込む（選択中のシーズンのみ）
+        DataManager.load_data()
         
-        # ポケモンの読み込み
-        if os.path.exists(DataManager.POKEMONS_FILE):
-            try:
-                with open(DataManager.POKEMONS_FILE, 'r', encoding='utf-8') as f:
-                    pokemons_data = json.load(f)
-                    st.session_state.pokemons = [Pokemon(id=p["id"], name=p["name"]) for p in pokemons_data]
-            except (json.JSONDecodeError, FileNotFoundError):
-                if 'pokemons' not in st.session_state:
-                    st.session_state.pokemons = []
+        if DataManager.API_PORT:
+            # UI と同じストア・キャッシュを使う API を1つだけ起動する
+            import api
+            api.start_in_background(port=int(DataManager.API_PORT))
         
-        # 試合の読み込み
-        if os.path.exists(DataManager.MATCHES_FILE):
-            try:
-                with open(DataManager.MATCHES_FILE, 'r', encoding='utf-8') as f:
-                    matches_data = json.load(f)
-                    matches = []
-                    for match_data in matches_data:
-                        # Team A data
-                        team_a_selections = [
-                            PlayerSelection(member_id=ps["member_id"], pokemon_id=ps["pokemon_id"]) 
-                            for ps in match_data["team_a_data"]["player_selections"]
-                        ]
-                        team_a_data = TeamMatchData(
-                            team_id=match_data["team_a_data"]["team_id"], 
-                            player_selections=team_a_selections
-                        )
-                        
-                        # Team B data
-                        team_b_selections = [
-                            PlayerSelection(member_id=ps["member_id"], pokemon_id=ps["pokemon_id"]) 
-                            for ps in match_data["team_b_data"]["player_selections"]
-                        ]
-                        team_b_data = TeamMatchData(
-                            team_id=match_data["team_b_data"]["team_id"], 
-                            player_selections=team_b_selections
-                        )
-                        
-                        # Create match
-                        match = Match(
-                            id=match_data["id"],
-                            team_a_data=team_a_data,
-                            team_b_data=team_b_data,
-                            winner_team_id=match_data["winner_team_id"],
-                            date=match_data["date"]
-                        )
-                        matches.append(match)
-                    
-                    st.session_state.matches = matches
-            except (json.JSONDecodeError, FileNotFoundError):
-                if 'matches' not in st.session_state:
-                    st.session_state.matches = []
+        if DataManager.debug_metrics_enabled():
+            debug_panel.render_metrics(
+                st.session_state.get('metrics_history', ()),
+                instrumentation.totals()
+            )
     
     @staticmethod
-    def initialize_session_state():
-        """Initialize session state variables if they don't exist"""
-        if 'teams' not in st.session_state:
-            st.session_state.teams = []
-        if 'pokemons' not in st.session_state:
-            st.session_state.pokemons = []
-        if 'matches' not in st.session_state:
-            st.session_state.matches = []
-            
-        # 以前に保存されたデータがあれば読み込む
+    def _render_season_selector(season_list: List["seasons.Season"]):
+        """サイドバーで表示するシーズンを選ぶ（ページを移っても選択を保つ）"""
+        active = DataManager.get_active_season()
+        keys = [season.key for season in season_list]
+        selected = st.session_state.get('season')
+        names = {
+            season.key: season.name + ("（開催中）" if season.key == active.key else "")
+            for season in season_list
+        }
+        choice = st.sidebar.selectbox(
+            "シーズン", keys,
+            index=keys.index(selected) if selected in keys else keys.index(active.key),
+            format_func=names.get
+        )
+        # 開催中のシーズンは None で持ち、新しいシーズンが始まったらそちらを表示する
+        st.session_state.season = None if choice == active.key else choice
+        if st.session_state.season is not None:
+            st.sidebar.caption("過去のシーズンを表示しています。登録や編集もこのシーズンに対して行います。")
+    
+    @staticmethod
+    def get_seasons() -> List["seasons.Season"]:
+        """Seasons, oldest first"""
+        return seasons.list_seasons(DataManager.DATA_DIR)
+    
+    @staticmethod
+    def get_active_season() -> "seasons.Season":
+        """The season new matches are registered to by default"""
+        return seasons.active_season(DataManager.DATA_DIR)
+    
+    @staticmethod
+    def get_current_season() -> "seasons.Season":
+        """The season shown in this session"""
+        return seasons.resolve(DataManager.DATA_DIR, st.session_state.get('season'))
+    
+    @staticmethod
+    def get_season_match_counts() -> List[Tuple["seasons.Season", Optional[int]]]:
+        """
+        (season, match count) for every season, oldest first. The count is None
+        for a past season whose saved totals are missing or stale (its matches
+        are not loaded just to count them; `python seasons.py list` rebuilds them)
+        """
+        return seasons.season_match_counts(DataManager.DATA_DIR, DataManager.STORAGE_BACKEND)
+    
+    @staticmethod
+    def start_season(key: str, name: Optional[str] = None, carry_over: bool = True) -> "seasons.Season":
+        """
+        Start a new season and make it the active one. Teams and pokemon are
+        carried over with the same IDs unless carry_over is False. Raises
+        ValueError for an invalid or duplicate key
+        """
+        season = seasons.start_season(DataManager.DATA_DIR, DataManager.STORAGE_BACKEND, key, name, carry_over)
+        st.session_state.season = None
         DataManager.load_data()
+        return season
+    
+    @staticmethod
+    def _start_rerun_metrics():
+        """前回の再実行の計測を履歴に移し、この再実行の計測を始める"""
+        previous = st.session_state.get('rerun_metrics')
+        if previous is not None:
+            if 'metrics_history' not in st.session_state:
+                st.session_state.metrics_history = deque(maxlen=DataManager.METRICS_HISTORY)
+            st.session_state.metrics_history.append(previous)
+            instrumentation.add_to_totals(previous)
+            instrumentation.log_rerun(previous)
+        st.session_state.rerun_metrics = instrumentation.start_rerun()
+    
+    @staticmethod
+    def debug_metrics_enabled() -> bool:
+        """計測パネルを表示するか"""
+        return DataManager.DEBUG_METRICS or st.query_params.get("debug") == "metrics"
             
+    @staticmethod
+    def _append_unique(kind: str, items: list) -> list:
+        """
+        名前が登録済みでないものだけを追記し、追記したものを返す。重複はストアが
+        書き込みロックの中で最新データに対して調べるので、他のセッションやワーカーと
+        同時に登録しても同じ名前は1件しか残らない。
+        """
+        if not items:
+            return items
+        DataManager.load_data()
+        snapshot, added = DataManager._store().append_unique(kind, items)
+        DataManager._set_snapshot(snapshot)
+        return added
+    
     @staticmethod
     def add_team(team_name: str, member_names: List[str]) -> bool:
         """Add a new team with members"""
-        DataManager.initialize_session_state()
-        
-        # Check if team name already exists
-        if any(team.name == team_name for team in st.session_state.teams):
-            return False
-        
         # Create members
         members = [Member(id=str(uuid.uuid4()), name=name) for name in member_names]
         
-        # Create and add team
-        new_team = Team(
+        # Create and add team (skipped if the team name already exists)
+        team = Team(
             id=str(uuid.uuid4()),
             name=team_name,
             members=members
         )
-        
-        st.session_state.teams.append(new_team)
-        # データを保存
-        DataManager.save_data()
-        return True
+        return bool(DataManager._append_unique("team", [team]))
     
     @staticmethod
     def add_pokemon(pokemon_name: str) -> bool:
         """Add a new pokemon"""
-        DataManager.initialize_session_state()
-        
-        # Check if pokemon name already exists
-        if any(pokemon.name == pokemon_name for pokemon in st.session_state.pokemons):
-            return False
-        
-        # Create and add pokemon
-        new_pokemon = Pokemon(
-            id=str(uuid.uuid4()),
-            name=pokemon_name
-        )
-        
-        st.session_state.pokemons.append(new_pokemon)
-        # データを保存
-        DataManager.save_data()
-        return True
+        # Skipped if the pokemon name already exists
+        pokemon = Pokemon(id=str(uuid.uuid4()), name=pokemon_name)
+        return bool(DataManager._append_unique("pokemon", [pokemon]))
     
     @staticmethod
-    def add_match(
+    def _build_match(
             team_a_id: str, 
             team_a_player_selections: List[Tuple[str, str]],
             team_b_id: str, 
             team_b_player_selections: List[Tuple[str, str]],
             winner_team_id: str,
             date: str
-        ) -> bool:
-        """Add a new match"""
-        DataManager.initialize_session_state()
+        ) -> Match:
+        """Create a new match object from raw selections (ValueError if date is not a valid date)"""
+        # 日付は YYYY-MM-DD に揃えて保存する（日付の集計は文字列の順に並べる）
+        date = datetime.date.fromisoformat(date).isoformat()
         
         # Create player selections for team A
         team_a_selections = [
@@ -257,206 +325,345 @@ class DataManager:
         team_a_data = TeamMatchData(team_id=team_a_id, player_selections=team_a_selections)
         team_b_data = TeamMatchData(team_id=team_b_id, player_selections=team_b_selections)
         
-        # Create and add match
-        new_match = Match(
+        return Match(
             id=str(uuid.uuid4()),
             team_a_data=team_a_data,
             team_b_data=team_b_data,
             winner_team_id=winner_team_id,
             date=date
         )
+    
+    @staticmethod
+    def add_match(
+            team_a_id: str, 
+            team_a_player_selections: List[Tuple[str, str]],
+            team_b_id: str, 
+            team_b_player_selections: List[Tuple[str, str]],
+            winner_team_id: str,
+            date: str
+        ) -> None:
+        """
+        Add a new match. Raises ValueError for an invalid date and one of
+        STORAGE_ERRORS if the write fails while durability is "always"
+        """
+        DataManager.load_data()
+        
+        new_match = DataManager._build_match(
+            team_a_id=team_a_id,
+            team_a_player_selections=team_a_player_selections,
+            team_b_id=team_b_id,
+            team_b_player_selections=team_b_player_selections,
+            winner_team_id=winner_team_id,
+            date=date
+        )
         
-        st.session_state.matches.append(new_match)
-        # データを保存
-        DataManager.save_data()
-        return True
+        # ジャーナルに1件追記して保存
+        DataManager._set_snapshot(DataManager._store().append("match", new_match))
+    
+    @staticmethod
+    def bulk_add_pokemon(pokemon_names: List[str]) -> int:
+        """Add many pokemon with a single write. Returns the number added"""
+        # 既存の名前と入力内の重複はストアがまとめて除外する
+        new_pokemons = [Pokemon(id=str(uuid.uuid4()), name=name) for name in pokemon_names if name]
+        return len(DataManager._append_unique("pokemon", new_pokemons))
+    
+    @staticmethod
+    def bulk_add_matches(matches: List[dict]) -> int:
+        """
+        Add many matches with a single write. Each item takes the same
+        keyword arguments as add_match. Returns the number added
+        """
+        DataManager.load_data()
+        
+        new_matches = [DataManager._build_match(**match) for match in matches]
+        
+        if new_matches:
+            DataManager._set_snapshot(DataManager._store().append_many("match", new_matches))
+        return len(new_matches)
+    
+    @staticmethod
+    def deferred_maintenance():
+        """
+        Context manager for bulk writes: storage maintenance such as journal
+        compaction runs once when the block exits instead of after each write
+        """
+        return DataManager._store().deferred_maintenance()
+    
+    @staticmethod
+    def flush_writes(timeout: Optional[float] = None) -> bool:
+        """
+        Wait until all writes so far are on disk. Writes are visible right away
+        but are persisted by a background thread (unless UNITE_DURABILITY is
+        "always"). Returns False on timeout
+        """
+        return DataManager._store().flush(timeout)
     
     @staticmethod
     def get_team_by_id(team_id: str) -> Optional[Team]:
         """Get team by ID"""
-        DataManager.initialize_session_state()
-        
-        for team in st.session_state.teams:
-            if team.id == team_id:
-                return team
-        return None
+        return DataManager._snapshot().index.team_by_id.get(team_id)
     
     @staticmethod
     def get_member_by_id(member_id: str) -> Optional[Tuple[Team, Member]]:
         """Get member and their team by member ID"""
-        DataManager.initialize_session_state()
-        
-        for team in st.session_state.teams:
-            for member in team.members:
-                if member.id == member_id:
-                    return (team, member)
-        return None
+        return DataManager._snapshot().index.member_by_id.get(member_id)
     
     @staticmethod
     def get_pokemon_by_id(pokemon_id: str) -> Optional[Pokemon]:
         """Get pokemon by ID"""
-        DataManager.initialize_session_state()
-        
-        for pokemon in st.session_state.pokemons:
-            if pokemon.id == pokemon_id:
-                return pokemon
-        return None
+        return DataManager._snapshot().index.pokemon_by_id.get(pokemon_id)
     
     @staticmethod
-    def calculate_team_stats():
-        """Calculate team statistics"""
-        DataManager.initialize_session_state()
-        
-        team_stats = []
-        
-        for team in st.session_state.teams:
-            # Total matches played by team
-            matches_played = 0
-            matches_won = 0
-            
-            for match in st.session_state.matches:
-                if match.team_a_data.team_id == team.id or match.team_b_data.team_id == team.id:
-                    matches_played += 1
-                    if match.winner_team_id == team.id:
-                        matches_won += 1
-            
-            win_rate = matches_won / matches_played if matches_played > 0 else 0
-            
-            team_stats.append({
-                'team_id': team.id,
-                'team_name': team.name,
-                'matches_played': matches_played,
-                'matches_won': matches_won,
-                'win_rate': win_rate
-            })
-            
-        return pd.DataFrame(team_stats)
+    def _match_row(index, match: Match) -> Optional[dict]:
+        """表示用に名前を結合した試合の行（チームが見つからなければNone）"""
+        team_a = index.team_by_id.get(match.team_a_data.team_id)
+        team_b = index.team_by_id.get(match.team_b_data.team_id)
+        winner = index.team_by_id.get(match.winner_team_id)
+        if not (team_a and team_b and winner):
+            return None
+        
+        def players(team_data: TeamMatchData) -> List[Tuple[str, str]]:
+            rows = []
+            for selection in team_data.player_selections:
+                member_data = index.member_by_id.get(selection.member_id)
+                pokemon = index.pokemon_by_id.get(selection.pokemon_id)
+                if member_data and pokemon:
+                    rows.append((member_data[1].name, pokemon.name))
+            return rows
+        
+        return {
+            'match': match,
+            'date': match.date,
+            'team_a_id': team_a.id,
+            'team_a_name': team_a.name,
+            'team_b_id': team_b.id,
+            'team_b_name': team_b.name,
+            'winner_id': winner.id,
+            'winner_name': winner.name,
+            'team_a_players': players(match.team_a_data),
+            'team_b_players': players(match.team_b_data)
+        }
     
     @staticmethod
-    def calculate_pokemon_stats():
-        """Calculate pokemon statistics"""
-        DataManager.initialize_session_state()
-        
-        pokemon_stats = {}
-        
-        for pokemon in st.session_state.pokemons:
-            pokemon_stats[pokemon.id] = {
-                'pokemon_id': pokemon.id,
-                'pokemon_name': pokemon.name,
-                'matches_played': 0,
-                'matches_won': 0
-            }
-        
-        for match in st.session_state.matches:
-            # Process team A
-            for selection in match.team_a_data.player_selections:
-                pokemon_id = selection.pokemon_id
-                if pokemon_id in pokemon_stats:
-                    pokemon_stats[pokemon_id]['matches_played'] += 1
-                    if match.winner_team_id == match.team_a_data.team_id:
-                        pokemon_stats[pokemon_id]['matches_won'] += 1
-            
-            # Process team B
-            for selection in match.team_b_data.player_selections:
-                pokemon_id = selection.pokemon_id
-                if pokemon_id in pokemon_stats:
-                    pokemon_stats[pokemon_id]['matches_played'] += 1
-                    if match.winner_team_id == match.team_b_data.team_id:
-                        pokemon_stats[pokemon_id]['matches_won'] += 1
-        
-        # Calculate win rates
-        for pokemon_id in pokemon_stats:
-            stats = pokemon_stats[pokemon_id]
-            stats['win_rate'] = stats['matches_won'] / stats['matches_played'] if stats['matches_played'] > 0 else 0
-        
-        return pd.DataFrame(list(pokemon_stats.values()))
+    def get_match_history(
+            page: int = 0,
+            page_size: int = 20,
+            date_from: Optional[str] = None,
+            date_to: Optional[str] = None,
+            team_id: Optional[str] = None
+        ) -> Tuple[int, List[dict]]:
+        """
+        日付の新しい順に並べた試合の1ページ分を返す（総件数, 行）。
+        日付インデックスを使うので、コストは履歴の長さではなくページサイズで決まる。
+        """
+        snapshot = DataManager._snapshot()
+        index = snapshot.index
+        # インデックスは最新の状態なので、このスナップショットより後の試合を除く
+        size = len(snapshot.matches)
+        if team_id:
+            date_index = index.matches_by_team_date.get(team_id)
+            if date_index is None:
+                return 0, []
+        else:
+            date_index = index.matches_by_date
+        
+        total = date_index.count(date_from, date_to, size)
+        matches = date_index.latest(page * page_size, page_size, date_from, date_to, size)
+        rows = [DataManager._match_row(index, match) for match in matches]
+        return total, [row for row in rows if row]
     
     @staticmethod
-    def calculate_member_stats():
-        """Calculate member statistics"""
-        DataManager.initialize_session_state()
-        
-        member_stats = {}
-        
-        # Initialize stats for all members
-        for team in st.session_state.teams:
-            for member in team.members:
-                member_stats[member.id] = {
-                    'member_id': member.id,
-                    'member_name': member.name,
-                    'team_name': team.name,
-                    'matches_played': 0,
-                    'matches_won': 0
-                }
-        
-        for match in st.session_state.matches:
-            # Process team A members
-            for selection in match.team_a_data.player_selections:
-                member_id = selection.member_id
-                if member_id in member_stats:
-                    member_stats[member_id]['matches_played'] += 1
-                    if match.winner_team_id == match.team_a_data.team_id:
-                        member_stats[member_id]['matches_won'] += 1
-            
-            # Process team B members
-            for selection in match.team_b_data.player_selections:
-                member_id = selection.member_id
-                if member_id in member_stats:
-                    member_stats[member_id]['matches_played'] += 1
-                    if match.winner_team_id == match.team_b_data.team_id:
-                        member_stats[member_id]['matches_won'] += 1
-        
-        # Calculate win rates
-        for member_id in member_stats:
-            stats = member_stats[member_id]
-            stats['win_rate'] = stats['matches_won'] / stats['matches_played'] if stats['matches_played'] > 0 else 0
-        
-        return pd.DataFrame(list(member_stats.values()))
+    def get_recent_matches(limit: int = 5) -> List[dict]:
+        """新しい順に limit 件の試合の行（日付インデックスの末尾から O(limit)）"""
+        _, rows = DataManager.get_match_history(page=0, page_size=limit)
+        return rows
     
     @staticmethod
-    def calculate_team_pokemon_stats(team_id: str):
+    def get_summary() -> dict:
+        """ダッシュボード用の件数（スナップショットの長さなので O(1)）"""
+        snapshot = DataManager._snapshot()
+        return {
+            'team_count': len(snapshot.teams),
+            'pokemon_count': len(snapshot.pokemons),
+            'match_count': len(snapshot.matches)
+        }
+    
+    @staticmethod
+    def data_version() -> int:
+        """現在のスナップショットのデータバージョン（書き込みのたびに増える）"""
+        return DataManager._snapshot().version
+
+    @staticmethod
+    def data_key() -> Tuple[str, int]:
+        """
+        キャッシュのキーに使う (シーズンのデータディレクトリ, データバージョン)。
+        バージョンはシーズンごとに数えるので、バージョンだけではシーズンを区別できない。
+        """
+        return DataManager._data_dir(), DataManager.data_version()
+
+    @staticmethod
+    def calculate_team_stats(date_from: Optional[str] = None, date_to: Optional[str] = None):
+        """Calculate team statistics (optionally only for matches between date_from and date_to)"""
+        return DataManager._cached_stats("team", date_range=DataManager._date_range(date_from, date_to))
+    
+    @staticmethod
+    def calculate_pokemon_stats(date_from: Optional[str] = None, date_to: Optional[str] = None):
+        """Calculate pokemon statistics (optionally only for matches between date_from and date_to)"""
+        return DataManager._cached_stats("pokemon", date_range=DataManager._date_range(date_from, date_to))
+    
+    @staticmethod
+    def calculate_member_stats(date_from: Optional[str] = None, date_to: Optional[str] = None):
+        """Calculate member statistics (optionally only for matches between date_from and date_to)"""
+        return DataManager._cached_stats("member", date_range=DataManager._date_range(date_from, date_to))
+    
+    @staticmethod
+    def calculate_team_pokemon_stats(team_id: str, date_from: Optional[str] = None, date_to: Optional[str] = None):
         """Calculate pokemon statistics for a specific team"""
-        DataManager.initialize_session_state()
-        
-        team = DataManager.get_team_by_id(team_id)
-        if not team:
+        if team_id not in DataManager._snapshot().index.team_by_id:
+            import pandas as pd
             return pd.DataFrame()
-            
-        pokemon_stats = {}
         
-        for pokemon in st.session_state.pokemons:
-            pokemon_stats[pokemon.id] = {
-                'pokemon_id': pokemon.id,
-                'pokemon_name': pokemon.name,
-                'matches_played': 0,
-                'matches_won': 0
-            }
-        
-        for match in st.session_state.matches:
-            # Check if team is in the match
-            if match.team_a_data.team_id == team_id:
-                # Process team A
-                for selection in match.team_a_data.player_selections:
-                    pokemon_id = selection.pokemon_id
-                    if pokemon_id in pokemon_stats:
-                        pokemon_stats[pokemon_id]['matches_played'] += 1
-                        if match.winner_team_id == team_id:
-                            pokemon_stats[pokemon_id]['matches_won'] += 1
-            
-            elif match.team_b_data.team_id == team_id:
-                # Process team B
-                for selection in match.team_b_data.player_selections:
-                    pokemon_id = selection.pokemon_id
-                    if pokemon_id in pokemon_stats:
-                        pokemon_stats[pokemon_id]['matches_played'] += 1
-                        if match.winner_team_id == team_id:
-                            pokemon_stats[pokemon_id]['matches_won'] += 1
-        
-        # Calculate win rates and filter out unused pokemon
-        filtered_stats = []
-        for pokemon_id, stats in pokemon_stats.items():
-            if stats['matches_played'] > 0:
-                stats['win_rate'] = stats['matches_won'] / stats['matches_played']
-                filtered_stats.append(stats)
-        
-        return pd.DataFrame(filtered_stats)
+        return DataManager._cached_stats("team_pokemon", team_id, DataManager._date_range(date_from, date_to))
+    
+    @staticmethod
+    def calculate_win_rate_trend(kind: str, entity_id: str, window_days: int = 7):
+        """
+        Rolling win rate of a team, member or pokemon (kind) over the last
+        window_days days, one row per match day
+        """
+        return DataManager._cached_stats(f"trend_{kind}", entity_id, window_days=window_days)
+    
+    @staticmethod
+    def get_match_dates() -> List[str]:
+        """試合のある日付（YYYY-MM-DD、昇順）"""
+        return DataManager._cached_stats("dates")
+    
+    @staticmethod
+    def _date_range(date_from: Optional[str], date_to: Optional[str]) -> Optional[Tuple[Optional[str], Optional[str]]]:
+        # 期間の指定がなければ全期間（日付を使わない集計）にする
+        if date_from is None and date_to is None:
+            return None
+        return (date_from, date_to)
+    
+    @staticmethod
+    def calculate_pokemon_synergy_stats():
+        """Calculate win rates for pairs of pokemon picked on the same team"""
+        return DataManager._cached_stats("synergy")
+    
+    @staticmethod
+    def calculate_pokemon_counter_stats():
+        """Calculate win rates for pokemon against each opposing pokemon"""
+        return DataManager._cached_stats("counter")
+    
+    @staticmethod
+    def find_lineups(pokemon_ids: List[str], exact: bool = False, min_matches: int = 1, limit: int = 50) -> dict:
+        """
+        Win rates for team lineups containing all of pokemon_ids (or exactly
+        pokemon_ids when exact is True), plus the totals over all matching lineups.
+        """
+        import analytics
+        
+        snapshot = DataManager._snapshot()
+        counts = DataManager._cached_stats("lineup")
+        return analytics.lineup_search(snapshot, counts, pokemon_ids, exact, min_matches, limit)
+    
+    @staticmethod
+    def export_data(table: str, file_format: str, date_from: Optional[str] = None,
+                    date_to: Optional[str] = None) -> str:
+        """
+        Write the appearances table or team/member/pokemon stats (table) as
+        parquet, arrow or csv and return the file path. Files are reused for
+        the same data version; the date range only applies to stats tables.
+        """
+        import export
+        
+        snapshot = DataManager._snapshot()
+        return export.export_file(snapshot, DataManager._data_dir(), table, file_format,
+                                  DataManager._date_range(date_from, date_to))
+    
+    @staticmethod
+    def _cached_stats(kind: str, entity_id: Optional[str] = None,
+                      date_range: Optional[Tuple[Optional[str], Optional[str]]] = None,
+                      window_days: Optional[int] = None) -> "pd.DataFrame":
+        """現在のスナップショットの統計（データバージョンと条件ごとにキャッシュ）"""
+        return cached_stats(kind, DataManager._data_dir(), DataManager._snapshot(), entity_id, date_range, window_days)
+    
+    @staticmethod
+    def get_all_seasons_stamp() -> str:
+        """All-seasons totals change whenever this does (use it in cache and widget keys)"""
+        return DataManager._all_seasons()[0]
+    
+    @staticmethod
+    def calculate_all_seasons_stats(kind: str) -> "pd.DataFrame":
+        """
+        Team, member or pokemon (kind) stats summed over every season. Past
+        seasons are read from their saved totals, not their matches.
+        """
+        stamp, summaries = DataManager._all_seasons()
+        count("stats_cache_requests")
+        return _cached_season_stats(kind, DataManager.DATA_DIR, stamp, summaries)
+    
+    @staticmethod
+    def _all_seasons() -> Tuple[str, List["seasons.SeasonSummary"]]:
+        results = seasons.season_summaries(DataManager.DATA_DIR, DataManager.STORAGE_BACKEND)
+        stamp = "|".join(f"{season.key}={season_stamp}" for season, season_stamp, _ in results)
+        return stamp, [summary for _, _, summary in results]
+
+
+# 統計結果のキャッシュの最大件数（超えたら古いものから破棄）
+STATS_CACHE_MAX_ENTRIES = 64
+
+@st.cache_data(max_entries=STATS_CACHE_MAX_ENTRIES, show_spinner=False)
+def _cached_stats(kind: str, data_dir: str, version: int, _snapshot: DataSnapshot, entity_id: Optional[str] = None,
+                  date_range: Optional[Tuple[Optional[str], Optional[str]]] = None, window_days: Optional[int] = None):
+    """
+    統計をデータバージョンごとにキャッシュする。
+    同じプロセス内では (data_dir, version) がスナップショットを一意に決めるので、
+    スナップショット自体はキーに含めない。
+    """
+    count("stats_cache_misses")
+    import analytics
+    
+    if kind == "team":
+        return analytics.team_stats(_snapshot, date_range)
+    if kind == "pokemon":
+        return analytics.pokemon_stats(_snapshot, date_range)
+    if kind == "member":
+        return analytics.member_stats(_snapshot, date_range)
+    if kind == "lineup":
+        return analytics.lineup_stats(_snapshot)
+    if kind == "synergy":
+        return analytics.pokemon_synergy_stats(_snapshot)
+    if kind == "counter":
+        return analytics.pokemon_counter_stats(_snapshot)
+    if kind == "dates":
+        return analytics.match_dates(_snapshot)
+    if kind.startswith("trend_"):
+        return analytics.win_rate_trend(_snapshot, kind[len("trend_"):], entity_id, window_days)
+    return analytics.team_pokemon_stats(_snapshot, entity_id, date_range)
+
+
+def cached_stats(kind: str, data_dir: str, snapshot: DataSnapshot, entity_id: Optional[str] = None,
+                 date_range: Optional[Tuple[Optional[str], Optional[str]]] = None,
+                 window_days: Optional[int] = None) -> "pd.DataFrame":
+    """
+    data_dir のシーズンのスナップショットの統計。UI・API・エクスポートで同じキャッシュを使う。
+    kind は team / pokemon / member / team_pokemon（entity_id はチーム）/ lineup / synergy /
+    counter / dates / trend_<team|member|pokemon>（entity_id と window_days を渡す）。
+    """
+    count("stats_cache_requests")
+    return _cached_stats(kind, data_dir, snapshot.version, snapshot, entity_id, date_range, window_days)
+
+
+def clear_stats_cache():
+    """統計のキャッシュを空にする（ベンチマークで毎回計算させる用）"""
+    _cached_stats.clear()
+
+
+@st.cache_data(max_entries=STATS_CACHE_MAX_ENTRIES, show_spinner=False)
+def _cached_season_stats(kind: str, data_dir: str, stamp: str, _summaries: List["seasons.SeasonSummary"]):
+    """全シーズン通算の統計。stamp はどれかのシーズンのデータが変わると変わる"""
+    count("stats_cache_misses")
+    import analytics
+    
+    return analytics.season_stats(seasons.merge_summaries(_summaries), kind)
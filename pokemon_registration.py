@@ -1,5 +1,5 @@
 import streamlit as st
-from models import DataManager
+from models import DataManager, STORAGE_ERRORS
 
 # Page config
 st.set_page_config(
@@ -32,24 +32,27 @@ with col1:
                 st.error("ポケモン名を入力してください。")
             else:
                 # Add pokemon to session state
-                success = DataManager.add_pokemon(pokemon_name)
-                
-                if success:
-                    st.success(f"ポケモン「{pokemon_name}」が正常に登録されました！")
-                    st.rerun()
+                try:
+                    success = DataManager.add_pokemon(pokemon_name)
+                except STORAGE_ERRORS as e:
+                    st.error(f"ポケモンを保存できませんでした: {e}")
                 else:
-                    st.error(f"ポケモン「{pokemon_name}」は既に存在します。")
+                    if success:
+                        st.success(f"ポケモン「{pokemon_name}」が正常に登録されました！")
+                        st.rerun()
+                    else:
+                        st.error(f"ポケモン「{pokemon_name}」は既に存在します。")
 
 # Display registered Pokémon
 with col2:
     st.subheader("登録済みポケモン")
     
-    if st.session_state.pokemons:
+    if DataManager.get_pokemons():
         # Display in a grid layout
         num_cols = 3
         cols = st.columns(num_cols)
         
-        for i, pokemon in enumerate(sorted(st.session_state.pokemons, key=lambda x: x.name)):
+        for i, pokemon in enumerate(sorted(DataManager.get_pokemons(), key=lambda x: x.name)):
             with cols[i % num_cols]:
                 st.write(f"• {pokemon.name}")
     else:
@@ -59,58 +62,7 @@ with col2:
 st.header("一括インポート")
 st.markdown("複数のポケモンを一度に登録することができます。")
 
-default_pokemon = """ピカチュウ
-リザードン
-カメックス
-フシギバナ
-カビゴン
-ルカリオ
-ゼラオラ
-ゲッコウガ
-エースバーン
-ウッウ
-ガブリアス
-アブソル
-ゲンガー
-ファイアロー
-ワタシラガ
-ヤドラン
-プクリン
-アローラキュウコン
-ツボツボ
-カイリキー
-サーナイト
-ハピナス
-ニンフィア
-マンムー
-カイリュー
-アマージョ
-フーパ
-オーロット
-ギルガルド
-ジュラルドン
-マフォクシー
-エーフィ
-グレイシア
-ベベノム
-バンギラス
-ドードリオ
-ハッサム
-ミュウ
-ピクシー
-コンパン
-ザシアン
-リーフィア
-ゾロアーク
-ドラパルト
-ブラッキー
-ミュウツーX
-ミュウツーY
-ニャオハ
-ラウドボーン
-ウーラオス
-インテレオン
-"""
+default_pokemon = "\n".join(DataManager.DEFAULT_POKEMON_NAMES) + "\n"
 
 with st.expander("一括インポート"):
     batch_text = st.text_area("1行に1つずつポケモン名を入力", value=default_pokemon, height=300)
@@ -118,13 +70,13 @@ with st.expander("一括インポート"):
     if st.button("ポケモンをインポート"):
         pokemon_names = [name.strip() for name in batch_text.split('\n') if name.strip()]
         
-        added_count = 0
-        for name in pokemon_names:
-            if name and DataManager.add_pokemon(name):
-                added_count += 1
-        
-        if added_count > 0:
-            st.success(f"{added_count}体のポケモンが正常にインポートされました！")
-            st.rerun()
+        try:
+            added_count = DataManager.bulk_add_pokemon(pokemon_names)
+        except STORAGE_ERRORS as e:
+            st.error(f"ポケモンを保存できませんでした: {e}")
         else:
-            st.info("新しいポケモンは追加されませんでした。既に登録されている可能性があります。")
+            if added_count > 0:
+                st.success(f"{added_count}体のポケモンが正常にインポートされました！")
+                st.rerun()
+            else:
+                st.info("新しいポケモンは追加されませんでした。既に登録されている可能性があります。")
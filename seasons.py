@@ -0,0 +1,430 @@
+"""
+シーズン（大会期間）ごとのデータの分割。
+
+シーズンごとに1つのデータディレクトリ（teams.json などの JSON か SQLite）を持ち、
+DataManager は選択中のシーズンのディレクトリだけを読み込む。起動時の読み込みと
+メモリは開催中のシーズンの試合数で決まり、過去のシーズンは選ばれたときに初めて読む。
+
+チームとポケモンは新しいシーズンに同じIDのまま引き継ぐので、シーズンをまたいでも
+同じチーム・メンバーとして集計できる（引き継いだ後の名簿の変更はそのシーズンだけに入る）。
+
+シーズンの一覧は DATA_DIR/seasons.json に持つ:
+    {"active": "2025", "seasons": [{"key": "default", "name": "...", "path": "."}, ...]}
+path は DATA_DIR からの相対パス。seasons.json がなければ DATA_DIR 自体が唯一の
+シーズンになる（分割前のデータはそのまま最初のシーズンとして使える）。
+
+シーズンをまたいだ集計は、シーズンごとのカウンタ（StatsAggregator）と名前を
+足し合わせる。開催中以外のシーズンは summary.json に保存した集計を使い、試合は
+読まない。summary.json には保存内容の fingerprint を記録し、変わっていれば作り直す。
+
+使い方:
+    python seasons.py list
+    python seasons.py start KEY [--name 名前] [--empty]
+    python seasons.py split --before YYYY-MM-DD KEY [--name 名前]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows では advisory lock なし
+    fcntl = None
+
+from aggregates import StatsAggregator
+from data_store import ConflictError, DataSnapshot, DataStore, find_store, get_store
+from storage import StorageBackend, create_backend
+
+MANIFEST_FILE = "seasons.json"
+SUMMARY_FILE = "summary.json"
+LOCK_FILE = ".seasons.lock"
+# 新しいシーズンのディレクトリ（DATA_DIR からの相対パス）
+SEASONS_DIR = "seasons"
+# 分割して書き直すときに、他の書き込みと衝突したら読み直す回数
+MAX_SPLIT_RETRIES = 10
+
+
+class Season(NamedTuple):
+    key: str
+    name: str
+    # DATA_DIR からの相対パス
+    path: str
+
+
+# seasons.json がないときの唯一のシーズン（DATA_DIR 自体）
+DEFAULT_SEASON = Season("default", "シーズン1", ".")
+
+
+# --- シーズンの一覧（seasons.json） ---
+
+# seasons.json のパス -> ((inode, mtime_ns, size), シーズン一覧, 開催中のキー)
+_manifests: Dict[str, Tuple[Tuple[int, int, int], List[Season], str]] = {}
+
+
+def _read_manifest(data_dir: str) -> Tuple[List[Season], str]:
+    """シーズン一覧と開催中のシーズンのキー（ファイルが変わっていなければ読み直さない）"""
+    path = os.path.join(data_dir, MANIFEST_FILE)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return [DEFAULT_SEASON], DEFAULT_SEASON.key
+    stat_key = (st.st_ino, st.st_mtime_ns, st.st_size)
+    cached = _manifests.get(path)
+    if cached is not None and cached[0] == stat_key:
+        return cached[1], cached[2]
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    season_list = [Season(s["key"], s["name"], s["path"]) for s in data["seasons"]]
+    _manifests[path] = (stat_key, season_list, data["active"])
+    return season_list, data["active"]
+
+
+def _write_manifest(data_dir: str, season_list: List[Season], active: str) -> None:
+    os.makedirs(data_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=data_dir, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"active": active, "seasons": [season._asdict() for season in season_list]},
+                      f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(data_dir, MANIFEST_FILE))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+@contextmanager
+def _manifest_lock(data_dir: str):
+    """シーズンの追加を直列化する（各シーズンの書き込みロックとは別のファイル）"""
+    os.makedirs(data_dir, exist_ok=True)
+    with open(os.path.join(data_dir, LOCK_FILE), "a") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def list_seasons(data_dir: str) -> List[Season]:
+    """古い順のシーズン一覧"""
+    return list(_read_manifest(data_dir)[0])
+
+
+def active_season(data_dir: str) -> Season:
+    """開催中（新しい試合を登録する）シーズン"""
+    season_list, active = _read_manifest(data_dir)
+    for season in season_list:
+        if season.key == active:
+            return season
+    return season_list[-1]
+
+
+def find_season(data_dir: str, key: Optional[str]) -> Optional[Season]:
+    for season in _read_manifest(data_dir)[0]:
+        if season.key == key:
+            return season
+    return None
+
+
+def resolve(data_dir: str, key: Optional[str] = None) -> Season:
+    """key のシーズン（key がないか見つからなければ開催中のシーズン）"""
+    return find_season(data_dir, key) or active_season(data_dir)
+
+
+def season_dir(data_dir: str, season: Season) -> str:
+    return os.path.normpath(os.path.join(data_dir, season.path))
+
+
+def _validate_key(data_dir: str, key: str) -> None:
+    # キーはディレクトリ名と URL のクエリに使う
+    if not re.fullmatch(r"[\w-]+", key):
+        raise ValueError("シーズンのキーには英数字・_・- だけを使ってください")
+    if find_season(data_dir, key) is not None:
+        raise ValueError(f"シーズン {key} はすでにあります")
+
+
+def _new_season(data_dir: str, key: str, name: Optional[str]) -> Tuple[Season, str]:
+    _validate_key(data_dir, key)
+    season = Season(key, name or key, os.path.join(SEASONS_DIR, key))
+    directory = season_dir(data_dir, season)
+    if os.path.isdir(directory) and os.listdir(directory):
+        raise ValueError(f"{directory} はすでに使われています")
+    return season, directory
+
+
+# --- シーズンの集計 ---
+
+class SeasonSummary:
+    """シーズンのカウンタと、カウンタに出てくるIDの名前"""
+
+    def __init__(self, stats: StatsAggregator, teams: Dict[str, str],
+                 members: Dict[str, Tuple[str, str]], pokemons: Dict[str, str]):
+        self.stats = stats
+        # team_id -> チーム名
+        self.teams = teams
+        # member_id -> (メンバー名, team_id)
+        self.members = members
+        # pokemon_id -> ポケモン名
+        self.pokemons = pokemons
+
+    @staticmethod
+    def from_snapshot(store: DataStore, snapshot: DataSnapshot) -> "SeasonSummary":
+        """store から取った snapshot の時点の集計"""
+        return SeasonSummary(
+            store.stats_at(snapshot),
+            {team.id: team.name for team in snapshot.teams},
+            {member.id: (member.name, team.id) for team in snapshot.teams for member in team.members},
+            {pokemon.id: pokemon.name for pokemon in snapshot.pokemons},
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "counters": self.stats.to_dict(),
+            "teams": self.teams,
+            "members": self.members,
+            "pokemons": self.pokemons,
+        }
+
+    @staticmethod
+    def from_dict(data: dict) -> "SeasonSummary":
+        return SeasonSummary(
+            StatsAggregator.from_dict(data["counters"]),
+            data["teams"],
+            {member_id: tuple(value) for member_id, value in data["members"].items()},
+            data["pokemons"],
+        )
+
+
+def merge_summaries(summaries: List[SeasonSummary]) -> SeasonSummary:
+    """古い順のシーズンの集計を足し合わせる（名前は新しいシーズンのものを使う）"""
+    merged = SeasonSummary(StatsAggregator(), {}, {}, {})
+    for summary in summaries:
+        merged.stats.merge(summary.stats)
+        merged.teams.update(summary.teams)
+        merged.members.update(summary.members)
+        merged.pokemons.update(summary.pokemons)
+    return merged
+
+
+def _write_summary(directory: str, fingerprint: Optional[list], summary: SeasonSummary) -> None:
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": fingerprint, "summary": summary.to_dict()}, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(directory, SUMMARY_FILE))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _read_summary(directory: str, fingerprint: list) -> Optional[SeasonSummary]:
+    """fingerprint が一致する保存済みの集計（なければ None）"""
+    try:
+        with open(os.path.join(directory, SUMMARY_FILE), encoding="utf-8") as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if data.get("fingerprint") != fingerprint:
+        return None
+    try:
+        return SeasonSummary.from_dict(data["summary"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+# 集計のキャッシュ: データディレクトリ -> (スタンプ, 集計)
+_summaries: Dict[str, Tuple[str, SeasonSummary]] = {}
+# 開催中以外のシーズンの fingerprint を求めるためのバックエンド（読み込みはしない）
+_backends: Dict[Tuple[str, str], StorageBackend] = {}
+_summaries_lock = threading.Lock()
+
+
+def _archived_summary(directory: str, backend_name: str, load: bool = True) -> Optional[Tuple[str, SeasonSummary]]:
+    """
+    開催中でないシーズンの (スタンプ, 集計)。summary.json がないか古ければ、load なら
+    シーズンを読み込んで作り直し、そうでなければ None を返す。
+    """
+    backend = _backends.get((directory, backend_name))
+    if backend is None:
+        backend = _backends[(directory, backend_name)] = create_backend(directory, backend_name)
+    fingerprint = backend.fingerprint()
+    stamp = json.dumps(fingerprint)
+    cached = _summaries.get(directory)
+    if cached is not None and cached[0] == stamp:
+        return cached
+    summary = _read_summary(directory, fingerprint) if fingerprint is not None else None
+    if summary is None:
+        if not load:
+            return None
+        # 保存済みの集計がないか古いので、このときだけシーズンを読み込む（ストアには残さない）
+        store = DataStore(create_backend(directory, backend_name))
+        summary = SeasonSummary.from_snapshot(store, store.snapshot())
+        # 読んでいる間に書き込まれていたら、次回また作り直す
+        if fingerprint is not None:
+            _write_summary(directory, fingerprint, summary)
+    _summaries[directory] = (stamp, summary)
+    return stamp, summary
+
+
+def season_summaries(data_dir: str, backend_name: str) -> List[Tuple[Season, str, SeasonSummary]]:
+    """
+    古い順の (シーズン, スタンプ, 集計)。スタンプは集計の元になったデータが変わると変わる。
+    開催中のシーズンと、このプロセスで読み込み済みのシーズンはストアから（まだファイルに
+    書いていない追記も含む）、それ以外は summary.json から求める。
+    """
+    active = active_season(data_dir)
+    results = []
+    with _summaries_lock:
+        for season in list_seasons(data_dir):
+            directory = season_dir(data_dir, season)
+            if season.key == active.key:
+                store = get_store(directory, backend_name)
+            else:
+                store = find_store(directory, backend_name)
+            if store is not None:
+                snapshot = store.snapshot()
+                stamp = f"version:{snapshot.version}"
+                cached = _summaries.get(directory)
+                if cached is None or cached[0] != stamp:
+                    cached = _summaries[directory] = (stamp, SeasonSummary.from_snapshot(store, snapshot))
+                results.append((season, cached[0], cached[1]))
+            else:
+                results.append((season,) + _archived_summary(directory, backend_name))
+    return results
+
+
+def season_match_counts(data_dir: str, backend_name: str) -> List[Tuple[Season, Optional[int]]]:
+    """
+    古い順の (シーズン, 試合数)。season_summaries と違い、開催中でも読み込み済みでもない
+    シーズンは summary.json だけを見て、ないか古ければ試合数を None にする（試合は読まない）。
+    """
+    active = active_season(data_dir)
+    results = []
+    with _summaries_lock:
+        for season in list_seasons(data_dir):
+            directory = season_dir(data_dir, season)
+            if season.key == active.key:
+                store = get_store(directory, backend_name)
+            else:
+                store = find_store(directory, backend_name)
+            if store is not None:
+                results.append((season, len(store.snapshot().matches)))
+            else:
+                archived = _archived_summary(directory, backend_name, load=False)
+                results.append((season, archived[1].stats.match_count if archived is not None else None))
+    return results
+
+
+# --- シーズンの追加 ---
+
+def start_season(data_dir: str, backend_name: str, key: str, name: Optional[str] = None,
+                 carry_over: bool = True) -> Season:
+    """
+    新しいシーズンを作って開催中にする。開催中だったシーズンの集計は summary.json に
+    保存する。carry_over ならチームとポケモンを同じIDのまま引き継ぐ。
+    """
+    with _manifest_lock(data_dir):
+        season_list, active = _read_manifest(data_dir)
+        season, directory = _new_season(data_dir, key, name)
+
+        current_dir = season_dir(data_dir, resolve(data_dir, active))
+        current = get_store(current_dir, backend_name)
+        # fingerprint は読む前に求める（間に書き込まれたら次に集計するときに作り直す）
+        current.flush()
+        fingerprint = current.fingerprint()
+        snapshot = current.snapshot()
+        _write_summary(current_dir, fingerprint, SeasonSummary.from_snapshot(current, snapshot))
+
+        target = get_store(directory, backend_name)
+        if carry_over:
+            target.save(snapshot.teams, snapshot.pokemons, [])
+        else:
+            target.save([], [], [])
+        _write_manifest(data_dir, season_list + [season], season.key)
+        return season
+
+
+def split_season(data_dir: str, backend_name: str, before: str, key: str, name: Optional[str] = None) -> Season:
+    """
+    開催中のシーズンから before（YYYY-MM-DD）より前の試合を新しい過去のシーズンに移す
+    （1つの matches.json に溜まった履歴を分割する用）。チームとポケモンは両方に残す。
+    """
+    with _manifest_lock(data_dir):
+        season_list, active = _read_manifest(data_dir)
+        season, directory = _new_season(data_dir, key, name)
+        current_season = resolve(data_dir, active)
+        current = get_store(season_dir(data_dir, current_season), backend_name)
+        archive = DataStore(create_backend(directory, backend_name))
+
+        for attempt in range(MAX_SPLIT_RETRIES):
+            snapshot = current.snapshot()
+            older = [match for match in snapshot.matches if match.date < before]
+            if not older:
+                raise ValueError(f"{before} より前の試合はありません")
+            newer = [match for match in snapshot.matches if match.date >= before]
+            # 過去のシーズンを書いてから一覧に載せ、最後に開催中のシーズンから消す
+            # （途中で落ちても試合が両方に残るだけで、なくなりはしない）
+            archived = archive.save(snapshot.teams, snapshot.pokemons, older)
+            _write_summary(directory, archive.fingerprint(), SeasonSummary.from_snapshot(archive, archived))
+            if find_season(data_dir, season.key) is None:
+                position = season_list.index(current_season) if current_season in season_list else 0
+                _write_manifest(data_dir, season_list[:position] + [season] + season_list[position:],
+                                current_season.key)
+            try:
+                current.save(snapshot.teams, snapshot.pokemons, newer, expected_version=snapshot.version)
+                return season
+            except ConflictError:
+                if attempt == MAX_SPLIT_RETRIES - 1:
+                    raise
+        return season
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="シーズン（大会期間）ごとのデータを管理します")
+    parser.add_argument("--data-dir", default="data", help="seasons.json を置くディレクトリ")
+    parser.add_argument("--backend", choices=["json", "sqlite"],
+                        default=os.environ.get("UNITE_STORAGE_BACKEND", "json"))
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="シーズンの一覧")
+    start = commands.add_parser("start", help="新しいシーズンを始める")
+    start.add_argument("key")
+    start.add_argument("--name")
+    start.add_argument("--empty", action="store_true", help="チームとポケモンを引き継がない")
+    split = commands.add_parser("split", help="開催中のシーズンの古い試合を過去のシーズンに移す")
+    split.add_argument("key")
+    split.add_argument("--before", required=True, help="この日付（YYYY-MM-DD）より前の試合を移す")
+    split.add_argument("--name")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "start":
+            season = start_season(args.data_dir, args.backend, args.key, args.name, not args.empty)
+            print(f"シーズン {season.name}（{season.key}）を開始しました")
+        elif args.command == "split":
+            season = split_season(args.data_dir, args.backend, args.before, args.key, args.name)
+            print(f"{args.before} より前の試合をシーズン {season.name}（{season.key}）に移しました")
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    active = active_season(args.data_dir)
+    for season, _, summary in season_summaries(args.data_dir, args.backend):
+        marker = "*" if season.key == active.key else " "
+        print(f"{marker} {season.key}\t{season.name}\t{season_dir(args.data_dir, season)}\t"
+              f"試合 {summary.stats.match_count}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,269 @@
+"""
+JSONのベースファイルを読み込んだ結果のバイナリキャッシュ。
+
+JSONをパースしてエンティティを組み立て、出場テーブルを作り直すのはデータ量に
+比例して遅いので、同じ内容を列指向のバイナリで保存しておき、次回の読み込みでは
+そちらを使う。出場テーブル（AppearanceTable）は列をそのまま保存して復元する。
+キャッシュには作成元のベースファイルの (inode, mtime_ns, size) を記録し、
+一致しなければ使わない（JSONが正で、キャッシュはいつ捨ててもよい）。
+
+ファイルの構成:
+    MAGIC | struct HEADER (形式バージョン, ヘッダー長, 本体長) | ヘッダー(JSON) | 本体
+
+本体は文字列表と array の列を並べたもので、ヘッダーに各列の位置・長さ・型と
+本体の blake2b ダイジェストを持つ。文字列（ID・名前・日付）は文字列表に
+1回だけ入れ、列は文字列表の番号で参照する（辞書エンコード）。
+読み込みは mmap して列を array にコピーするだけで、JSONのパースはしない。
+"""
+from array import array
+from hashlib import blake2b
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+from entities import Member, Team, Pokemon, PlayerSelection, TeamMatchData, Match
+from appearances import AppearanceTable, IdCodes, LineupCodes
+from instrumentation import count
+
+MAGIC = b"UNITESNP"
+FORMAT_VERSION = 2
+HEADER = struct.Struct("<IIQ")
+
+# 本体に並べるエンティティの列（すべて int32）。値は文字列表の番号か位置
+ENTITY_COLUMNS = (
+    "string_ends",
+    "team_id", "team_name", "team_member_end",
+    "member_id", "member_name",
+    "pokemon_id", "pokemon_name",
+    "match_id", "match_team_a", "match_team_b", "match_winner", "match_date",
+    "match_side_a_end", "match_side_b_end",
+    "pair_member", "pair_pokemon", "selection_pair",
+    # 出場テーブルのIDコード（コード順のIDの文字列表の番号）
+    "code_team", "code_member", "code_pokemon",
+    # 出場テーブルの編成コード（LineupCodes.to_columns() の列）
+    "lineup_pokemon", "lineup_end",
+)
+# 列名 -> array の型
+COLUMNS = {
+    **{name: 'i' for name in ENTITY_COLUMNS},
+    **{f"appearance_{name}": typecode for name, typecode in AppearanceTable.COLUMNS.items()},
+}
+
+
+class CachedBase(NamedTuple):
+    """キャッシュから復元したベースファイルの内容"""
+    items: Dict[str, list]
+    appearances: AppearanceTable
+
+
+class _StringTable:
+    """文字列を番号に辞書エンコードする"""
+
+    def __init__(self):
+        self.code_by_string: Dict[str, int] = {}
+        self.strings: List[str] = []
+
+    def encode(self, value: str) -> int:
+        code = self.code_by_string.get(value)
+        if code is None:
+            code = self.code_by_string[value] = len(self.strings)
+            self.strings.append(value)
+        return code
+
+
+def _encode(items: Dict[str, list], appearances: AppearanceTable) -> Tuple[bytes, dict]:
+    """エンティティと出場テーブルを本体のバイト列と、各列の (位置, 長さ, 型) にする"""
+    strings = _StringTable()
+    encode = strings.encode
+    columns = {name: array(typecode) for name, typecode in COLUMNS.items()}
+
+    for team in items["team"]:
+        columns["team_id"].append(encode(team.id))
+        columns["team_name"].append(encode(team.name))
+        for member in team.members:
+            columns["member_id"].append(encode(member.id))
+            columns["member_name"].append(encode(member.name))
+        columns["team_member_end"].append(len(columns["member_id"]))
+
+    for pokemon in items["pokemon"]:
+        columns["pokemon_id"].append(encode(pokemon.id))
+        columns["pokemon_name"].append(encode(pokemon.name))
+
+    # (メンバー, ポケモン) の組も辞書エンコードし、各出場は組の番号で持つ
+    pair_codes: Dict[tuple, int] = {}
+    selection_pair = columns["selection_pair"]
+    for match in items["match"]:
+        columns["match_id"].append(encode(match.id))
+        columns["match_team_a"].append(encode(match.team_a_data.team_id))
+        columns["match_team_b"].append(encode(match.team_b_data.team_id))
+        columns["match_winner"].append(encode(match.winner_team_id))
+        columns["match_date"].append(encode(match.date))
+        for end_column, team_data in (("match_side_a_end", match.team_a_data),
+                                      ("match_side_b_end", match.team_b_data)):
+            for selection in team_data.player_selections:
+                key = (selection.member_id, selection.pokemon_id)
+                pair = pair_codes.get(key)
+                if pair is None:
+                    pair = pair_codes[key] = len(pair_codes)
+                    columns["pair_member"].append(encode(selection.member_id))
+                    columns["pair_pokemon"].append(encode(selection.pokemon_id))
+                selection_pair.append(pair)
+            columns[end_column].append(len(selection_pair))
+
+    for name, codes in (("team", appearances.teams), ("member", appearances.members),
+                        ("pokemon", appearances.pokemons)):
+        columns[f"code_{name}"].extend([encode(item_id) for item_id in codes.ids])
+    columns["lineup_pokemon"], columns["lineup_end"] = appearances.lineups.to_columns()
+    for name in AppearanceTable.COLUMNS:
+        columns[f"appearance_{name}"] = getattr(appearances, name)
+
+    # 文字列表は1つのUTF-8にまとめ、各文字列の終わりの位置（文字数）を持つ
+    end = 0
+    for value in strings.strings:
+        end += len(value)
+        columns["string_ends"].append(end)
+    blob = "".join(strings.strings).encode("utf-8")
+
+    layout = {}
+    parts = [blob]
+    offset = len(blob)
+    layout["strings"] = [0, len(blob)]
+    for name, typecode in COLUMNS.items():
+        data = columns[name].tobytes()
+        layout[name] = [offset, len(data), typecode]
+        parts.append(data)
+        offset += len(data)
+    return b"".join(parts), layout
+
+
+def write(path: str, items: Dict[str, list], appearances: AppearanceTable, source_key: list) -> None:
+    """items と、items から作った出場テーブルのキャッシュを path にアトミックに書く"""
+    payload, layout = _encode(items, appearances)
+    header = json.dumps({
+        "source": source_key,
+        "byteorder": sys.byteorder,
+        "itemsizes": {typecode: array(typecode).itemsize for typecode in set(COLUMNS.values())},
+        "layout": layout,
+        "digest": blake2b(payload, digest_size=16).hexdigest(),
+    }).encode("utf-8")
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(MAGIC)
+            f.write(HEADER.pack(FORMAT_VERSION, len(header), len(payload)))
+            f.write(header)
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+            count("files_written")
+            count("bytes_written", f.tell())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _decode(buffer: memoryview, layout: dict) -> CachedBase:
+    """本体からエンティティと出場テーブルを組み立てる"""
+    def column(name: str) -> array:
+        offset, length, typecode = layout[name]
+        if typecode != COLUMNS[name]:
+            raise ValueError(f"column {name} has typecode {typecode}")
+        values = array(typecode)
+        values.frombytes(buffer[offset:offset + length])
+        return values
+
+    offset, length = layout["strings"][:2]
+    text = str(buffer[offset:offset + length], "utf-8")
+    strings = []
+    start = 0
+    for end in column("string_ends"):
+        strings.append(text[start:end])
+        start = end
+
+    teams = []
+    member_ids, member_names = column("member_id"), column("member_name")
+    start = 0
+    for id_code, name_code, end in zip(column("team_id"), column("team_name"), column("team_member_end")):
+        members = [Member(id=strings[member_ids[i]], name=strings[member_names[i]]) for i in range(start, end)]
+        teams.append(Team(id=strings[id_code], name=strings[name_code], members=members))
+        start = end
+
+    pokemons = [
+        Pokemon(id=strings[id_code], name=strings[name_code])
+        for id_code, name_code in zip(column("pokemon_id"), column("pokemon_name"))
+    ]
+
+    # 同じ (メンバー, ポケモン) の組は1つのインスタンスを共有する
+    pairs = [
+        PlayerSelection(member_id=strings[member_code], pokemon_id=strings[pokemon_code])
+        for member_code, pokemon_code in zip(column("pair_member"), column("pair_pokemon"))
+    ]
+    selections = [pairs[pair] for pair in column("selection_pair")]
+
+    matches = []
+    start = 0
+    for id_code, team_a, team_b, winner, date, side_a_end, side_b_end in zip(
+            column("match_id"), column("match_team_a"), column("match_team_b"), column("match_winner"),
+            column("match_date"), column("match_side_a_end"), column("match_side_b_end")):
+        matches.append(Match(
+            id=strings[id_code],
+            team_a_data=TeamMatchData(team_id=strings[team_a], player_selections=selections[start:side_a_end]),
+            team_b_data=TeamMatchData(team_id=strings[team_b], player_selections=selections[side_a_end:side_b_end]),
+            winner_team_id=strings[winner],
+            date=strings[date]
+        ))
+        start = side_b_end
+
+    appearances = AppearanceTable.from_columns(
+        {name: column(f"appearance_{name}") for name in AppearanceTable.COLUMNS},
+        *(IdCodes.from_ids([strings[code] for code in column(f"code_{name}")])
+          for name in ("team", "member", "pokemon")),
+        LineupCodes.from_columns(column("lineup_pokemon"), column("lineup_end"))
+    )
+    return CachedBase({"team": teams, "pokemon": pokemons, "match": matches}, appearances)
+
+
+def read(path: str, source_key: list) -> Optional[CachedBase]:
+    """
+    source_key のベースファイルから作られたキャッシュがあれば読み込む。
+    ない・古い・壊れている場合はNone（呼び出し側はJSONを読む）。
+    """
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return None
+    with f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # 空のファイル
+            return None
+    with mapped, memoryview(mapped) as buffer:
+        try:
+            if buffer[:len(MAGIC)] != MAGIC:
+                return None
+            version, header_length, payload_length = HEADER.unpack_from(buffer, len(MAGIC))
+            if version != FORMAT_VERSION:
+                return None
+            header_start = len(MAGIC) + HEADER.size
+            header = json.loads(bytes(buffer[header_start:header_start + header_length]))
+            if (header["source"] != source_key or header["byteorder"] != sys.byteorder
+                    or any(array(typecode).itemsize != size for typecode, size in header["itemsizes"].items())):
+                return None
+            payload_start = header_start + header_length
+            # mmap を閉じる前にビューを解放する必要があるので with で使う
+            with buffer[payload_start:payload_start + payload_length] as payload:
+                if (len(payload) != payload_length
+                        or blake2b(payload, digest_size=16).hexdigest() != header["digest"]):
+                    return None
+                count("files_read")
+                count("bytes_read", len(buffer))
+                return _decode(payload, header["layout"])
+        except (struct.error, ValueError, KeyError, IndexError, TypeError):
+            return None
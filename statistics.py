@@ -1,7 +1,10 @@
+from datetime import date, timedelta
+
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 from models import DataManager
+from instrumentation import count
+import export
 
 # Page config
 st.set_page_config(
@@ -13,11 +16,83 @@ st.set_page_config(
 # Initialize session state
 DataManager.initialize_session_state()
 
+# グラフはシーズン・データバージョンとフィルター条件ごとにキャッシュする
+# （キーが同じなら _frame も同じなので、DataFrame自体はハッシュしない）
+@st.cache_data(max_entries=64, show_spinner=False)
+def _cached_bar_chart(data_key: tuple, chart_key: tuple, _frame: pd.DataFrame, layout: dict, **bar_args):
+    count("chart_cache_misses")
+    # plotly はグラフを作り直すときだけ読み込む（キャッシュが効いていれば不要）
+    import plotly.express as px
+    
+    fig = px.bar(_frame, **bar_args)
+    fig.update_layout(**layout)
+    return fig
+
+def cached_bar_chart(data_key: tuple, chart_key: tuple, _frame: pd.DataFrame, layout: dict, **bar_args):
+    count("chart_cache_requests")
+    return _cached_bar_chart(data_key, chart_key, _frame, layout, **bar_args)
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _cached_heatmap(data_key: tuple, chart_key: tuple, _matrix: pd.DataFrame, layout: dict, **imshow_args):
+    count("chart_cache_misses")
+    import plotly.express as px
+    
+    fig = px.imshow(_matrix, **imshow_args)
+    fig.update_layout(**layout)
+    return fig
+
+def cached_heatmap(data_key: tuple, chart_key: tuple, _matrix: pd.DataFrame, layout: dict, **imshow_args):
+    count("chart_cache_requests")
+    return _cached_heatmap(data_key, chart_key, _matrix, layout, **imshow_args)
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _cached_line_chart(data_key: tuple, chart_key: tuple, _frame: pd.DataFrame, layout: dict, **line_args):
+    count("chart_cache_misses")
+    import plotly.express as px
+    
+    fig = px.line(_frame, **line_args)
+    fig.update_layout(**layout)
+    return fig
+
+def cached_line_chart(data_key: tuple, chart_key: tuple, _frame: pd.DataFrame, layout: dict, **line_args):
+    count("chart_cache_requests")
+    return _cached_line_chart(data_key, chart_key, _frame, layout, **line_args)
+
+def render_win_rate_trend(kind: str, label: str, options: dict, window_days: int):
+    """選択したチーム・プレイヤー・ポケモンの、試合日ごとの直近 window_days 日間の勝率"""
+    st.subheader("勝率の推移")
+    selected_name = st.selectbox(f"{label}を選択", options=list(options.keys()), key=f"trend_{kind}")
+    if selected_name is None:
+        return
+    trend = DataManager.calculate_win_rate_trend(kind, options[selected_name], window_days)
+    if trend.empty:
+        st.info(f"{selected_name}の試合データはありません。")
+        return
+    fig = cached_line_chart(
+        data_key,
+        ('trend', kind, options[selected_name], window_days),
+        trend,
+        dict(
+            xaxis_title="試合日",
+            yaxis_title="勝率",
+            yaxis=dict(tickformat='.0%', range=[0, 1])
+        ),
+        x='date',
+        y='win_rate',
+        title=f'{selected_name} - 直近{window_days}日間の勝率',
+        labels={'date': '試合日', 'win_rate': '勝率', 'matches_played': '試合数'},
+        hover_data=['matches_played'],
+        markers=True
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+data_key = DataManager.data_key()
+
 st.title("統計・勝率")
 st.markdown("チーム、プレイヤー、ポケモンのパフォーマンス分析を表示します。")
 
 # Check if there's enough data to show statistics
-if not st.session_state.matches:
+if not DataManager.get_matches():
     st.warning("まだ試合が登録されていません。まず試合登録ページから試合を記録してください。")
     st.stop()
 
@@ -27,15 +102,72 @@ with st.sidebar:
     
     # Add min matches filter
     min_matches = st.slider("最小試合数", 1, 10, 1)
+    
+    # Period filter（直近N日は最新の試合日から数える）
+    match_dates = DataManager.get_match_dates()
+    # 日付は YYYY-MM-DD だけ（読めない日付の試合は含まない）。1日もなければ期間では絞り込めない
+    period_options = ["全期間", "直近7日", "直近30日", "大会日", "期間を指定"] if match_dates else ["全期間"]
+    if len(DataManager.get_seasons()) > 1:
+        period_options.append("全シーズン通算")
+    period = st.selectbox("期間", period_options)
+    all_seasons = period == "全シーズン通算"
+    date_from = date_to = None
+    if period in ("直近7日", "直近30日"):
+        days = 7 if period == "直近7日" else 30
+        latest_date = date.fromisoformat(match_dates[-1])
+        date_from = (latest_date - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+        date_to = match_dates[-1]
+    elif period == "大会日":
+        date_from = date_to = st.selectbox("試合日", list(reversed(match_dates)))
+    elif period == "期間を指定":
+        earliest_date, latest_date = date.fromisoformat(match_dates[0]), date.fromisoformat(match_dates[-1])
+        period_dates = st.date_input("期間", value=(earliest_date, latest_date))
+        if len(period_dates) > 0:
+            date_from = period_dates[0].strftime("%Y-%m-%d")
+            date_to = period_dates[-1].strftime("%Y-%m-%d")
+    if date_from is not None:
+        st.caption(f"{date_from} 〜 {date_to} の試合を集計しています。")
+    period_key = (date_from, date_to)
+    if all_seasons:
+        # 通算の集計はどのシーズンのデータが変わっても変わる
+        period_key = ("all_seasons", DataManager.get_all_seasons_stamp())
+        st.caption("チーム・プレイヤー・ポケモン統計は全シーズンの合計です。ほかのタブとエクスポートは選択中のシーズンのみです。")
+    
+    # 勝率の推移に使う期間
+    trend_window = st.select_slider("勝率の推移（移動期間の日数）", options=[1, 3, 7, 14, 30], value=7)
+    
+    # エクスポート（期間の指定は統計のテーブルにだけ使う）
+    st.markdown("---")
+    st.subheader("エクスポート")
+    export_table = st.selectbox("データ", list(export.TABLES), format_func=export.TABLES.get, key="export_table")
+    export_format = st.selectbox("形式", export.available_formats(), format_func=str.upper, key="export_format")
+    if export.pa is None:
+        st.caption("Parquet / Arrow で書き出すには pyarrow をインストールしてください。")
+    # ファイルはボタンを押したときだけ作る（同じデータバージョンなら作ったファイルを使い回す）
+    export_request = (export_table, export_format, period_key if export_table in export.STATS_KINDS else None, data_key)
+    if st.button("ファイルを作成", key="export_button"):
+        st.session_state.export_request = export_request
+    if st.session_state.get("export_request") == export_request:
+        with st.spinner("書き出しています..."):
+            export_path = DataManager.export_data(export_table, export_format, date_from, date_to)
+        extension, mime = export.FORMATS[export_format]
+        with open(export_path, "rb") as export_file:
+            st.download_button("ダウンロード", export_file, file_name=f"unite_{export_table}{extension}",
+                               mime=mime, key="export_download")
 
 # Create tabs for different types of statistics
-tab1, tab2, tab3, tab4 = st.tabs(["チーム統計", "チーム別ポケモン統計", "プレイヤー統計", "ポケモン統計"])
+tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(
+    ["チーム統計", "チーム別ポケモン統計", "プレイヤー統計", "ポケモン統計", "シナジー・相性", "編成"]
+)
 
 # Team Statistics Tab
 with tab1:
     st.header("チームパフォーマンス")
     
-    team_stats = DataManager.calculate_team_stats()
+    if all_seasons:
+        team_stats = DataManager.calculate_all_seasons_stats("team")
+    else:
+        team_stats = DataManager.calculate_team_stats(date_from, date_to)
     
     if team_stats.empty:
         st.info("チーム統計はありません。")
@@ -67,8 +199,15 @@ with tab1:
             )
             
             # Create win rate chart
-            fig = px.bar(
+            fig = cached_bar_chart(
+                data_key,
+                ('team', min_matches, period_key),
                 filtered_team_stats,
+                dict(
+                    xaxis_title="チーム名", 
+                    yaxis_title="勝率",
+                    yaxis=dict(tickformat='.0%')
+                ),
                 x='team_name',
                 y='win_rate',
                 title='チーム勝率',
@@ -77,19 +216,16 @@ with tab1:
                 color_continuous_scale='RdYlGn',
                 text_auto='.1%'
             )
-            fig.update_layout(
-                xaxis_title="チーム名", 
-                yaxis_title="勝率",
-                yaxis=dict(tickformat='.0%')
-            )
             st.plotly_chart(fig, use_container_width=True)
 
+    render_win_rate_trend("team", "チーム", {team.name: team.id for team in DataManager.get_teams()}, trend_window)
+
 # Team-Pokémon Statistics Tab
 with tab2:
     st.header("チーム別ポケモンパフォーマンス")
     
     # Team selection
-    team_options = {team.name: team.id for team in st.session_state.teams}
+    team_options = {team.name: team.id for team in DataManager.get_teams()}
     selected_team_name = st.selectbox(
         "チームを選択",
         options=list(team_options.keys())
@@ -97,7 +233,7 @@ with tab2:
     selected_team_id = team_options[selected_team_name]
     
     # Calculate team-specific Pokémon stats
-    team_pokemon_stats = DataManager.calculate_team_pokemon_stats(selected_team_id)
+    team_pokemon_stats = DataManager.calculate_team_pokemon_stats(selected_team_id, date_from, date_to)
     
     if team_pokemon_stats.empty:
         st.info(f"{selected_team_name}の試合データはありません。")
@@ -129,8 +265,15 @@ with tab2:
             )
             
             # Create win rate chart
-            fig = px.bar(
+            fig = cached_bar_chart(
+                data_key,
+                ('team_pokemon', selected_team_id, min_matches, period_key),
                 filtered_stats,
+                dict(
+                    xaxis_title="ポケモン名", 
+                    yaxis_title="勝率",
+                    yaxis=dict(tickformat='.0%')
+                ),
                 x='pokemon_name',
                 y='win_rate',
                 title=f'{selected_team_name} - ポケモン別勝率',
@@ -139,18 +282,16 @@ with tab2:
                 color_continuous_scale='RdYlGn',
                 text_auto='.1%'
             )
-            fig.update_layout(
-                xaxis_title="ポケモン名", 
-                yaxis_title="勝率",
-                yaxis=dict(tickformat='.0%')
-            )
             st.plotly_chart(fig, use_container_width=True)
 
 # Player Statistics Tab
 with tab3:
     st.header("プレイヤーパフォーマンス")
     
-    player_stats = DataManager.calculate_member_stats()
+    if all_seasons:
+        player_stats = DataManager.calculate_all_seasons_stats("member")
+    else:
+        player_stats = DataManager.calculate_member_stats(date_from, date_to)
     
     if player_stats.empty:
         st.info("プレイヤー統計はありません。")
@@ -184,8 +325,15 @@ with tab3:
             
             # Create win rate chart for top players
             top_players = filtered_player_stats.head(15)  # Show top 15 players
-            fig = px.bar(
+            fig = cached_bar_chart(
+                data_key,
+                ('member', min_matches, period_key),
                 top_players,
+                dict(
+                    xaxis_title="プレイヤー名", 
+                    yaxis_title="勝率",
+                    yaxis=dict(tickformat='.0%')
+                ),
                 x='member_name',
                 y='win_rate',
                 title='トッププレイヤー勝率',
@@ -193,18 +341,23 @@ with tab3:
                 color='team_name',
                 text_auto='.1%'
             )
-            fig.update_layout(
-                xaxis_title="プレイヤー名", 
-                yaxis_title="勝率",
-                yaxis=dict(tickformat='.0%')
-            )
             st.plotly_chart(fig, use_container_width=True)
 
+    render_win_rate_trend(
+        "member",
+        "プレイヤー",
+        {f"{member.name}（{team.name}）": member.id for team in DataManager.get_teams() for member in team.members},
+        trend_window
+    )
+
 # Pokémon Statistics Tab
 with tab4:
     st.header("ポケモンパフォーマンス")
     
-    pokemon_stats = DataManager.calculate_pokemon_stats()
+    if all_seasons:
+        pokemon_stats = DataManager.calculate_all_seasons_stats("pokemon")
+    else:
+        pokemon_stats = DataManager.calculate_pokemon_stats(date_from, date_to)
     
     if pokemon_stats.empty:
         st.info("ポケモン統計はありません。")
@@ -236,8 +389,16 @@ with tab4:
             )
             
             # Create win rate chart
-            fig = px.bar(
+            fig = cached_bar_chart(
+                data_key,
+                ('pokemon_win_rate', min_matches, period_key),
                 filtered_pokemon_stats,
+                dict(
+                    xaxis_title="ポケモン名", 
+                    yaxis_title="勝率",
+                    xaxis={'categoryorder':'total descending'},
+                    yaxis=dict(tickformat='.0%')
+                ),
                 x='pokemon_name',
                 y='win_rate',
                 title='ポケモン勝率',
@@ -246,19 +407,20 @@ with tab4:
                 color_continuous_scale='RdYlGn',
                 text_auto='.1%'
             )
-            fig.update_layout(
-                xaxis_title="ポケモン名", 
-                yaxis_title="勝率",
-                xaxis={'categoryorder':'total descending'},
-                yaxis=dict(tickformat='.0%')
-            )
             st.plotly_chart(fig, use_container_width=True)
             
             # Usage statistics
             st.subheader("ポケモン使用率")
             
-            fig2 = px.bar(
+            fig2 = cached_bar_chart(
+                data_key,
+                ('pokemon_usage', min_matches, period_key),
                 filtered_pokemon_stats,
+                dict(
+                    xaxis_title="ポケモン名", 
+                    yaxis_title="使用回数",
+                    xaxis={'categoryorder':'total descending'}
+                ),
                 x='pokemon_name',
                 y='matches_played',
                 title='ポケモン使用回数',
@@ -267,9 +429,130 @@ with tab4:
                 color_continuous_scale='Blues',
                 text_auto=True
             )
-            fig2.update_layout(
-                xaxis_title="ポケモン名", 
-                yaxis_title="使用回数",
-                xaxis={'categoryorder':'total descending'}
-            )
             st.plotly_chart(fig2, use_container_width=True)
+
+    render_win_rate_trend("pokemon", "ポケモン", {pokemon.name: pokemon.id for pokemon in DataManager.get_pokemons()}, trend_window)
+
+# Synergy / Counter Tab
+with tab5:
+    st.header("ポケモンのシナジー・相性")
+    
+    matrix_type = st.radio(
+        "表示する組み合わせ",
+        options=["味方（同じチーム）", "対面（相手チーム）"],
+        horizontal=True
+    )
+    is_synergy = matrix_type == "味方（同じチーム）"
+    
+    if is_synergy:
+        st.caption("行と列のポケモンが同じチームで出場した試合の勝率です。")
+        pair_stats = DataManager.calculate_pokemon_synergy_stats()
+    else:
+        st.caption("行のポケモンが列のポケモンと対戦した試合での、行のポケモン側の勝率です。")
+        pair_stats = DataManager.calculate_pokemon_counter_stats()
+    
+    # 使用回数の多いポケモンに絞る
+    usage = DataManager.calculate_pokemon_stats()
+    usage = usage[usage['matches_played'] > 0].sort_values('matches_played', ascending=False)
+    
+    if usage.empty:
+        st.info("ポケモンの使用データはありません。")
+    else:
+        top_n = st.slider("表示するポケモン数（使用回数の多い順）", 2, max(2, len(usage)), min(20, max(2, len(usage))))
+        top_names = usage['pokemon_name'].head(top_n).tolist()
+        
+        shown = pair_stats[
+            pair_stats['pokemon_name'].isin(top_names) & pair_stats['other_pokemon_name'].isin(top_names)
+        ]
+        # 試合数が足りない組は空欄にする
+        rates = shown['win_rate'].where(shown['matches_played'] >= min_matches)
+        matrix = (
+            shown.assign(win_rate=rates)
+            .pivot(index='pokemon_name', columns='other_pokemon_name', values='win_rate')
+            .reindex(index=top_names, columns=top_names)
+        )
+        
+        fig = cached_heatmap(
+            data_key,
+            ('synergy' if is_synergy else 'counter', top_n, min_matches),
+            matrix,
+            dict(height=max(400, 28 * top_n)),
+            zmin=0,
+            zmax=1,
+            color_continuous_scale='RdYlGn',
+            labels={'x': '相手' if not is_synergy else 'ポケモン', 'y': 'ポケモン', 'color': '勝率'},
+            text_auto='.0%',
+            aspect='auto',
+            title='味方ペアの勝率' if is_synergy else '対面の勝率'
+        )
+        st.plotly_chart(fig, use_container_width=True)
+        
+        # 組ごとの一覧
+        pairs = shown[shown['matches_played'] >= min_matches]
+        if is_synergy:
+            # 同じ組が2回（A-B と B-A）出てくるので片方だけ
+            pairs = pairs[pairs['pokemon_name'] < pairs['other_pokemon_name']]
+        if pairs.empty:
+            st.info(f"{min_matches}試合以上の組み合わせはありません。")
+        else:
+            pairs = pairs.sort_values('win_rate', ascending=False)
+            pairs['win_rate_pct'] = (pairs['win_rate'] * 100).round(1).astype(str) + '%'
+            st.dataframe(
+                pairs[['pokemon_name', 'other_pokemon_name', 'matches_played', 'matches_won', 'win_rate_pct']].rename(
+                    columns={
+                        'pokemon_name': 'ポケモン名',
+                        'other_pokemon_name': '味方' if is_synergy else '相手',
+                        'matches_played': '試合数',
+                        'matches_won': '勝利数',
+                        'win_rate_pct': '勝率'
+                    }
+                ),
+                use_container_width=True,
+                hide_index=True
+            )
+
+# Lineup Explorer Tab
+with tab6:
+    st.header("編成の勝率")
+    
+    pokemon_options = {pokemon.name: pokemon.id for pokemon in DataManager.get_pokemons()}
+    selected_pokemon_names = st.multiselect(
+        "ポケモンを選択（最大5体）",
+        options=list(pokemon_options.keys()),
+        max_selections=5
+    )
+    match_mode = st.radio(
+        "条件",
+        options=["選択したポケモンを含む編成", "選択したポケモンと完全に一致する編成"],
+        horizontal=True
+    )
+    
+    lineup_result = DataManager.find_lineups(
+        [pokemon_options[name] for name in selected_pokemon_names],
+        exact=match_mode == "選択したポケモンと完全に一致する編成",
+        min_matches=min_matches
+    )
+    
+    col1, col2, col3 = st.columns(3)
+    col1.metric("該当する編成", lineup_result['lineup_count'])
+    col2.metric("試合数", lineup_result['matches_played'])
+    col3.metric("勝率", f"{lineup_result['win_rate'] * 100:.1f}%" if lineup_result['matches_played'] else "-")
+    
+    lineups = lineup_result['lineups']
+    if lineups.empty:
+        st.info(f"条件に合う{min_matches}試合以上の編成はありません。")
+    else:
+        st.caption(f"試合数の多い順に最大{len(lineups)}件を表示しています。")
+        lineups['win_rate_pct'] = (lineups['win_rate'] * 100).round(1).astype(str) + '%'
+        st.dataframe(
+            lineups[['lineup', 'matches_played', 'matches_won', 'win_rate_pct']].rename(
+                columns={
+                    'lineup': '編成',
+                    'matches_played': '試合数',
+                    'matches_won': '勝利数',
+                    'win_rate_pct': '勝率'
+                }
+            ),
+            use_container_width=True,
+            hide_index=True
+        )
@@ -0,0 +1,746 @@
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from functools import partial
+from itertools import groupby
+from operator import itemgetter
+from typing import Callable, ContextManager, Dict, List, NamedTuple, Optional, Tuple
+import json
+import os
+import sqlite3
+import tempfile
+from sys import intern
+
+try:
+    import fcntl
+except ImportError:  # Windows では advisory lock なし（プロセス内のロックのみ）
+    fcntl = None
+
+from entities import Member, Team, Pokemon, PlayerSelection, TeamMatchData, Match
+from aggregates import StatsAggregator
+from appearances import AppearanceTable
+from instrumentation import count
+import snapshot_cache
+
+
+# --- JSON <-> エンティティ変換 ---
+
+def team_to_dict(team: Team) -> dict:
+    return {
+        "id": team.id,
+        "name": team.name,
+        "members": [{"id": m.id, "name": m.name} for m in team.members]
+    }
+
+def team_from_dict(team_data: dict) -> Team:
+    members = [Member(id=m["id"], name=m["name"]) for m in team_data["members"]]
+    return Team(id=team_data["id"], name=team_data["name"], members=members)
+
+def pokemon_to_dict(pokemon: Pokemon) -> dict:
+    return {"id": pokemon.id, "name": pokemon.name}
+
+def pokemon_from_dict(pokemon_data: dict) -> Pokemon:
+    return Pokemon(id=pokemon_data["id"], name=pokemon_data["name"])
+
+def _team_match_data_to_dict(data: TeamMatchData) -> dict:
+    return {
+        "team_id": data.team_id,
+        "player_selections": [
+            {"member_id": ps.member_id, "pokemon_id": ps.pokemon_id}
+            for ps in data.player_selections
+        ]
+    }
+
+# 試合データでは同じID文字列と同じ (メンバー, ポケモン) の組が何度も現れるので、
+# 読み込み時に1つのオブジェクトを共有させる（辞書エンコード）。表はバックエンドごとに持ち、
+# 全件を読み直すたびに作り直す（消した試合の組をいつまでも残さない）
+SelectionTable = Dict[Tuple[str, str], PlayerSelection]
+
+def _selection(selections: SelectionTable, member_id: str, pokemon_id: str) -> PlayerSelection:
+    key = (member_id, pokemon_id)
+    selection = selections.get(key)
+    if selection is None:
+        selection = selections[key] = PlayerSelection(member_id=intern(member_id), pokemon_id=intern(pokemon_id))
+    return selection
+
+def _team_match_data_from_dict(data: dict, selections: SelectionTable) -> TeamMatchData:
+    player_selections = [_selection(selections, ps["member_id"], ps["pokemon_id"]) for ps in data["player_selections"]]
+    return TeamMatchData(team_id=intern(data["team_id"]), player_selections=player_selections)
+
+def match_to_dict(match: Match) -> dict:
+    return {
+        "id": match.id,
+        "team_a_data": _team_match_data_to_dict(match.team_a_data),
+        "team_b_data": _team_match_data_to_dict(match.team_b_data),
+        "winner_team_id": match.winner_team_id,
+        "date": match.date
+    }
+
+def match_from_dict(match_data: dict, selections: Optional[SelectionTable] = None) -> Match:
+    """selections を渡すと、同じ (メンバー, ポケモン) の組はその表のオブジェクトを共有する"""
+    if selections is None:
+        selections = {}
+    return Match(
+        id=match_data["id"],
+        team_a_data=_team_match_data_from_dict(match_data["team_a_data"], selections),
+        team_b_data=_team_match_data_from_dict(match_data["team_b_data"], selections),
+        winner_team_id=intern(match_data["winner_team_id"]),
+        date=intern(match_data["date"])
+    )
+
+
+# レコード種別ごとの変換関数
+RECORD_TYPES: Dict[str, Tuple[Callable[[object], dict], Callable[[dict], object]]] = {
+    "team": (team_to_dict, team_from_dict),
+    "pokemon": (pokemon_to_dict, pokemon_from_dict),
+    "match": (match_to_dict, match_from_dict),
+}
+
+# バックエンドの読み書きで起きうる例外（ディスクの空き不足、SQLite のロック待ちのタイムアウトなど）
+STORAGE_ERRORS = (OSError, sqlite3.Error)
+
+
+class LoadResult(NamedTuple):
+    """全件読み込みの結果"""
+    items: Dict[str, list]
+    # items に対応する保存済みカウンタ（なければ None で、読み込み側が集計する）
+    stats: Optional[StatsAggregator]
+    # items に対応する保存済みの出場テーブル（なければ None で、読み込み側が作る）
+    appearances: Optional[AppearanceTable] = None
+
+
+class StorageBackend(ABC):
+    """
+    DataStore が使う永続化の口。
+
+    DataStore は load() で全件を読んだあと、poll() で前回以降に増えた
+    レコードだけを取り込む。書き込みは write_lock() の中で
+    poll() → append() → poll() の順に行う。append() が自分の書いた分を
+    読み込み済みにできた場合は、DataStore は書いたエンティティをそのまま取り込み、
+    poll() で読み直さない。
+
+    fsync が False なら、追記はディスクへの同期を待たない（OS に任せる）。
+    """
+
+    fsync = True
+
+    @abstractmethod
+    def write_lock(self) -> ContextManager:
+        """書き込み用の排他ロック（プロセス間）。読み込みはロックなしで行える"""
+
+    @abstractmethod
+    def load(self) -> LoadResult:
+        """全件を読み込み、poll() の読み込み位置をその時点に合わせる"""
+
+    @abstractmethod
+    def poll(self) -> Optional[List[Tuple[str, object]]]:
+        """前回の load()/poll() 以降に追加されたレコード。全件の読み直しが必要なら None"""
+
+    @abstractmethod
+    def append(self, records: List[Tuple[str, object]]) -> bool:
+        """
+        (種別, エンティティ) のレコードを永続化する。write_lock() の中で呼ぶ。
+        書いたレコードを読み込み済みにした（次の poll() で返さない）ならTrue。
+        """
+
+    def after_load(self, items: Dict[str, list], appearances: AppearanceTable) -> None:
+        """load() の結果を反映した直後（poll() の前）に呼ぶ。キャッシュの作成など"""
+
+    def needs_maintenance(self) -> bool:
+        """after_append() ですることがあるか（なければ DataStore は引数を用意しない）"""
+        return False
+
+    def after_append(self, items: Dict[str, list], stats: StatsAggregator, appearances: AppearanceTable) -> None:
+        """追記後のメンテナンス（圧縮など）。write_lock() の中で呼ぶ"""
+
+    @abstractmethod
+    def replace_all(self, items: Dict[str, list], stats: StatsAggregator, appearances: AppearanceTable) -> None:
+        """全件を書き直す。write_lock() の中で呼ぶ"""
+
+    def fingerprint(self) -> Optional[list]:
+        """
+        保存内容が変わると変わる値（JSON にできる形）。読み込まずに求められなければ None。
+        保存内容から作ったキャッシュ（シーズンの集計など）が古くなっていないかの判定に使う
+        """
+        return None
+
+
+class JsonStorage(StorageBackend):
+    """
+    JSONファイルによる保存。
+
+    teams.json / pokemons.json / matches.json をベースのスナップショットとし、
+    以降の追加は journal.jsonl に1レコード1行で追記する。読み込み時は
+    ベースを読んでからジャーナルを再生する。ジャーナルがベースより大きく
+    なったら圧縮（ベースへ書き戻してジャーナルを空に）するので、
+    追加1件あたりのコストはデータ量によらず償却O(1)になる。
+
+    ファイルは (inode, mtime, size) が変わったときだけ読み直し、ジャーナルが
+    伸びただけなら末尾の追記分だけを読む。ベースファイルを読んだ結果は
+    snapshot.bin にバイナリでキャッシュし、ベースが変わっていなければ
+    JSONをパースせずにそちらを読む（snapshot_cache を参照）。
+
+    複数プロセス（autoscale のワーカー）から同じディレクトリを使えるよう、
+    書き込み（追記・圧縮）は .lock への flock で直列化する。ベースファイルは
+    一時ファイルに書いてから os.replace するので、読み込み側はロックを取らずに
+    常に完全なファイルを読める。
+    """
+
+    # これ未満のジャーナルは圧縮しない
+    JOURNAL_COMPACT_MIN_BYTES = 1024 * 1024
+
+    def __init__(self, data_dir: str):
+        self.data_dir = data_dir
+        self.teams_file = os.path.join(data_dir, "teams.json")
+        self.pokemons_file = os.path.join(data_dir, "pokemons.json")
+        self.matches_file = os.path.join(data_dir, "matches.json")
+        self.journal_file = os.path.join(data_dir, "journal.jsonl")
+        self.stats_file = os.path.join(data_dir, "stats.json")
+        self.cache_file = os.path.join(data_dir, "snapshot.bin")
+        self.lock_file = os.path.join(data_dir, ".lock")
+
+        # ベースファイルの (inode, mtime_ns, size)
+        self._base_stats: Optional[Tuple] = None
+        self._base_bytes = 0
+        # ジャーナルの (inode, mtime_ns, size) と読み込み済みバイト数
+        self._journal_stat: Optional[Tuple[int, int, int]] = None
+        self._journal_offset = 0
+        # 読めなかったときに使い続ける、前回読み込めたベースの内容
+        self._last_items: Dict[str, list] = {kind: [] for kind in RECORD_TYPES}
+        # JSONから読み込んだので、反映後にバイナリキャッシュを作る
+        self._cache_stale = False
+        self._selections: SelectionTable = {}
+
+    def _ensure_data_dir(self):
+        """データディレクトリが存在することを確認"""
+        os.makedirs(self.data_dir, exist_ok=True)
+
+    def _base_files(self) -> Dict[str, str]:
+        return {
+            "team": self.teams_file,
+            "pokemon": self.pokemons_file,
+            "match": self.matches_file,
+        }
+
+    @staticmethod
+    def _stat_key(st: os.stat_result) -> Tuple[int, int, int]:
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    @staticmethod
+    def _stat(path: str) -> Optional[Tuple[int, int, int]]:
+        try:
+            return JsonStorage._stat_key(os.stat(path))
+        except FileNotFoundError:
+            return None
+
+    def _current_base_stats(self) -> tuple:
+        return tuple(self._stat(p) for p in self._base_files().values())
+
+    @staticmethod
+    def _source_key(base_stats: tuple) -> list:
+        """ベースファイルの stat を、stats.json と snapshot.bin に記録する形にする"""
+        return [list(s) if s else None for s in base_stats]
+
+    @contextmanager
+    def write_lock(self):
+        self._ensure_data_dir()
+        with open(self.lock_file, 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _atomic_write(self, path: str, text: str):
+        """一時ファイルに書いて fsync してから置き換える（途中の状態を見せない）"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.data_dir, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+                count("files_written")
+                count("bytes_written", os.fstat(f.fileno()).st_size)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _decoders(self) -> Dict[str, Callable[[dict], object]]:
+        """レコード種別ごとの読み込み関数（試合はこのバックエンドの表で組を共有する）"""
+        decoders = {kind: from_dict for kind, (_, from_dict) in RECORD_TYPES.items()}
+        decoders["match"] = partial(match_from_dict, selections=self._selections)
+        return decoders
+
+    def _read_base(self) -> Tuple[Dict[str, list], tuple]:
+        """ベースファイルを読み、内容と読んだファイルそのものの stat を返す"""
+        items: Dict[str, list] = {}
+        stats = []
+        decoders = self._decoders()
+        for kind, path in self._base_files().items():
+            from_dict = decoders[kind]
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    # 置き換えと競合しても、読んだ中身と stat が食い違わないよう fstat を使う
+                    stats.append(self._stat_key(os.fstat(f.fileno())))
+                    items[kind] = [from_dict(d) for d in json.load(f)]
+                count("files_read")
+                count("bytes_read", stats[-1][2])
+                count("records_parsed", len(items[kind]))
+            except FileNotFoundError:
+                stats.append(None)
+                items[kind] = []
+            except json.JSONDecodeError:
+                # アトミックに置き換えるので通常は起きないが、手で壊された場合は
+                # 前回読み込めた内容を使い続ける
+                items[kind] = self._last_items[kind]
+        return items, tuple(stats)
+
+    def load(self) -> LoadResult:
+        self._selections = {}
+        base_stats = self._current_base_stats()
+        cached = None
+        if any(base_stats):
+            count("binary_cache_requests")
+            cached = snapshot_cache.read(self.cache_file, self._source_key(base_stats))
+            if cached is None:
+                count("binary_cache_misses")
+        if cached is not None:
+            # 読んでいる間にベースが置き換えられていても、次の poll() で読み直しになる
+            items, appearances = cached
+            self._cache_stale = False
+        else:
+            # 読んでいる間に他プロセスが圧縮した場合は読み直す
+            for _ in range(3):
+                items, base_stats = self._read_base()
+                if base_stats == self._current_base_stats():
+                    break
+            appearances = None
+            self._cache_stale = any(base_stats)
+        self._last_items = items
+        self._base_stats = base_stats
+        self._base_bytes = sum(s[2] for s in base_stats if s)
+        self._journal_stat = None
+        self._journal_offset = 0
+        # ベースに対応する保存済みカウンタがあれば、ベース分の集計を省ける
+        return LoadResult(items, self._load_stats(len(items["match"])), appearances)
+
+    def after_load(self, items: Dict[str, list], appearances: AppearanceTable) -> None:
+        if not self._cache_stale:
+            return
+        self._cache_stale = False
+        try:
+            snapshot_cache.write(self.cache_file, items, appearances, self._source_key(self._base_stats))
+        except OSError:
+            # キャッシュは作れなくても JSON から読めるので無視する
+            pass
+
+    def _read_journal(self) -> List[Tuple[str, object]]:
+        """ジャーナルの未読部分（前回の読み込み位置以降）を読む"""
+        try:
+            f = open(self.journal_file, 'rb')
+        except FileNotFoundError:
+            self._journal_stat = None
+            return []
+        with f:
+            stat = self._journal_stat = self._stat_key(os.fstat(f.fileno()))
+            if stat[2] <= self._journal_offset:
+                return []
+            f.seek(self._journal_offset)
+            data = f.read()
+        count("files_read")
+        count("bytes_read", len(data))
+        # 書き込み途中の最終行は次回に回す
+        end = data.rfind(b'\n') + 1
+        records = []
+        decoders = self._decoders()
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                from_dict = decoders[record["type"]]
+                records.append((record["type"], from_dict(record["data"])))
+            except (json.JSONDecodeError, KeyError, TypeError):
+                # 壊れたレコードは読み飛ばす
+                continue
+        self._journal_offset += end
+        count("records_parsed", len(records))
+        return records
+
+    def poll(self) -> Optional[List[Tuple[str, object]]]:
+        if self._current_base_stats() != self._base_stats:
+            return None
+
+        journal_stat = self._stat(self.journal_file)
+        if journal_stat == self._journal_stat:
+            return []
+        replaced = self._journal_stat is not None and (journal_stat is None or journal_stat[0] != self._journal_stat[0])
+        if replaced or (journal_stat is not None and journal_stat[2] < self._journal_offset):
+            # 他プロセスがジャーナルを圧縮して置き換えた
+            return None
+        return self._read_journal()
+
+    def append(self, records: List[Tuple[str, object]]) -> bool:
+        payload = ''.join(
+            json.dumps({"type": kind, "data": RECORD_TYPES[kind][0](item)}, ensure_ascii=False, separators=(',', ':')) + '\n'
+            for kind, item in records
+        ).encode('utf-8')
+        with open(self.journal_file, 'ab') as f:
+            # 直前の poll() でジャーナルを末尾まで読んでいれば、書いた分は読まずに済む
+            # （書き込みロック中なので、間に他プロセスの追記は入らない）
+            before = self._stat_key(os.fstat(f.fileno()))
+            consumed = before[2] == self._journal_offset and (
+                before == self._journal_stat
+                # ジャーナルがなかった（今作った）
+                or (self._journal_stat is None and before[2] == 0)
+            )
+            f.write(payload)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+            if consumed:
+                self._journal_stat = self._stat_key(os.fstat(f.fileno()))
+                self._journal_offset += len(payload)
+        count("files_written")
+        count("bytes_written", len(payload))
+        count("records_written", len(records))
+        return consumed
+
+    def needs_maintenance(self) -> bool:
+        return self._journal_offset > max(self.JOURNAL_COMPACT_MIN_BYTES, self._base_bytes)
+
+    def after_append(self, items: Dict[str, list], stats: StatsAggregator, appearances: AppearanceTable) -> None:
+        if self.needs_maintenance():
+            self._compact(items, stats, appearances)
+
+    def replace_all(self, items: Dict[str, list], stats: StatsAggregator, appearances: AppearanceTable) -> None:
+        self._compact(items, stats, appearances)
+
+    def fingerprint(self) -> Optional[list]:
+        # 圧縮すると内容が同じでも変わるが、その場合はキャッシュを作り直すだけ
+        return self._source_key(self._current_base_stats()) + self._source_key((self._stat(self.journal_file),))
+
+    def _load_stats(self, match_count: int) -> Optional[StatsAggregator]:
+        """ベースファイルと同じ時点の保存済みカウンタを読む。古ければNone"""
+        try:
+            with open(self.stats_file, 'rb') as f:
+                raw = f.read()
+            data = json.loads(raw)
+        except (json.JSONDecodeError, FileNotFoundError):
+            return None
+        count("files_read")
+        count("bytes_read", len(raw))
+        if data.get("base_stats") != self._source_key(self._base_stats):
+            return None
+        try:
+            stats = StatsAggregator.from_dict(data["counters"])
+        except (KeyError, TypeError, ValueError):
+            return None
+        return stats if stats.match_count == match_count else None
+
+    def _save_stats(self, stats: StatsAggregator):
+        """ベースファイルと同じ時点のカウンタを保存（ジャーナル分は読み込み時に再集計）"""
+        self._atomic_write(self.stats_file, json.dumps({
+            "base_stats": self._source_key(self._base_stats),
+            "counters": stats.to_dict()
+        }, ensure_ascii=False))
+
+    def _compact(self, items: Dict[str, list], stats: StatsAggregator, appearances: AppearanceTable):
+        """全件をベースファイルに書き戻し、ジャーナルを空にする"""
+        for kind, path in self._base_files().items():
+            to_dict = RECORD_TYPES[kind][0]
+            # indent を付けると json が純Pythonのエンコーダーになり桁違いに遅いので付けない
+            self._atomic_write(path, json.dumps([to_dict(item) for item in items[kind]], ensure_ascii=False))
+            count("records_written", len(items[kind]))
+        # ベースを書いた後に空のジャーナルへ置き換える（間で落ちてもID重複は再生時に無視される）
+        self._atomic_write(self.journal_file, "")
+        self._last_items = {kind: list(kind_items) for kind, kind_items in items.items()}
+        self._base_stats = self._current_base_stats()
+        self._base_bytes = sum(s[2] for s in self._base_stats if s)
+        self._save_stats(stats)
+        snapshot_cache.write(self.cache_file, items, appearances, self._source_key(self._base_stats))
+        self._cache_stale = False
+        self._journal_stat = self._stat(self.journal_file)
+        self._journal_offset = 0
+
+
+class SqliteStorage(StorageBackend):
+    """
+    SQLite（WALモード）による保存。
+
+    teams / members / pokemons / matches / selections を正規化したテーブルに持ち、
+    各テーブルの seq（AUTOINCREMENT）で追加分だけを読み出す。集計は
+    GROUP BY で SQLite 側に任せ、Python では試合を走査しない。
+    WAL なので読み込みは書き込みを待たない。
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO meta (key, value) VALUES ('generation', 0);
+
+    CREATE TABLE IF NOT EXISTS teams (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        id TEXT NOT NULL UNIQUE,
+        name TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS members (
+        id TEXT PRIMARY KEY,
+        team_id TEXT NOT NULL REFERENCES teams (id),
+        position INTEGER NOT NULL,
+        name TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS members_team_id ON members (team_id, position);
+
+    CREATE TABLE IF NOT EXISTS pokemons (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        id TEXT NOT NULL UNIQUE,
+        name TEXT NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS matches (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        id TEXT NOT NULL UNIQUE,
+        team_a_id TEXT NOT NULL,
+        team_b_id TEXT NOT NULL,
+        winner_team_id TEXT NOT NULL,
+        date TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS matches_date ON matches (date);
+    CREATE INDEX IF NOT EXISTS matches_team_a_id ON matches (team_a_id);
+    CREATE INDEX IF NOT EXISTS matches_team_b_id ON matches (team_b_id);
+
+    CREATE TABLE IF NOT EXISTS selections (
+        match_seq INTEGER NOT NULL REFERENCES matches (seq),
+        side INTEGER NOT NULL,
+        position INTEGER NOT NULL,
+        team_id TEXT NOT NULL,
+        member_id TEXT NOT NULL,
+        pokemon_id TEXT NOT NULL,
+        won INTEGER NOT NULL,
+        PRIMARY KEY (match_seq, side, position)
+    );
+    CREATE INDEX IF NOT EXISTS selections_team_id ON selections (team_id, pokemon_id);
+    CREATE INDEX IF NOT EXISTS selections_member_id ON selections (member_id);
+    CREATE INDEX IF NOT EXISTS selections_pokemon_id ON selections (pokemon_id);
+    """
+
+    TABLES = {"team": "teams", "pokemon": "pokemons", "match": "matches"}
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        # 種別ごとに読み込み済みの最大 seq
+        self._cursor: Dict[str, int] = {kind: 0 for kind in RECORD_TYPES}
+        self._generation: Optional[int] = None
+        self._selections: SelectionTable = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # トランザクションは自分で BEGIN/COMMIT する
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # WAL では NORMAL でもコミットは壊れないが、直近のコミットが電源断で失われうる
+            conn.execute("PRAGMA synchronous=FULL" if self.fsync else "PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=10000")
+            conn.executescript(self.SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    @contextmanager
+    def _read(self):
+        """一貫した時点を読むための読み込みトランザクション（書き込み中ならそのまま）"""
+        conn = self._connect()
+        if conn.in_transaction:
+            yield conn
+            return
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.execute("COMMIT")
+
+    @contextmanager
+    def write_lock(self):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _generation_of(conn: sqlite3.Connection) -> int:
+        return conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()[0]
+
+    def _fetch_since(self, conn: sqlite3.Connection, cursor: Dict[str, int]) -> Dict[str, list]:
+        """seq が cursor より大きい行をエンティティにして返し、cursor を進める"""
+        items: Dict[str, list] = {}
+
+        members: Dict[str, List[Member]] = {}
+        for team_id, member_id, name in conn.execute(
+                "SELECT m.team_id, m.id, m.name FROM members m JOIN teams t ON t.id = m.team_id "
+                "WHERE t.seq > ? ORDER BY m.team_id, m.position", (cursor["team"],)):
+            members.setdefault(team_id, []).append(Member(id=member_id, name=name))
+        items["team"] = []
+        for seq, team_id, name in conn.execute(
+                "SELECT seq, id, name FROM teams WHERE seq > ? ORDER BY seq", (cursor["team"],)):
+            items["team"].append(Team(id=team_id, name=name, members=members.get(team_id, [])))
+            cursor["team"] = seq
+
+        items["pokemon"] = []
+        for seq, pokemon_id, name in conn.execute(
+                "SELECT seq, id, name FROM pokemons WHERE seq > ? ORDER BY seq", (cursor["pokemon"],)):
+            items["pokemon"].append(Pokemon(id=pokemon_id, name=name))
+            cursor["pokemon"] = seq
+
+        items["match"] = []
+        rows = conn.execute(
+            "SELECT m.seq, m.id, m.team_a_id, m.team_b_id, m.winner_team_id, m.date, "
+            "s.side, s.member_id, s.pokemon_id "
+            "FROM matches m LEFT JOIN selections s ON s.match_seq = m.seq "
+            "WHERE m.seq > ? ORDER BY m.seq, s.side, s.position", (cursor["match"],))
+        for seq, match_rows in groupby(rows, key=itemgetter(0)):
+            match_rows = list(match_rows)
+            _, match_id, team_a_id, team_b_id, winner_team_id, date = match_rows[0][:6]
+            sides = ([], [])
+            for row in match_rows:
+                if row[6] is not None:
+                    sides[row[6]].append(_selection(self._selections, row[7], row[8]))
+            items["match"].append(Match(
+                id=match_id,
+                team_a_data=TeamMatchData(team_id=intern(team_a_id), player_selections=sides[0]),
+                team_b_data=TeamMatchData(team_id=intern(team_b_id), player_selections=sides[1]),
+                winner_team_id=intern(winner_team_id),
+                date=intern(date)
+            ))
+            cursor["match"] = seq
+        count("records_parsed", sum(len(kind_items) for kind_items in items.values()))
+        return items
+
+    @staticmethod
+    def _aggregate(conn: sqlite3.Connection) -> StatsAggregator:
+        """カウンタを GROUP BY で SQLite 側で集計する"""
+        stats = StatsAggregator()
+        stats.match_count = conn.execute("SELECT COUNT(*) FROM matches").fetchone()[0]
+        stats.team = {
+            team_id: [played, won] for team_id, played, won in conn.execute(
+                "SELECT team_id, COUNT(*), SUM(won) FROM ("
+                "  SELECT team_a_id AS team_id, winner_team_id = team_a_id AS won FROM matches"
+                "  UNION ALL"
+                "  SELECT team_b_id, winner_team_id = team_b_id FROM matches WHERE team_b_id != team_a_id"
+                ") GROUP BY team_id")
+        }
+        stats.member = {
+            member_id: [played, won] for member_id, played, won in conn.execute(
+                "SELECT member_id, COUNT(*), SUM(won) FROM selections GROUP BY member_id")
+        }
+        stats.pokemon = {
+            pokemon_id: [played, won] for pokemon_id, played, won in conn.execute(
+                "SELECT pokemon_id, COUNT(*), SUM(won) FROM selections GROUP BY pokemon_id")
+        }
+        stats.team_pokemon = {
+            (team_id, pokemon_id): [played, won] for team_id, pokemon_id, played, won in conn.execute(
+                "SELECT team_id, pokemon_id, COUNT(*), SUM(won) FROM selections GROUP BY team_id, pokemon_id")
+        }
+        return stats
+
+    def load(self) -> LoadResult:
+        with self._read() as conn:
+            self._generation = self._generation_of(conn)
+            self._cursor = {kind: 0 for kind in RECORD_TYPES}
+            self._selections = {}
+            items = self._fetch_since(conn, self._cursor)
+            return LoadResult(items, self._aggregate(conn))
+
+    def poll(self) -> Optional[List[Tuple[str, object]]]:
+        with self._read() as conn:
+            if self._generation_of(conn) != self._generation:
+                return None
+            items = self._fetch_since(conn, self._cursor)
+        return [(kind, item) for kind in RECORD_TYPES for item in items[kind]]
+
+    def _insert(self, conn: sqlite3.Connection, kind: str, item) -> None:
+        if kind == "team":
+            conn.execute("INSERT INTO teams (id, name) VALUES (?, ?)", (item.id, item.name))
+            conn.executemany(
+                "INSERT INTO members (id, team_id, position, name) VALUES (?, ?, ?, ?)",
+                [(member.id, item.id, position, member.name) for position, member in enumerate(item.members)])
+        elif kind == "pokemon":
+            conn.execute("INSERT INTO pokemons (id, name) VALUES (?, ?)", (item.id, item.name))
+        else:
+            seq = conn.execute(
+                "INSERT INTO matches (id, team_a_id, team_b_id, winner_team_id, date) VALUES (?, ?, ?, ?, ?)",
+                (item.id, item.team_a_data.team_id, item.team_b_data.team_id, item.winner_team_id, item.date)
+            ).lastrowid
+            conn.executemany(
+                "INSERT INTO selections (match_seq, side, position, team_id, member_id, pokemon_id, won) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (seq, side, position, team_data.team_id, selection.member_id, selection.pokemon_id,
+                     int(item.winner_team_id == team_data.team_id))
+                    for side, team_data in enumerate((item.team_a_data, item.team_b_data))
+                    for position, selection in enumerate(team_data.player_selections)
+                ])
+
+    def append(self, records: List[Tuple[str, object]]) -> bool:
+        conn = self._connect()
+        # 読み込み位置が末尾なら、挿入した行は読み込み済みとして位置を進める
+        # （書き込みのトランザクション中なので、間に他プロセスの挿入は入らない）
+        consumed = all(
+            conn.execute(f"SELECT COALESCE(MAX(seq), 0) FROM {table}").fetchone()[0] == self._cursor[kind]
+            for kind, table in self.TABLES.items()
+        )
+        for kind, item in records:
+            self._insert(conn, kind, item)
+        count("records_written", len(records))
+        if consumed:
+            for kind, table in self.TABLES.items():
+                self._cursor[kind] = conn.execute(f"SELECT COALESCE(MAX(seq), 0) FROM {table}").fetchone()[0]
+        return consumed
+
+    def fingerprint(self) -> Optional[list]:
+        # ファイルの stat はチェックポイントでも変わるので、世代と各テーブルの最大 seq を使う
+        with self._read() as conn:
+            return [self._generation_of(conn)] + [
+                conn.execute(f"SELECT COALESCE(MAX(seq), 0) FROM {table}").fetchone()[0]
+                for table in self.TABLES.values()
+            ]
+
+    def replace_all(self, items: Dict[str, list], stats: StatsAggregator, appearances: AppearanceTable) -> None:
+        conn = self._connect()
+        for table in ("selections", "matches", "members", "teams", "pokemons"):
+            conn.execute(f"DELETE FROM {table}")
+        for kind in RECORD_TYPES:
+            for item in items[kind]:
+                self._insert(conn, kind, item)
+            count("records_written", len(items[kind]))
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'generation'")
+        # 書き直した内容はメモリ上と同じなので、読み込み位置を末尾に合わせる
+        self._generation = self._generation_of(conn)
+        for kind, table in self.TABLES.items():
+            self._cursor[kind] = conn.execute(f"SELECT COALESCE(MAX(seq), 0) FROM {table}").fetchone()[0]
+
+
+# 設定で選べる保存形式
+BACKENDS = {
+    "json": lambda data_dir: JsonStorage(data_dir),
+    "sqlite": lambda data_dir: SqliteStorage(os.path.join(data_dir, "unite.sqlite3")),
+}
+
+def create_backend(data_dir: str, backend: str = "json") -> StorageBackend:
+    """保存形式の名前からバックエンドを作る"""
+    try:
+        return BACKENDS[backend](data_dir)
+    except KeyError:
+        raise ValueError(f"unknown storage backend: {backend}") from None
@@ -0,0 +1,142 @@
+"""
+ベンチマーク用の合成データを作る。
+
+    python synthetic_data.py --matches 10000 --output bench_data [--teams 64] [--seed 0] [--backend json]
+
+チームは5人ずつ、ポケモンは一括インポートの初期値（51体）を使う。
+ポケモンの使用率は順位に対してべき乗で偏らせ（人気のポケモンほどよく選ばれる）、
+チームごとに強さを決めて勝敗も偏らせる。試合はほぼ日付順に並ぶ。
+同じシードなら同じデータになる。
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import uuid
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from entities import Member, Team, Pokemon, PlayerSelection, TeamMatchData, Match
+
+# ポケモンを選ぶ重みの偏り（順位 r の重みが 1 / r**PICK_SKEW）
+PICK_SKEW = 1.1
+# 1日あたりの試合数の目安
+MATCHES_PER_DAY = 40
+START_DATE = datetime.date(2024, 1, 1)
+
+
+class Dataset(NamedTuple):
+    teams: List[Team]
+    pokemons: List[Pokemon]
+    matches: List[Match]
+
+
+def _default_pokemon_names() -> Sequence[str]:
+    # models は streamlit を読み込むので、必要になるまで import しない
+    from models import DataManager
+    return DataManager.DEFAULT_POKEMON_NAMES
+
+
+def _uuid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def default_team_count(match_count: int) -> int:
+    """試合数に見合ったチーム数（1チームあたり平均 100 試合前後）"""
+    return max(8, min(2000, match_count // 50))
+
+
+def generate_dataset(
+        match_count: int,
+        team_count: Optional[int] = None,
+        seed: int = 0,
+        pokemon_names: Optional[Sequence[str]] = None
+    ) -> Dataset:
+    """チーム・ポケモン・試合の合成データを作る"""
+    rng = random.Random(seed)
+    team_count = team_count or default_team_count(match_count)
+    if team_count < 2:
+        raise ValueError("チームは2つ以上必要です")
+    pokemon_names = pokemon_names or _default_pokemon_names()
+
+    teams = [
+        Team(id=_uuid(rng), name=f"チーム{i + 1:04d}",
+             members=[Member(id=_uuid(rng), name=f"選手{i + 1:04d}-{j + 1}") for j in range(5)])
+        for i in range(team_count)
+    ]
+    pokemons = [Pokemon(id=_uuid(rng), name=name) for name in pokemon_names]
+
+    # 人気順はシードごとにシャッフルする
+    popularity = list(pokemons)
+    rng.shuffle(popularity)
+    pick_weights = [1 / (rank + 1) ** PICK_SKEW for rank in range(len(popularity))]
+    strength = {team.id: rng.lognormvariate(0, 0.5) for team in teams}
+
+    # 同じ (メンバー, ポケモン) は1つのインスタンスを共有する（読み込み時と同じ）
+    selections: Dict[Tuple[str, str], PlayerSelection] = {}
+
+    def pick_lineup(team: Team) -> TeamMatchData:
+        # 同じチーム内でポケモンは重複しない
+        chosen: List[Pokemon] = []
+        while len(chosen) < len(team.members):
+            pokemon = rng.choices(popularity, weights=pick_weights)[0]
+            if pokemon not in chosen:
+                chosen.append(pokemon)
+        lineup = []
+        for member, pokemon in zip(team.members, chosen):
+            key = (member.id, pokemon.id)
+            selection = selections.get(key)
+            if selection is None:
+                selection = selections[key] = PlayerSelection(member_id=member.id, pokemon_id=pokemon.id)
+            lineup.append(selection)
+        return TeamMatchData(team_id=team.id, player_selections=lineup)
+
+    matches = []
+    day_count = max(1, match_count // MATCHES_PER_DAY)
+    for i in range(match_count):
+        team_a, team_b = rng.sample(teams, 2)
+        strength_a, strength_b = strength[team_a.id], strength[team_b.id]
+        winner = team_a if rng.random() < strength_a / (strength_a + strength_b) else team_b
+        date = START_DATE + datetime.timedelta(days=i * day_count // match_count)
+        matches.append(Match(
+            id=_uuid(rng),
+            team_a_data=pick_lineup(team_a),
+            team_b_data=pick_lineup(team_b),
+            winner_team_id=winner.id,
+            date=date.isoformat()
+        ))
+
+    return Dataset(teams, pokemons, matches)
+
+
+def write_dataset(dataset: Dataset, data_dir: str, backend: str = "json"):
+    """データ一式を data_dir に保存する（既存のデータは置き換える）"""
+    from data_store import DataStore
+    from storage import create_backend
+
+    os.makedirs(data_dir, exist_ok=True)
+    return DataStore(create_backend(data_dir, backend)).save(dataset.teams, dataset.pokemons, dataset.matches)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="ベンチマーク用の合成データを作ります")
+    parser.add_argument("--matches", type=int, required=True, help="試合数")
+    parser.add_argument("--teams", type=int, help="チーム数（省略時は試合数から決める）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", required=True, help="保存先のデータディレクトリ")
+    parser.add_argument("--backend", default="json", choices=("json", "sqlite"))
+    args = parser.parse_args(argv)
+
+    try:
+        dataset = generate_dataset(args.matches, args.teams, args.seed)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    write_dataset(dataset, args.output, args.backend)
+    print(f"{args.output} に作成しました: チーム {len(dataset.teams)}、"
+          f"ポケモン {len(dataset.pokemons)}、試合 {len(dataset.matches)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,5 @@
 import streamlit as st
-from models import DataManager
+from models import DataManager, STORAGE_ERRORS
 
 # Page config
 st.set_page_config(
@@ -41,24 +41,27 @@ with st.form("team_registration_form"):
             st.error("全てのメンバー名を入力してください。")
         else:
             # Add team to session state
-            success = DataManager.add_team(team_name, member_names)
-            
-            if success:
-                st.success(f"チーム「{team_name}」が正常に登録されました！")
-                st.rerun()
+            try:
+                success = DataManager.add_team(team_name, member_names)
+            except STORAGE_ERRORS as e:
+                st.error(f"チームを保存できませんでした: {e}")
             else:
-                st.error(f"チーム名「{team_name}」は既に存在します。")
+                if success:
+                    st.success(f"チーム「{team_name}」が正常に登録されました！")
+                    st.rerun()
+                else:
+                    st.error(f"チーム名「{team_name}」は既に存在します。")
 
 # Display registered teams
-if st.session_state.teams:
+if DataManager.get_teams():
     st.header("登録済みチーム")
     
     # Create tabs for each team
-    team_tabs = st.tabs([team.name for team in st.session_state.teams])
+    team_tabs = st.tabs([team.name for team in DataManager.get_teams()])
     
     for i, tab in enumerate(team_tabs):
         with tab:
-            team = st.session_state.teams[i]
+            team = DataManager.get_teams()[i]
             st.subheader(f"{team.name}のメンバー")
             
             # Display members in a table format
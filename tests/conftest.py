@@ -0,0 +1,26 @@
+import pytest
+import streamlit as st
+
+import seasons
+from data_store import get_store
+from models import DataManager
+from sample_data import sample_data
+
+
+@pytest.fixture
+def data_manager(tmp_path, monkeypatch):
+    """tmp_path をデータディレクトリにした DataManager（セッションも空にする）"""
+    monkeypatch.setattr(DataManager, "DATA_DIR", str(tmp_path))
+    st.session_state.clear()
+    yield DataManager
+    DataManager.flush_writes()
+    st.session_state.clear()
+
+
+@pytest.fixture
+def sample_store(data_manager):
+    """開催中のシーズンに sample_data() を保存した、DataManager と共有のストア"""
+    data_dir = data_manager.DATA_DIR
+    store = get_store(seasons.season_dir(data_dir, seasons.active_season(data_dir)), data_manager.STORAGE_BACKEND)
+    store.save(*sample_data())
+    return store
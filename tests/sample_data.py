@@ -0,0 +1,42 @@
+"""テスト用の小さなデータ一式"""
+import random
+from typing import List, Tuple
+
+from entities import Match, Member, PlayerSelection, Pokemon, Team, TeamMatchData
+from storage import match_to_dict, pokemon_to_dict, team_to_dict
+
+
+def sample_data(seed: int = 1, match_count: int = 200, team_count: int = 4,
+                pokemon_count: int = 10) -> Tuple[List[Team], List[Pokemon], List[Match]]:
+    """チーム・ポケモン・試合。1割ほどは同じチーム同士の試合（練習試合など）"""
+    rng = random.Random(seed)
+    teams = [
+        Team(id=f"t{i}", name=f"チーム{i}", members=[Member(id=f"t{i}m{j}", name=f"メンバー{i}-{j}") for j in range(5)])
+        for i in range(team_count)
+    ]
+    pokemons = [Pokemon(id=f"p{i}", name=f"ポケモン{i}") for i in range(pokemon_count)]
+    matches = [random_match(rng, teams, pokemons, f"m{i}") for i in range(match_count)]
+    return teams, pokemons, matches
+
+
+def random_match(rng: random.Random, teams: List[Team], pokemons: List[Pokemon], match_id: str) -> Match:
+    team_a = rng.choice(teams)
+    team_b = team_a if rng.random() < 0.1 else rng.choice([team for team in teams if team is not team_a])
+    sides = [
+        TeamMatchData(team_id=team.id, player_selections=[
+            PlayerSelection(member_id=member.id, pokemon_id=rng.choice(pokemons).id) for member in team.members
+        ])
+        for team in (team_a, team_b)
+    ]
+    return Match(id=match_id, team_a_data=sides[0], team_b_data=sides[1],
+                 winner_team_id=rng.choice([team_a.id, team_b.id]),
+                 date=f"2024-01-{rng.randint(1, 28):02d}")
+
+
+def dump(snapshot) -> dict:
+    """スナップショットの中身を比較できる形にする"""
+    return {
+        "teams": [team_to_dict(team) for team in snapshot.teams],
+        "pokemons": [pokemon_to_dict(pokemon) for pokemon in snapshot.pokemons],
+        "matches": [match_to_dict(match) for match in snapshot.matches],
+    }
@@ -0,0 +1,131 @@
+import pandas as pd
+import pytest
+
+import analytics
+from aggregates import StatsAggregator
+from data_store import DataStore
+from sample_data import sample_data
+from storage import JsonStorage, SqliteStorage
+
+
+def _counters(stats: pd.DataFrame, id_column: str) -> dict:
+    return {
+        row[id_column]: [row["matches_played"], row["matches_won"]]
+        for _, row in stats.iterrows() if row["matches_played"]
+    }
+
+
+def _backend(kind: str, directory):
+    return JsonStorage(str(directory)) if kind == "json" else SqliteStorage(str(directory / "unite.db"))
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def store(request, tmp_path):
+    teams, pokemons, matches = sample_data()
+    DataStore(_backend(request.param, tmp_path)).save(teams, pokemons, matches)
+    # 読み直すと SQLite はカウンタを GROUP BY で集計し直す
+    return DataStore(_backend(request.param, tmp_path))
+
+
+def test_team_stats_match_the_counters(store):
+    snapshot = store.snapshot()
+    expected = StatsAggregator()
+    for match in snapshot.matches:
+        expected.add_match(match)
+
+    stats = store.stats_at(snapshot)
+    for name in ("match_count", "team", "member", "pokemon", "team_pokemon"):
+        assert getattr(stats, name) == getattr(expected, name)
+    assert _counters(analytics.team_stats(snapshot), "team_id") == expected.team
+    assert _counters(analytics.member_stats(snapshot), "member_id") == expected.member
+    assert _counters(analytics.pokemon_stats(snapshot), "pokemon_id") == expected.pokemon
+
+
+def test_self_match_counts_once(store):
+    snapshot = store.snapshot()
+    self_matches = [match for match in snapshot.matches if match.team_a_data.team_id == match.team_b_data.team_id]
+    assert self_matches
+
+    team_id = self_matches[0].team_a_data.team_id
+    played = sum(team_id in (match.team_a_data.team_id, match.team_b_data.team_id) for match in snapshot.matches)
+    stats = analytics.team_stats(snapshot).set_index("team_id")
+    assert stats.loc[team_id, "matches_played"] == played
+    # 期間を指定したとき（Timeline の累積）も同じ数え方
+    dated = analytics.team_stats(snapshot, ("2024-01-01", "2024-01-31")).set_index("team_id")
+    assert dated.loc[team_id, "matches_played"] == played
+    assert (dated["matches_won"] == stats["matches_won"]).all()
+
+
+def test_unparseable_dates_are_left_out_of_dated_stats(tmp_path):
+    teams, pokemons, matches = sample_data(match_count=50)
+    # 手で編集されたファイルなど、YYYY-MM-DD でない日付の試合
+    for match, date in zip(matches[:3], ["2024-13-01", "01/05/2024", "20240105"]):
+        match.date = date
+    store = DataStore(JsonStorage(str(tmp_path)))
+    snapshot = store.save(teams, pokemons, matches)
+
+    assert analytics.match_dates(snapshot) == sorted({match.date for match in matches[3:]})
+    expected = StatsAggregator()
+    for match in matches[3:]:
+        expected.add_match(match)
+    dated = analytics.team_stats(snapshot, ("2024-01-01", "2024-01-31"))
+    assert _counters(dated, "team_id") == expected.team
+    # 期間を指定しなければ全試合を数える
+    assert analytics.team_stats(snapshot).set_index("team_id").loc[teams[0].id, "matches_played"] == sum(
+        teams[0].id in (match.team_a_data.team_id, match.team_b_data.team_id) for match in matches)
+    # 移動期間が全期間を含めば、最後の日の値は読める日付の試合の合計
+    trend = analytics.win_rate_trend(snapshot, "team", teams[0].id, 60)
+    assert list(trend.iloc[-1][["matches_played", "matches_won"]]) == expected.team[teams[0].id]
+
+
+def _lineups(matches, pokemons) -> dict:
+    """サイドの編成（ポケモン名の昇順）ごとの [試合数, 勝利数] を試合から直接数える"""
+    names = {pokemon.id: pokemon.name for pokemon in pokemons}
+    counts = {}
+    for match in matches:
+        for data in (match.team_a_data, match.team_b_data):
+            lineup = tuple(sorted(names[s.pokemon_id] for s in data.player_selections))
+            played_won = counts.setdefault(lineup, [0, 0])
+            played_won[0] += 1
+            played_won[1] += match.winner_team_id == data.team_id
+    return counts
+
+
+@pytest.mark.parametrize("kind", ["json", "sqlite"])
+def test_lineup_search_matches_a_brute_force_filter(tmp_path, kind):
+    # ポケモンを少なくして、同じ編成が何度も出るようにする
+    teams, pokemons, matches = sample_data(pokemon_count=4)
+    DataStore(_backend(kind, tmp_path)).save(teams, pokemons, matches[:150])
+    store = DataStore(_backend(kind, tmp_path))
+    # 読み込み後の追記で増えた編成も検索できる
+    store.append_many("match", matches[150:])
+    snapshot = store.snapshot()
+    counts = analytics.lineup_stats(snapshot)
+    lineups = _lineups(matches, pokemons)
+    assert max(played for played, _ in lineups.values()) > 1
+
+    names = [pokemon.name for pokemon in pokemons]
+    queries = [([], False), ([0], False), ([1, 3], False), ([2, 2], False), ([0, 1, 2, 3], False)]
+    queries += [([names.index(name) for name in lineup], True) for lineup in list(lineups)[:3]]
+    queries += [([0, 0, 0, 0, 0], True)]
+    for indexes, exact in queries:
+        wanted = sorted(names[i] for i in indexes)
+        if exact:
+            expected = {lineup: c for lineup, c in lineups.items() if list(lineup) == wanted}
+        else:
+            expected = {lineup: c for lineup, c in lineups.items() if set(wanted) <= set(lineup)}
+        for min_matches in (1, 2):
+            result = analytics.lineup_search(snapshot, counts, [pokemons[i].id for i in indexes], exact,
+                                             min_matches, limit=None)
+            assert (result["matches_played"], result["matches_won"]) == (
+                sum(c[0] for c in expected.values()), sum(c[1] for c in expected.values()))
+            shown = {" / ".join(lineup): c for lineup, c in expected.items() if c[0] >= min_matches}
+            rows = result["lineups"]
+            assert result["lineup_count"] == len(shown)
+            assert {row["lineup"]: [row["matches_played"], row["matches_won"]]
+                    for _, row in rows.iterrows()} == shown
+            # 試合数の多い順
+            assert list(rows["matches_played"]) == sorted(rows["matches_played"], reverse=True)
+
+    # 登録されていないポケモンを含む検索は何にも一致しない
+    assert analytics.lineup_search(snapshot, counts, [pokemons[0].id, "missing"])["lineup_count"] == 0
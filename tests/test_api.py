@@ -0,0 +1,148 @@
+import asyncio
+import json
+
+import pytest
+
+import api
+import seasons
+
+
+def _get(target: str, **headers) -> api.Response:
+    return api.handle_request("GET", target, headers)
+
+
+def _json(response: api.Response) -> dict:
+    assert response.status == 200, response.body
+    return json.loads(response.body)
+
+
+def _header(response: api.Response, name: str) -> str:
+    return dict(response.headers)[name]
+
+
+def _newest_first(matches) -> list:
+    """日付の新しい順（同じ日付なら後に追加した順）"""
+    return [match.id for _, match in sorted(enumerate(matches), key=lambda p: (p[1].date, p[0]), reverse=True)]
+
+
+def _all_pages(target: str) -> list:
+    ids = []
+    cursor = None
+    while True:
+        page = _json(_get(target + (f"&cursor={cursor}" if cursor else "")))
+        ids.extend(item["id"] for item in page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return ids
+
+
+def test_not_modified_with_the_returned_etag(sample_store):
+    response = _get("/api/teams")
+    etag = _header(response, "etag")
+    assert len(_json(response)["items"]) == 4
+
+    for if_none_match in (etag, f"W/{etag}"):
+        not_modified = _get("/api/teams", **{"if-none-match": if_none_match})
+        assert (not_modified.status, not_modified.body) == (304, b"")
+        assert _header(not_modified, "etag") == etag
+    assert _get("/api/teams", **{"if-none-match": '"other"'}).status == 200
+
+
+def test_etag_changes_after_add_match(sample_store, data_manager):
+    response = _get("/api/version")
+    etag = _header(response, "etag")
+    team_a, team_b = data_manager.get_teams()[:2]
+    pokemon_id = data_manager.get_pokemons()[0].id
+    data_manager.add_match(team_a.id, [(member.id, pokemon_id) for member in team_a.members],
+                           team_b.id, [(member.id, pokemon_id) for member in team_b.members],
+                           team_a.id, "2024-02-01")
+
+    changed = _get("/api/version", **{"if-none-match": etag})
+    assert changed.status == 200
+    assert _header(changed, "etag") != etag
+    assert _json(changed)["counts"]["matches"] == _json(response)["counts"]["matches"] + 1
+
+
+def test_cursor_paging_has_no_duplicates_or_gaps(sample_store):
+    snapshot = sample_store.snapshot()
+    assert _all_pages("/api/matches?limit=7") == _newest_first(snapshot.matches)
+    assert _all_pages("/api/teams?limit=3") == [team.id for team in snapshot.teams]
+
+    team_id = snapshot.teams[1].id
+    in_range = [match for match in snapshot.matches
+                if "2024-01-05" <= match.date <= "2024-01-20"
+                and team_id in (match.team_a_data.team_id, match.team_b_data.team_id)]
+    assert _all_pages(f"/api/matches?limit=4&team_id={team_id}&date_from=2024-01-05&date_to=2024-01-20") == \
+        _newest_first(in_range)
+
+
+def test_seasons(sample_store, data_manager):
+    data_dir = data_manager.DATA_DIR
+    first = seasons.active_season(data_dir)
+    assert _get("/api/version?season=missing").status == 404
+
+    seasons.start_season(data_dir, data_manager.STORAGE_BACKEND, "s2", "次のシーズン")
+    current = _json(_get("/api/version"))
+    assert (current["season"], current["counts"]["matches"]) == ("s2", 0)
+    # 過去のシーズンもキーで選べる（チームは引き継いでいる）
+    archived = _json(_get(f"/api/version?season={first.key}"))
+    assert (archived["season"], archived["counts"]["matches"]) == (first.key, 200)
+    assert current["counts"]["teams"] == archived["counts"]["teams"]
+
+
+@pytest.mark.parametrize("target", [
+    "/api/matches?limit=ten",
+    "/api/matches?date_from=2024-13-01",
+    "/api/stats/teams?date_to=yesterday",
+    "/api/stats/teams?min_matches=x",
+    "/api/matches?cursor=not-a-cursor",
+])
+def test_bad_parameters(sample_store, target):
+    response = _get(target)
+    assert response.status == 400
+    assert "error" in json.loads(response.body)
+
+
+def test_unknown_paths_and_methods(sample_store):
+    # パスが存在しなければ If-None-Match があっても 404
+    assert _get("/api/nothing", **{"if-none-match": "*"}).status == 404
+    assert _get("/api/teams/missing").status == 404
+    for method in ("POST", "PUT", "DELETE"):
+        assert api.handle_request(method, "/api/teams", {}).status == 405
+
+
+def test_head_has_headers_but_no_body(sample_store):
+    get = _get("/api/stats/teams")
+    head = api.handle_request("HEAD", "/api/stats/teams", {})
+    assert (head.status, head.body) == (200, b"")
+    assert _header(head, "content-length") == str(len(get.body))
+    assert _header(head, "etag") == _header(get, "etag")
+
+
+def _asgi(method: str, path: str, query: bytes = b"", headers=()) -> tuple:
+    """ASGI アプリを1回呼んで (status, headers, body) を返す"""
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": method, "path": path, "query_string": query,
+             "headers": [(name.encode(), value.encode()) for name, value in headers]}
+    asyncio.run(api.app(scope, receive, send))
+    start, body = sent
+    return start["status"], {name.decode(): value.decode() for name, value in start["headers"]}, body["body"]
+
+
+def test_asgi_app(sample_store):
+    status, headers, body = _asgi("GET", "/api/pokemons", b"limit=3")
+    assert status == 200
+    assert headers["content-type"].startswith("application/json")
+    page = json.loads(body)
+    assert len(page["items"]) == 3 and page["next_cursor"]
+
+    status, _, body = _asgi("GET", "/api/pokemons", b"limit=3", [("If-None-Match", headers["etag"])])
+    assert (status, body) == (304, b"")
+    assert _asgi("POST", "/api/pokemons")[0] == 405
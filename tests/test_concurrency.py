@@ -0,0 +1,92 @@
+import multiprocessing
+import random
+
+import pytest
+
+from data_store import DataStore
+from sample_data import random_match, sample_data
+from storage import create_backend
+
+WORKERS = 6
+MATCHES_PER_WORKER = 100
+
+
+def _backend(kind: str, data_dir: str):
+    backend = create_backend(data_dir, kind)
+    # JSON は小さくして、追記の途中で何度も圧縮させる
+    backend.JOURNAL_COMPACT_MIN_BYTES = 4096
+    return backend
+
+
+def _append_matches(kind: str, data_dir: str, worker: int, durability: str):
+    teams, pokemons, _ = sample_data()
+    rng = random.Random(worker)
+    store = DataStore(_backend(kind, data_dir), durability=durability)
+    for i in range(MATCHES_PER_WORKER):
+        store.append("match", random_match(rng, teams, pokemons, f"w{worker}-{i}"))
+        if i % 10 == 0:
+            store.snapshot()
+    store.flush()
+
+
+@pytest.mark.parametrize("kind", ["json", "sqlite"])
+@pytest.mark.parametrize("durability", ["always", "batch"])
+def test_concurrent_appends_lose_nothing(tmp_path, kind, durability):
+    teams, pokemons, _ = sample_data()
+    DataStore(_backend(kind, str(tmp_path))).save(teams, pokemons, [])
+    processes = [
+        multiprocessing.Process(target=_append_matches, args=(kind, str(tmp_path), worker, durability))
+        for worker in range(WORKERS)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert [process.exitcode for process in processes] == [0] * WORKERS
+
+    snapshot = DataStore(_backend(kind, str(tmp_path))).snapshot()
+    ids = [match.id for match in snapshot.matches]
+    assert len(ids) == len(set(ids)) == WORKERS * MATCHES_PER_WORKER
+    assert snapshot.stats.match_count == WORKERS * MATCHES_PER_WORKER
+
+
+def _register(kind: str, data_dir: str, worker: int):
+    # DataManager はセッションのシーズンを読むので、子プロセスで設定し直す
+    import streamlit as st
+    from models import DataManager
+
+    DataManager.DATA_DIR = data_dir
+    DataManager.STORAGE_BACKEND = kind
+    st.session_state.clear()
+    teams, pokemons, _ = sample_data()
+    rng = random.Random(worker)
+    for i in range(20):
+        # 全ワーカーが同じ名前を登録しつつ、試合も追記する（名前の重複チェックは試合の追記と衝突しない）
+        DataManager.add_team(f"共有チーム{i}", [f"メンバー{j}" for j in range(5)])
+        DataManager.add_pokemon(f"共有ポケモン{i}")
+        match = random_match(rng, teams, pokemons, "")
+        DataManager.add_match(
+            match.team_a_data.team_id, [(s.member_id, s.pokemon_id) for s in match.team_a_data.player_selections],
+            match.team_b_data.team_id, [(s.member_id, s.pokemon_id) for s in match.team_b_data.player_selections],
+            match.winner_team_id, match.date,
+        )
+    DataManager.flush_writes()
+
+
+@pytest.mark.parametrize("kind", ["json", "sqlite"])
+def test_concurrent_registration_keeps_names_unique(tmp_path, kind):
+    processes = [multiprocessing.Process(target=_register, args=(kind, str(tmp_path), worker))
+                 for worker in range(WORKERS)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    # ConflictError などで落ちたワーカーがない
+    assert [process.exitcode for process in processes] == [0] * WORKERS
+
+    snapshot = DataStore(create_backend(str(tmp_path), kind)).snapshot()
+    team_names = [team.name for team in snapshot.teams]
+    pokemon_names = [pokemon.name for pokemon in snapshot.pokemons]
+    assert sorted(team_names) == sorted(f"共有チーム{i}" for i in range(20))
+    assert sorted(pokemon_names) == sorted(f"共有ポケモン{i}" for i in range(20))
+    assert len(snapshot.matches) == WORKERS * 20
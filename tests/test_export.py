@@ -0,0 +1,95 @@
+import os
+
+import pandas as pd
+import pytest
+
+import export
+
+needs_pyarrow = pytest.mark.skipif(export.pa is None, reason="pyarrow is not installed")
+
+
+def _read(path: str, file_format: str) -> pd.DataFrame:
+    if file_format == "parquet":
+        return pd.read_parquet(path)
+    if file_format == "arrow":
+        with export.pa.ipc.open_file(path) as reader:
+            return reader.read_all().to_pandas()
+    return pd.read_csv(path, encoding="utf-8-sig", keep_default_na=False)
+
+
+def _appearances(snapshot) -> pd.DataFrame:
+    """試合の一覧から1行1出場の表を素直に作る"""
+    teams = {team.id: team for team in snapshot.teams}
+    members = {member.id: member.name for team in snapshot.teams for member in team.members}
+    pokemons = {pokemon.id: pokemon.name for pokemon in snapshot.pokemons}
+    rows = [
+        (match.id, match.date, side, data.team_id, teams[data.team_id].name, selection.member_id,
+         members[selection.member_id], selection.pokemon_id, pokemons[selection.pokemon_id],
+         match.winner_team_id == data.team_id)
+        for match in snapshot.matches
+        for side, data in (("A", match.team_a_data), ("B", match.team_b_data))
+        for selection in data.player_selections
+    ]
+    return pd.DataFrame(rows, columns=export.APPEARANCE_COLUMNS)
+
+
+@pytest.mark.parametrize("file_format", [
+    pytest.param("parquet", marks=needs_pyarrow),
+    pytest.param("arrow", marks=needs_pyarrow),
+    "csv",
+])
+def test_round_trip(sample_store, data_manager, file_format):
+    expected = {
+        "appearances": _appearances(data_manager.get_snapshot()),
+        "team_stats": data_manager.calculate_team_stats(),
+        "member_stats": data_manager.calculate_member_stats(),
+        "pokemon_stats": data_manager.calculate_pokemon_stats(),
+    }
+    assert len(expected["appearances"]) == 200 * 10
+    for table, frame in expected.items():
+        exported = _read(data_manager.export_data(table, file_format), file_format)
+        pd.testing.assert_frame_equal(exported, frame.reset_index(drop=True), check_dtype=False)
+
+    # 期間を指定した統計も同じ
+    period = data_manager.calculate_pokemon_stats("2024-01-05", "2024-01-20")
+    exported = _read(data_manager.export_data("pokemon_stats", file_format, "2024-01-05", "2024-01-20"), file_format)
+    pd.testing.assert_frame_equal(exported, period.reset_index(drop=True), check_dtype=False)
+
+
+def test_chunks_cover_every_appearance(sample_store):
+    snapshot = sample_store.snapshot()
+    chunks = list(export.appearance_chunks(snapshot, chunk_rows=37))
+    assert len(chunks) == -(-2000 // 37)
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), _appearances(snapshot))
+
+
+def test_file_is_reused_until_a_new_match(sample_store, data_manager):
+    path = data_manager.export_data("appearances", "csv")
+    assert data_manager.export_data("appearances", "csv") == path
+
+    team_a, team_b = data_manager.get_teams()[:2]
+    pokemon_id = data_manager.get_pokemons()[0].id
+    data_manager.add_match(team_a.id, [(member.id, pokemon_id) for member in team_a.members],
+                           team_b.id, [(member.id, pokemon_id) for member in team_b.members],
+                           team_a.id, "2024-02-01")
+    data_manager.load_data()
+
+    new_path = data_manager.export_data("appearances", "csv")
+    assert new_path != path
+    # 古いバージョンのファイルは消す
+    assert not os.path.exists(path)
+    exported = _read(new_path, "csv")
+    assert len(exported) == 200 * 10 + 10
+    assert set(exported["match_id"][-10:]) == {data_manager.get_matches()[-1].id}
+
+
+def test_csv_without_pyarrow(sample_store, data_manager, monkeypatch):
+    monkeypatch.setattr(export, "pa", None)
+    monkeypatch.setattr(export, "pq", None)
+    assert export.available_formats() == ["csv"]
+    with pytest.raises(ValueError):
+        data_manager.export_data("team_stats", "parquet")
+
+    exported = _read(data_manager.export_data("team_stats", "csv"), "csv")
+    pd.testing.assert_frame_equal(exported, data_manager.calculate_team_stats().reset_index(drop=True),
+                                  check_dtype=False)
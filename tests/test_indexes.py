@@ -0,0 +1,92 @@
+import random
+
+import pytest
+
+from data_store import DataStore
+from sample_data import random_match, sample_data
+from storage import JsonStorage
+
+
+def _newest_first(matches, date_from=None, date_to=None, team_id=None) -> list:
+    """試合の一覧を素直に絞り込み、日付の新しい順（同じ日付なら後に追加した順）に並べる"""
+    selected = [
+        (match.date, position, match.id) for position, match in enumerate(matches)
+        if (date_from is None or match.date >= date_from) and (date_to is None or match.date <= date_to)
+        and (team_id is None or team_id in (match.team_a_data.team_id, match.team_b_data.team_id))
+    ]
+    return [match_id for _, _, match_id in sorted(selected, reverse=True)]
+
+
+def _latest_pages(date_index, page_size, size, date_from=None, date_to=None) -> list:
+    ids = []
+    while True:
+        page = date_index.latest(len(ids), page_size, date_from, date_to, size)
+        assert len(page) <= page_size
+        ids.extend(match.id for match in page)
+        if len(page) < page_size:
+            return ids
+
+
+def _keyed_pages(date_index, page_size, size, date_from=None, date_to=None) -> list:
+    ids = []
+    before = None
+    while True:
+        page = date_index.page(page_size, before, date_from, date_to, size)
+        ids.extend(match.id for _, match in page)
+        if len(page) < page_size:
+            return ids
+        before = page[-1][0]
+
+
+@pytest.fixture
+def snapshots(tmp_path):
+    """全件読み込みで作った索引と、その後に日付順でなく追記した試合。追記前のスナップショットも返す"""
+    teams, pokemons, matches = sample_data(match_count=150)
+    store = DataStore(JsonStorage(str(tmp_path)))
+    before = store.save(teams, pokemons, matches)
+    rng = random.Random(7)
+    later = [random_match(rng, teams, pokemons, f"later{i}") for i in range(40)]
+    # 既存の最後の日付と同じ日と、範囲の端の日付にも追記する
+    later[0].date, later[1].date = max(match.date for match in matches), "2024-01-01"
+    for match in later[:20]:
+        store.append("match", match)
+    after = store.append_many("match", later[20:])
+    return before, after
+
+
+CASES = [
+    (None, None), ("2024-01-05", None), (None, "2024-01-20"), ("2024-01-05", "2024-01-20"),
+    # 両端を含み、端の日付ちょうどの試合も入る
+    ("2024-01-01", "2024-01-01"), ("2024-01-28", "2024-01-28"),
+    # 試合のない範囲と逆転した範囲
+    ("2024-02-01", "2024-02-28"), ("2024-01-20", "2024-01-05"),
+]
+
+
+@pytest.mark.parametrize("date_from, date_to", CASES)
+def test_pages_match_a_plain_sort(snapshots, date_from, date_to):
+    before, after = snapshots
+    # 追記前のスナップショットは、伸びた索引からでも自分の試合だけを読む
+    assert after.index is before.index
+    for snapshot in (before, after):
+        size = len(snapshot.matches)
+        index = snapshot.index
+        targets = [(index.matches_by_date, None)] + [
+            (index.matches_by_team_date[team.id], team.id) for team in snapshot.teams]
+        for date_index, team_id in targets:
+            expected = _newest_first(snapshot.matches, date_from, date_to, team_id)
+            assert date_index.count(date_from, date_to, size) == len(expected)
+            for page_size in (1, 7, 500):
+                assert _latest_pages(date_index, page_size, size, date_from, date_to) == expected
+                assert _keyed_pages(date_index, page_size, size, date_from, date_to) == expected
+
+
+def test_latest_skips_matches_added_after_the_snapshot(snapshots):
+    before, after = snapshots
+    date_index = before.index.matches_by_date
+    expected = _newest_first(before.matches)
+    # 後から追加した試合が先頭や途中にあっても、offset は追記前の試合で数える
+    for offset in (0, 1, 5, 149, 150):
+        assert [match.id for match in date_index.latest(offset, 3, size=len(before.matches))] == \
+            expected[offset:offset + 3]
+    assert len(date_index.latest(0, 500)) == len(after.matches)
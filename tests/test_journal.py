@@ -0,0 +1,94 @@
+import os
+
+import pytest
+
+from data_store import DataStore
+from sample_data import dump, sample_data
+from storage import create_backend
+
+
+def _store(data_dir, compact_min_bytes: int = 4096, kind: str = "json") -> DataStore:
+    backend = create_backend(str(data_dir), kind)
+    backend.JOURNAL_COMPACT_MIN_BYTES = compact_min_bytes
+    return DataStore(backend, durability="always")
+
+
+@pytest.mark.parametrize("kind", ["json", "sqlite"])
+def test_append_compact_reload(tmp_path, kind):
+    teams, pokemons, matches = sample_data(match_count=300)
+    store = _store(tmp_path, kind=kind)
+    store.append_many("team", teams)
+    store.append_many("pokemon", pokemons)
+    # 1件ずつとまとめての追記を混ぜ、途中で何度か圧縮させる
+    for match in matches[:200]:
+        store.append("match", match)
+    store.append_many("match", matches[200:])
+    store.flush()
+    expected = dump(store.snapshot())
+    assert len(expected["matches"]) == 300
+
+    assert dump(_store(tmp_path, kind=kind).snapshot()) == expected
+    if kind == "json":
+        # 圧縮でジャーナルの中身の一部はベースファイルに移っている
+        with open(tmp_path / "journal.jsonl", encoding="utf-8") as f:
+            assert sum(1 for _ in f) < 300 + len(teams) + len(pokemons)
+        # バイナリキャッシュがなくても、JSON から読み直して同じ
+        os.remove(tmp_path / "snapshot.bin")
+        os.remove(tmp_path / "stats.json")
+    reloaded = _store(tmp_path, kind=kind).snapshot()
+    assert dump(reloaded) == expected
+    assert reloaded.stats.match_count == 300
+
+
+def test_reload_replays_journal_only(tmp_path):
+    teams, pokemons, matches = sample_data(match_count=20)
+    # 圧縮しない
+    store = _store(tmp_path, compact_min_bytes=1 << 30)
+    store.save(teams, pokemons, [])
+    store.append_many("match", matches)
+    store.flush()
+    assert not os.path.exists(tmp_path / "matches.json") or os.path.getsize(tmp_path / "matches.json") < 10
+    assert dump(_store(tmp_path).snapshot()) == dump(store.snapshot())
+
+
+def test_torn_journal_line_is_skipped(tmp_path):
+    teams, pokemons, matches = sample_data(match_count=5)
+    store = _store(tmp_path, compact_min_bytes=1 << 30)
+    store.save(teams, pokemons, matches[:4])
+    store.append("match", matches[4])
+    store.flush()
+    # 書き込み途中で落ちた最終行（改行なし）は読み飛ばす
+    with open(tmp_path / "journal.jsonl", "ab") as f:
+        f.write(b'{"type":"match","data":{"id":')
+    assert [match.id for match in _store(tmp_path).snapshot().matches] == [match.id for match in matches]
+
+
+@pytest.mark.parametrize("kind", ["json", "sqlite"])
+def test_selections_are_shared_within_a_backend(tmp_path, kind):
+    teams, pokemons, matches = sample_data(match_count=40)
+    writer = _store(tmp_path, kind=kind)
+    writer.save(teams, pokemons, matches[:20])
+    if kind == "json":
+        # バイナリキャッシュからではなく JSON から読ませる
+        os.remove(tmp_path / "snapshot.bin")
+    backend = create_backend(str(tmp_path), kind)
+    loaded = backend.load().items["match"]
+    writer.append_many("match", matches[20:])
+    polled = [item for _, item in backend.poll()]
+    assert len(polled) == 20
+
+    def selections(items):
+        return [s for match in items for side in (match.team_a_data, match.team_b_data)
+                for s in side.player_selections]
+
+    shared = {}
+    for selection in selections(loaded + polled):
+        # 全件読み込みと追加分の読み込みで、同じ組は同じオブジェクト
+        assert shared.setdefault((selection.member_id, selection.pokemon_id), selection) is selection
+
+    # 表はバックエンドごとで、全件を読み直すと作り直す
+    other = create_backend(str(tmp_path), kind).load().items["match"]
+    for items in (other, backend.load().items["match"]):
+        for selection in selections(items):
+            assert selection == shared[(selection.member_id, selection.pokemon_id)]
+            assert selection is not shared[(selection.member_id, selection.pokemon_id)]
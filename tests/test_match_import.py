@@ -0,0 +1,86 @@
+import csv
+import io
+import json
+
+import pytest
+
+from match_import import CSV_COLUMNS, import_matches, read_csv, read_jsonl
+
+MEMBERS = {"レッド": [f"レッド{i}" for i in range(5)], "ブルー": [f"ブルー{i}" for i in range(5)]}
+
+
+@pytest.fixture
+def registered(data_manager):
+    for team_name, member_names in MEMBERS.items():
+        data_manager.add_team(team_name, member_names)
+    data_manager.add_pokemon("ピカチュウ")
+    return data_manager
+
+
+def _csv_row(date="2024-01-01", team_a="レッド", team_b="ブルー", winner="レッド", **overrides) -> dict:
+    row = {"date": date, "team_a": team_a, "team_b": team_b, "winner": winner}
+    for side, team in (("a", team_a), ("b", team_b)):
+        for i, member in enumerate(MEMBERS.get(team, [""] * 5), 1):
+            row[f"{side}{i}_member"] = member
+            row[f"{side}{i}_pokemon"] = "ピカチュウ"
+    row.update(overrides)
+    return row
+
+
+def _csv(rows) -> io.StringIO:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, CSV_COLUMNS)
+    writer.writeheader()
+    writer.writerows(rows)
+    buffer.seek(0)
+    return buffer
+
+
+def test_bad_rows_are_reported_and_good_rows_imported(registered):
+    rows = [
+        _csv_row(),                                   # 2行目
+        _csv_row(date="2024-02-30"),                  # 3行目: ない日付
+        _csv_row(team_b="グリーン"),                  # 4行目: 未登録のチーム
+        _csv_row(winner="グリーン"),                  # 5行目: 試合にいない勝者
+        _csv_row(team_b="レッド"),                    # 6行目: 同じチーム同士
+        _csv_row(a1_member="ブルー0"),                # 7行目: 他のチームのメンバー
+        _csv_row(b5_pokemon="ミュウ"),                # 8行目: 未登録のポケモン
+        _csv_row(date="2024/01/02", winner="ブルー"),  # 9行目: / 区切りの日付も読める
+        _csv_row(date="01/03/2024"),                  # 10行目: ISO 形式でない日付
+    ]
+    # チャンクをまたいでも行番号と件数が合う
+    result = import_matches(read_csv(_csv(rows)), chunk_size=3)
+
+    assert (result.rows_read, result.imported, result.error_count) == (9, 2, 7)
+    assert [line for line, _ in result.errors] == [3, 4, 5, 6, 7, 8, 10]
+    assert "日付が不正です" in result.errors[0][1]
+    matches = registered.get_matches()
+    assert [(match.date, match.winner_team_id) for match in matches] == [
+        ("2024-01-01", matches[0].team_a_data.team_id),
+        ("2024-01-02", matches[1].team_b_data.team_id),
+    ]
+
+
+def test_unreadable_jsonl_lines_are_reported(registered):
+    good = {
+        "date": "2024-01-01", "team_a": "レッド", "team_b": "ブルー", "winner": "ブルー",
+        "team_a_players": [{"member": f"レッド{i}", "pokemon": "ピカチュウ"} for i in range(5)],
+        "team_b_players": [[f"ブルー{i}", "ピカチュウ"] for i in range(5)],
+    }
+    lines = [
+        json.dumps(good, ensure_ascii=False),
+        '{"date": "2024-01-01", "team_a": ',
+        "[1, 2]",
+        '{"date": "2024-01-01", "team_a": ["レッド"], "team_b": "ブルー", "winner": "ブルー"}',
+    ]
+    result = import_matches(read_jsonl(lines))
+
+    assert (result.imported, result.error_count) == (1, 3)
+    assert [line for line, _ in result.errors] == [2, 3, 4]
+    assert len(registered.get_matches()) == 1
+
+
+def test_dry_run_imports_nothing(registered):
+    result = import_matches(read_csv(_csv([_csv_row(), _csv_row(date="bad")])), dry_run=True)
+    assert (result.imported, result.error_count) == (1, 1)
+    assert len(registered.get_matches()) == 0
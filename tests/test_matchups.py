@@ -0,0 +1,78 @@
+import random
+
+import numpy as np
+
+import matchups
+from data_store import DataStore
+from entities import Pokemon
+from sample_data import random_match, sample_data
+from storage import JsonStorage
+
+
+def _brute_force(snapshot) -> dict:
+    """試合を1件ずつ見て、ポケモンの組ごとの行列を数える"""
+    code_by_id = snapshot.appearances.table.pokemons.code_by_id
+    size = len(code_by_id)
+    expected = {name: np.zeros((size, size), dtype=np.int64)
+                for name in ("ally", "ally_won", "opponent", "opponent_won")}
+    for match in snapshot.matches:
+        sides = [(data, {code_by_id[s.pokemon_id] for s in data.player_selections})
+                 for data in (match.team_a_data, match.team_b_data)]
+        for (data, picks), (_, opponents) in zip(sides, sides[::-1]):
+            won = match.winner_team_id == data.team_id
+            for i in picks:
+                for j in picks - {i}:
+                    expected["ally"][i, j] += 1
+                    expected["ally_won"][i, j] += won
+                for j in opponents:
+                    expected["opponent"][i, j] += 1
+                    expected["opponent_won"][i, j] += won
+    return expected
+
+
+def _assert_matches(matrices: matchups.PairMatrices, snapshot) -> None:
+    assert matrices.rows == snapshot.appearances.rows
+    for name, expected in _brute_force(snapshot).items():
+        size = len(expected)
+        # 後から登録されたポケモンの分まで広がっていても、その行と列は0
+        assert not getattr(matrices, name)[size:].any() and not getattr(matrices, name)[:, size:].any()
+        np.testing.assert_array_equal(getattr(matrices, name)[:size, :size], expected, err_msg=name)
+
+
+def test_incremental_matrices_equal_a_full_rebuild(tmp_path, monkeypatch):
+    # 追記分も複数のチャンクに分けて足し込ませる
+    monkeypatch.setattr(matchups, "CHUNK_MATCHES", 7)
+    teams, pokemons, matches = sample_data()
+    store = DataStore(JsonStorage(str(tmp_path)))
+    first = store.save(teams, pokemons, matches[:100])
+    _assert_matches(matchups.pair_matrices(first.appearances), first)
+
+    snapshots = [first]
+    rng = random.Random(4)
+    for i, batch in enumerate((matches[100:101], matches[101:150], matches[150:])):
+        # 途中で増えたポケモンの分だけ行列を広げる
+        new_pokemon = Pokemon(id=f"new{i}", name=f"新ポケモン{i}")
+        pokemons = pokemons + [new_pokemon]
+        store.append("pokemon", new_pokemon)
+        extra = random_match(rng, teams, [new_pokemon], f"new-match{i}")
+        snapshot = store.append_many("match", batch + [extra])
+        _assert_matches(matchups.pair_matrices(snapshot.appearances), snapshot)
+        snapshots.append(snapshot)
+
+    latest = snapshots[-1]
+    rebuilt = matchups.PairMatrices()
+    rebuilt.update(latest.appearances)
+    _assert_matches(rebuilt, latest)
+
+    # 古いスナップショットは作り直し、最新の増分の結果は壊さない
+    for snapshot in snapshots[:-1]:
+        _assert_matches(matchups.pair_matrices(snapshot.appearances), snapshot)
+    _assert_matches(matchups.pair_matrices(latest.appearances), latest)
+
+
+def test_returned_matrices_are_copies(tmp_path):
+    teams, pokemons, matches = sample_data(match_count=20)
+    snapshot = DataStore(JsonStorage(str(tmp_path))).save(teams, pokemons, matches)
+    matrices = matchups.pair_matrices(snapshot.appearances)
+    matrices.ally[:] = -1
+    _assert_matches(matchups.pair_matrices(snapshot.appearances), snapshot)
@@ -0,0 +1,90 @@
+import random
+
+import pytest
+
+from sample_data import random_match, sample_data
+
+
+def test_add_match_normalizes_and_validates_the_date(data_manager):
+    data_manager.add_team("レッド", [f"レッド{i}" for i in range(5)])
+    data_manager.add_team("ブルー", [f"ブルー{i}" for i in range(5)])
+    data_manager.add_pokemon("ピカチュウ")
+    red, blue = data_manager.get_teams()
+    pikachu = data_manager.get_pokemons()[0].id
+    match = {
+        "team_a_id": red.id, "team_a_player_selections": [(member.id, pikachu) for member in red.members],
+        "team_b_id": blue.id, "team_b_player_selections": [(member.id, pikachu) for member in blue.members],
+        "winner_team_id": red.id,
+    }
+
+    for date in ("2024-02-30", "01/05/2024", ""):
+        with pytest.raises(ValueError):
+            data_manager.add_match(date=date, **match)
+    assert data_manager.bulk_add_matches([dict(match, date="20240105")]) == 1
+    assert [match.date for match in data_manager.get_matches()] == ["2024-01-05"]
+
+
+def _newest_first(matches, date_from=None, date_to=None, team_id=None) -> list:
+    selected = [
+        (match.date, position, match.id) for position, match in enumerate(matches)
+        if (date_from is None or match.date >= date_from) and (date_to is None or match.date <= date_to)
+        and (team_id is None or team_id in (match.team_a_data.team_id, match.team_b_data.team_id))
+    ]
+    return [match_id for _, _, match_id in sorted(selected, reverse=True)]
+
+
+def _history(data_manager, page_size, **filters) -> tuple:
+    """全ページを読み、(総件数, 試合IDの並び) を返す"""
+    ids = []
+    page = 0
+    while True:
+        total, rows = data_manager.get_match_history(page, page_size, **filters)
+        ids.extend(row["match"].id for row in rows)
+        if len(rows) < page_size:
+            return total, ids
+        page += 1
+
+
+def test_match_history_matches_a_plain_sort(sample_store, data_manager):
+    snapshot = data_manager.get_snapshot()
+    team_id = snapshot.teams[2].id
+    for filters in ({}, {"team_id": team_id}, {"date_from": "2024-01-01", "date_to": "2024-01-01"},
+                    {"date_from": "2024-01-10", "date_to": "2024-01-28", "team_id": team_id}):
+        expected = _newest_first(snapshot.matches, **filters)
+        assert expected
+        for page_size in (1, 20, 1000):
+            assert _history(data_manager, page_size, **filters) == (len(expected), expected)
+    assert data_manager.get_match_history(team_id="missing") == (0, [])
+
+    # 他のセッションが追記しても、この再実行のスナップショットの試合だけを返す
+    teams, pokemons, _ = sample_data()
+    rng = random.Random(11)
+    later = [random_match(rng, teams, pokemons, f"later{i}") for i in range(10)]
+    sample_store.append_many("match", later)
+    assert _history(data_manager, 20) == (200, _newest_first(snapshot.matches))
+
+    data_manager.load_data()
+    matches = list(snapshot.matches) + later
+    assert _history(data_manager, 20, team_id=team_id) == \
+        (len(_newest_first(matches, team_id=team_id)), _newest_first(matches, team_id=team_id))
+
+
+def test_recent_matches_and_summary_follow_the_session_snapshot(sample_store, data_manager):
+    snapshot = data_manager.get_snapshot()
+    expected = _newest_first(snapshot.matches)
+    for limit in (1, 5, 250):
+        assert [row["match"].id for row in data_manager.get_recent_matches(limit)] == expected[:limit]
+
+    # 他のセッションの追記（範囲の端の日付を含む）は、読み直すまで出ない
+    teams, pokemons, _ = sample_data()
+    rng = random.Random(12)
+    later = [random_match(rng, teams, pokemons, f"later{i}") for i in range(3)]
+    later[0].date, later[1].date = "2024-01-28", "2024-01-01"
+    sample_store.append_many("match", later)
+    assert [row["match"].id for row in data_manager.get_recent_matches(5)] == expected[:5]
+    assert data_manager.get_summary()["match_count"] == 200
+
+    data_manager.load_data()
+    matches = list(snapshot.matches) + later
+    assert [row["match"].id for row in data_manager.get_recent_matches(5)] == _newest_first(matches)[:5]
+    assert data_manager.get_summary() == {"team_count": 4, "pokemon_count": 10, "match_count": 203}
@@ -0,0 +1,110 @@
+import random
+
+import migrate_to_sqlite
+import seasons
+from data_store import DataStore, get_store
+from sample_data import dump, random_match, sample_data
+from storage import create_backend
+
+
+def _seeded(tmp_path):
+    """分割前の1シーズン（DATA_DIR 自体）に sample_data() を保存する"""
+    data_dir = str(tmp_path)
+    teams, pokemons, matches = sample_data()
+    get_store(data_dir).save(teams, pokemons, matches)
+    return data_dir, matches
+
+
+def _counts(data_dir: str, backend: str = "json") -> dict:
+    return {season.key: count for season, count in seasons.season_match_counts(data_dir, backend)}
+
+
+def test_start_season_carries_over_teams(tmp_path):
+    data_dir, matches = _seeded(tmp_path)
+    first = seasons.active_season(data_dir)
+    season = seasons.start_season(data_dir, "json", "s2", "第2シーズン")
+
+    assert seasons.active_season(data_dir) == season
+    assert [s.key for s in seasons.list_seasons(data_dir)] == [first.key, "s2"]
+    snapshot = get_store(seasons.season_dir(data_dir, season)).snapshot()
+    old = get_store(seasons.season_dir(data_dir, first)).snapshot()
+    # チームとポケモンは同じIDで引き継ぎ、試合は引き継がない
+    assert [team.id for team in snapshot.teams] == [team.id for team in old.teams]
+    assert [pokemon.id for pokemon in snapshot.pokemons] == [pokemon.id for pokemon in old.pokemons]
+    assert len(snapshot.matches) == 0
+    assert _counts(data_dir) == {first.key: len(matches), "s2": 0}
+
+    empty = seasons.start_season(data_dir, "json", "s3", carry_over=False)
+    assert len(get_store(seasons.season_dir(data_dir, empty)).snapshot().teams) == 0
+
+
+def test_split_season_retries_on_conflict(tmp_path, monkeypatch):
+    data_dir, matches = _seeded(tmp_path)
+    current = get_store(data_dir)
+    teams, pokemons, _ = sample_data()
+    late = random_match(random.Random(5), teams, pokemons, "late")
+    late.date = "2024-01-01"
+    save = current.save
+
+    def save_after_another_append(*args, **kwargs):
+        # 1回目の書き直しの直前に他のセッションが追記する
+        if kwargs.get("expected_version") is not None and not current.snapshot().index.contains("match", late.id):
+            current.append("match", late)
+        return save(*args, **kwargs)
+
+    monkeypatch.setattr(current, "save", save_after_another_append)
+    season = seasons.split_season(data_dir, "json", "2024-01-15", "early")
+
+    archived = DataStore(create_backend(seasons.season_dir(data_dir, season), "json")).snapshot()
+    remaining = current.snapshot()
+    # 衝突した追記も失われずに、どちらかのシーズンに入っている
+    assert sorted(match.id for match in list(archived.matches) + list(remaining.matches)) == \
+        sorted([match.id for match in matches] + ["late"])
+    assert all(match.date < "2024-01-15" for match in archived.matches)
+    assert all(match.date >= "2024-01-15" for match in remaining.matches)
+    assert "late" in {match.id for match in archived.matches}
+    assert [s.key for s in seasons.list_seasons(data_dir)] == ["early", "default"]
+
+
+def test_summary_is_rebuilt_when_the_season_changes(tmp_path):
+    data_dir, matches = _seeded(tmp_path)
+    season = seasons.split_season(data_dir, "json", "2024-01-15", "early")
+    archived_dir = seasons.season_dir(data_dir, season)
+    archived_count = sum(match.date < "2024-01-15" for match in matches)
+    # 分割時に保存した集計で、過去のシーズンを読まずに数える
+    assert _counts(data_dir)["early"] == archived_count
+
+    # 別のプロセスが過去のシーズンに追記すると、保存済みの集計は使わない
+    teams, pokemons, _ = sample_data()
+    DataStore(create_backend(archived_dir, "json"), durability="always").append(
+        "match", random_match(random.Random(9), teams, pokemons, "added"))
+    assert _counts(data_dir)["early"] is None
+    summaries = {season.key: summary for season, _, summary in seasons.season_summaries(data_dir, "json")}
+    assert summaries["early"].stats.match_count == archived_count + 1
+    assert _counts(data_dir)["early"] == archived_count + 1
+
+
+def test_migration_covers_every_season(tmp_path, capsys):
+    data_dir, matches = _seeded(tmp_path)
+    assert sum(match.date < "2024-01-15" for match in matches) == 104
+    seasons.split_season(data_dir, "json", "2024-01-15", "early")
+    seasons.start_season(data_dir, "json", "s2")
+    teams, pokemons, _ = sample_data()
+    active = get_store(seasons.season_dir(data_dir, seasons.active_season(data_dir)))
+    active.append_many("match", [random_match(random.Random(3), teams, pokemons, f"s2-{i}") for i in range(5)])
+    active.flush()
+
+    # シーズンが複数あると、1つのファイルへの移行はしない
+    assert migrate_to_sqlite.main(["--data-dir", data_dir, "--output", str(tmp_path / "one.sqlite3")]) == 1
+    assert "--output" in capsys.readouterr().err
+
+    assert migrate_to_sqlite.main(["--data-dir", data_dir]) == 0
+    for season in seasons.list_seasons(data_dir):
+        directory = seasons.season_dir(data_dir, season)
+        source = DataStore(create_backend(directory, "json")).snapshot()
+        migrated = DataStore(create_backend(directory, "sqlite")).snapshot()
+        assert dump(migrated) == dump(source)
+    # 過去のシーズンの集計も SQLite の内容で作り直してある（過去のシーズンを読まずに数えられる）
+    assert _counts(data_dir, "sqlite") == {"early": 104, "default": 96, "s2": 5}
+    # 移行済みなら --force なしでは上書きしない
+    assert migrate_to_sqlite.main(["--data-dir", data_dir]) == 1
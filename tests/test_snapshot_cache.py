@@ -0,0 +1,47 @@
+import pytest
+
+import instrumentation
+import snapshot_cache
+from data_store import DataStore
+from sample_data import dump, sample_data
+from storage import JsonStorage
+
+
+def _load(data_dir):
+    """新しいストアで読み込み、内容とバイナリキャッシュのミス数を返す"""
+    metrics = instrumentation.start_rerun()
+    snapshot = DataStore(JsonStorage(str(data_dir))).snapshot()
+    return dump(snapshot), metrics.counters.get("binary_cache_misses", 0)
+
+
+def _corrupt_payload(data: bytes) -> bytes:
+    # 本体の最後のバイトを変える（ダイジェストが合わなくなる）
+    return data[:-1] + bytes([data[-1] ^ 0xFF])
+
+
+def _old_version(data: bytes) -> bytes:
+    start = len(snapshot_cache.MAGIC)
+    _, header_length, payload_length = snapshot_cache.HEADER.unpack_from(data, start)
+    header = snapshot_cache.HEADER.pack(snapshot_cache.FORMAT_VERSION - 1, header_length, payload_length)
+    return data[:start] + header + data[start + snapshot_cache.HEADER.size:]
+
+
+@pytest.mark.parametrize("damage", [
+    pytest.param(_corrupt_payload, id="corrupt-payload"),
+    pytest.param(_old_version, id="old-version"),
+    pytest.param(lambda data: b"NOTUNITE" + data[len(snapshot_cache.MAGIC):], id="bad-magic"),
+    pytest.param(lambda data: data[:len(data) // 2], id="truncated"),
+    pytest.param(lambda data: b"", id="empty"),
+])
+def test_damaged_cache_falls_back_to_json(tmp_path, damage):
+    teams, pokemons, matches = sample_data()
+    DataStore(JsonStorage(str(tmp_path))).save(teams, pokemons, matches)
+    # 最初の読み込みで JSON からキャッシュが作られ、次からはキャッシュを使う
+    expected, _ = _load(tmp_path)
+    assert _load(tmp_path) == (expected, 0)
+
+    cache_file = tmp_path / "snapshot.bin"
+    cache_file.write_bytes(damage(cache_file.read_bytes()))
+    assert _load(tmp_path) == (expected, 1)
+    # 読み直した JSON からキャッシュを作り直している
+    assert _load(tmp_path) == (expected, 0)
@@ -0,0 +1,89 @@
+import pytest
+
+import analytics
+import migrate_to_sqlite
+from aggregates import StatsAggregator
+from data_store import DataStore
+from sample_data import dump, sample_data
+from storage import JsonStorage, SqliteStorage
+
+
+def _sqlite(tmp_path) -> SqliteStorage:
+    return SqliteStorage(str(tmp_path / "unite.sqlite3"))
+
+
+def _counters(stats, id_column: str) -> dict:
+    return {row[id_column]: [row["matches_played"], row["matches_won"]]
+            for _, row in stats.iterrows() if row["matches_played"]}
+
+
+def test_migration_round_trip(tmp_path):
+    teams, pokemons, matches = sample_data()
+    json_dir = tmp_path / "json"
+    source = DataStore(JsonStorage(str(json_dir)), durability="always")
+    source.save(teams, pokemons, matches[:150])
+    # ジャーナルにだけある追記も移行する
+    source.append_many("match", matches[150:])
+    output = str(tmp_path / "unite.sqlite3")
+
+    migrated = migrate_to_sqlite.migrate(str(json_dir), output).snapshot()
+    reloaded = DataStore(SqliteStorage(output)).snapshot()
+    assert dump(migrated) == dump(reloaded) == dump(source.snapshot())
+    assert reloaded.stats.team == source.snapshot().stats.team
+
+    # データのある SQLite には --force なしでは上書きしない
+    with pytest.raises(ValueError):
+        migrate_to_sqlite.migrate(str(json_dir), output)
+    migrate_to_sqlite.migrate(str(json_dir), output, force=True)
+    assert dump(DataStore(SqliteStorage(output)).snapshot()) == dump(reloaded)
+
+
+def test_poll_reads_appends_from_another_connection(tmp_path):
+    teams, pokemons, matches = sample_data(match_count=10)
+    DataStore(_sqlite(tmp_path)).save(teams, pokemons, matches[:5])
+    reader = _sqlite(tmp_path)
+    assert len(reader.load().items["match"]) == 5
+    assert reader.poll() == []
+
+    writer = _sqlite(tmp_path)
+    writer.load()
+    with writer.write_lock():
+        writer.append([("match", match) for match in matches[5:]])
+    assert [item.id for _, item in reader.poll()] == [match.id for match in matches[5:]]
+    # 読んだ分は次の poll では返さない
+    assert reader.poll() == []
+
+
+def test_replace_all_forces_a_full_reload(tmp_path):
+    teams, pokemons, matches = sample_data(match_count=20)
+    store = DataStore(_sqlite(tmp_path))
+    store.save(teams, pokemons, matches)
+    generation = store.fingerprint()[0]
+
+    other = DataStore(_sqlite(tmp_path))
+    other.save(teams, pokemons, matches[:10])
+    assert other.fingerprint()[0] == generation + 1
+    # 世代が変わったので追加分の読み出しではなく全件を読み直す
+    assert store.backend.poll() is None
+    snapshot = store.snapshot()
+    assert [match.id for match in snapshot.matches] == [match.id for match in matches[:10]]
+    assert snapshot.stats.match_count == 10
+
+
+def test_sql_aggregate_matches_analytics(tmp_path):
+    teams, pokemons, matches = sample_data()
+    assert any(match.team_a_data.team_id == match.team_b_data.team_id for match in matches)
+    DataStore(_sqlite(tmp_path)).save(teams, pokemons, matches)
+    backend = _sqlite(tmp_path)
+    result = backend.load()
+    snapshot = DataStore(JsonStorage(str(tmp_path / "json"))).save(teams, pokemons, matches)
+
+    expected = StatsAggregator()
+    for match in matches:
+        expected.add_match(match)
+    for name in ("match_count", "team", "member", "pokemon", "team_pokemon"):
+        assert getattr(result.stats, name) == getattr(expected, name)
+    # 同じチーム同士の試合も1試合として数える（analytics と同じ）
+    assert result.stats.team == _counters(analytics.team_stats(snapshot), "team_id")
+    assert result.stats.member == _counters(analytics.member_stats(snapshot), "member_id")
+    assert result.stats.pokemon == _counters(analytics.pokemon_stats(snapshot), "pokemon_id")
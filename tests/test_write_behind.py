@@ -0,0 +1,161 @@
+import os
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+
+import pytest
+
+import write_behind
+from data_store import DataStore
+from sample_data import dump, sample_data
+from storage import JsonStorage, SqliteStorage
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _backend(kind: str, data_dir):
+    return JsonStorage(str(data_dir)) if kind == "json" else SqliteStorage(os.path.join(str(data_dir), "unite.db"))
+
+
+@pytest.mark.parametrize("kind", ["json", "sqlite"])
+def test_pending_records_are_written_on_exit(tmp_path, kind):
+    # flush() を呼ばずに終了しても、atexit で書き残しを書く
+    script = textwrap.dedent(f"""
+        from data_store import DataStore
+        from sample_data import sample_data
+        from test_write_behind import _backend
+
+        teams, pokemons, matches = sample_data(match_count=500)
+        store = DataStore(_backend({kind!r}, {str(tmp_path)!r}), durability="batch")
+        store.save(teams, pokemons, [])
+        for match in matches:
+            store.append("match", match)
+    """)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, os.path.join(ROOT, "tests")]))
+    subprocess.run([sys.executable, "-c", script], check=True, env=env, cwd=str(tmp_path), timeout=120)
+
+    teams, pokemons, matches = sample_data(match_count=500)
+    snapshot = DataStore(_backend(kind, tmp_path)).snapshot()
+    assert [match.id for match in snapshot.matches] == [match.id for match in matches]
+    assert snapshot.stats.match_count == 500
+
+
+def test_pending_records_survive_a_full_reload(tmp_path, monkeypatch):
+    monkeypatch.setattr(write_behind, "RETRY_DELAY", 0.01)
+    teams, pokemons, matches = sample_data(match_count=3)
+    store = DataStore(JsonStorage(str(tmp_path)), durability="batch")
+    store.save(teams, pokemons, matches[:1])
+
+    # 書き込みを失敗させ続けて、追記を書き込み待ちのままにする
+    failing = threading.Event()
+    failing.set()
+    append = store.backend.append
+
+    def flaky_append(records):
+        if failing.is_set():
+            raise OSError("disk unavailable")
+        append(records)
+
+    monkeypatch.setattr(store.backend, "append", flaky_append)
+    store.append("match", matches[2])
+    while store._writer.error is None:
+        time.sleep(0.01)
+
+    # 他プロセスがデータ一式を書き直すと、次の読み込みは全件の読み直しになる
+    DataStore(JsonStorage(str(tmp_path))).save(teams, pokemons, matches[:2])
+    expected = [match.id for match in matches]
+    deadline = time.monotonic() + 10
+    while [match.id for match in store.snapshot().matches] != expected:
+        # 書き込みスレッドがバックエンドを使っている間は、読み直し前のスナップショットが返る
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert store._writer.pending == 1
+
+    # 書き込めるようになれば、再試行で書き残しを書く
+    failing.clear()
+    while store._writer.error is not None:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert store.flush(timeout=10)
+    assert dump(DataStore(JsonStorage(str(tmp_path))).snapshot()) == dump(store.snapshot())
+
+
+def _recording_store(tmp_path, monkeypatch, durability: str, delay: float = 0.0):
+    """バックエンドに書き終えたレコードのIDを記録するストア"""
+    teams, pokemons, _ = sample_data(match_count=0)
+    store = DataStore(JsonStorage(str(tmp_path)), durability=durability)
+    store.save(teams, pokemons, [])
+    written = set()
+    append = store.backend.append
+
+    def recording_append(records):
+        time.sleep(delay)
+        result = append(records)
+        written.update(item.id for _, item in records)
+        return result
+
+    monkeypatch.setattr(store.backend, "append", recording_append)
+    return store, written
+
+
+def test_always_returns_after_its_own_records_are_written(tmp_path, monkeypatch):
+    store, written = _recording_store(tmp_path, monkeypatch, "always")
+    teams, pokemons, matches = sample_data(match_count=101)
+    # まとめての追記が番号を受け取るのを遅らせ、その間に1件の追記を割り込ませる
+    submit = store._writer.submit
+    large_batch_applied = threading.Event()
+
+    def slow_submit(n):
+        if n > 1:
+            large_batch_applied.set()
+            time.sleep(0.2)
+        return submit(n)
+
+    monkeypatch.setattr(store._writer, "submit", slow_submit)
+    unwritten = []
+
+    def append(chunk):
+        store.append_many("match", chunk)
+        unwritten.extend(match.id for match in chunk if match.id not in written)
+
+    large = threading.Thread(target=append, args=(matches[:100],))
+    large.start()
+    large_batch_applied.wait(10)
+    single = threading.Thread(target=append, args=(matches[100:],))
+    single.start()
+    large.join()
+    single.join()
+    # always では、戻ったときには自分の追記が書き込まれている
+    assert unwritten == []
+    assert len(written) == 101
+
+
+def test_pending_writes_stay_within_max_pending(tmp_path, monkeypatch):
+    store, written = _recording_store(tmp_path, monkeypatch, "batch")
+    store._writer.max_pending = 10
+    # 書き込みを止めて、書き込み待ちを溜める
+    blocked = threading.Event()
+    append = store.backend.append
+
+    def blocked_append(records):
+        blocked.wait()
+        return append(records)
+
+    monkeypatch.setattr(store.backend, "append", blocked_append)
+    teams, pokemons, matches = sample_data(match_count=30)
+    threads = [threading.Thread(target=store.append_many, args=("match", matches[i:i + 5])) for i in range(0, 30, 5)]
+    for thread in threads:
+        thread.start()
+    try:
+        time.sleep(0.2)
+        # 上限を超える分は、メモリに反映される前に待たされている
+        assert store.pending_writes <= 10
+        assert len(store.snapshot().matches) <= 10
+    finally:
+        blocked.set()
+    for thread in threads:
+        thread.join()
+    assert store.flush(timeout=10)
+    assert written == {match.id for match in matches}
@@ -0,0 +1,155 @@
+import datetime
+import threading
+import weakref
+from bisect import bisect_left, bisect_right
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from appearances import AppearanceTable
+
+
+class EntityTimeline:
+    """
+    エンティティごと・試合日ごとの累積試合数・勝利数。
+
+    出場（またはサイド）の行を (エンティティ, 試合日) の順に並べたキーと、
+    その順での勝利数の累積和を持つ。エンティティ e の日 [first, last] の成績は
+    キー e*stride+first と e*stride+last+1 の位置を二分探索し、位置の差が試合数、
+    累積和の差が勝利数になる（全件を数え直さない）。
+    """
+
+    def __init__(self, entity: np.ndarray, day: np.ndarray, won: np.ndarray, days: int):
+        self.stride = days + 1
+        keys = entity.astype(np.int64) * self.stride + day
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.cum_won = np.concatenate(([0], np.cumsum(won[order], dtype=np.int64)))
+
+    def window(self, entities: np.ndarray, first_day: int, last_day: int) -> Tuple[np.ndarray, np.ndarray]:
+        """entities（-1 は出場なし）それぞれの日 [first_day, last_day] の試合数・勝利数"""
+        entities = np.asarray(entities, dtype=np.int64)
+        base = np.where(entities < 0, -1, entities) * self.stride
+        lo = np.searchsorted(self.keys, base + first_day)
+        hi = np.searchsorted(self.keys, base + max(first_day, last_day + 1))
+        played = np.where(entities < 0, 0, hi - lo)
+        won = np.where(entities < 0, 0, self.cum_won[hi] - self.cum_won[lo])
+        return played, won
+
+    def cumulative(self, entity: int) -> Tuple[np.ndarray, np.ndarray]:
+        """entity の日 0..d の累積試合数・勝利数（d ごとの配列）"""
+        if entity < 0:
+            zeros = np.zeros(self.stride - 1, dtype=np.int64)
+            return zeros, zeros
+        bounds = np.searchsorted(self.keys, entity * self.stride + np.arange(self.stride))
+        return bounds[1:] - bounds[0], self.cum_won[bounds[1:]] - self.cum_won[bounds[0]]
+
+
+class Timeline:
+    """
+    スナップショット時点の試合日ごとの成績。
+
+    dates は試合のある日付（昇順）で、試合日の番号はその位置。
+    team はサイド、member・pokemon・team_pokemon は出場の行を数える。
+    team_pokemon のエンティティは チームコード * pokemon_codes + ポケモンコード。
+    """
+
+    def __init__(self, dates: List[str], ordinals: np.ndarray, pokemon_codes: int,
+                 team: EntityTimeline, member: EntityTimeline, pokemon: EntityTimeline,
+                 team_pokemon: EntityTimeline):
+        self.dates = dates
+        self.ordinals = ordinals
+        self.pokemon_codes = pokemon_codes
+        self.team = team
+        self.member = member
+        self.pokemon = pokemon
+        self.team_pokemon = team_pokemon
+
+    def day_range(self, date_from: Optional[str] = None, date_to: Optional[str] = None) -> Tuple[int, int]:
+        """日付範囲（両端を含む、YYYY-MM-DD）に入る試合日の番号 [first, last]（空なら first > last）"""
+        first = bisect_left(self.dates, date_from) if date_from else 0
+        last = bisect_right(self.dates, date_to) - 1 if date_to else len(self.dates) - 1
+        return first, last
+
+    def rolling_starts(self, window_days: int) -> np.ndarray:
+        """各試合日 d について、d を最終日とする window_days 日間に入る最初の試合日の番号"""
+        return np.searchsorted(self.ordinals, self.ordinals - (window_days - 1))
+
+
+def team_sides(side_team: np.ndarray) -> np.ndarray:
+    """
+    サイドの行のうちチームの試合数に数えるもの（bool）。サイドは1試合2行なので、
+    同じチーム同士の試合は2行目を除いて1試合として数える（StatsAggregator と同じ）。
+    """
+    keep = np.ones(len(side_team), dtype=bool)
+    keep[1::2] = side_team[1::2] != side_team[0::2]
+    return keep
+
+
+def _ordinal(date: str) -> Optional[int]:
+    """YYYY-MM-DD の日付の通し番号（それ以外の書き方や読めない値は None）"""
+    try:
+        parsed = datetime.date.fromisoformat(date)
+    except ValueError:
+        return None
+    # 文字列の順と日付の順が一致するのは YYYY-MM-DD だけ
+    return parsed.toordinal() if parsed.isoformat() == date else None
+
+
+def build_timeline(snapshot) -> Timeline:
+    view = snapshot.appearances
+    table = view.table
+    # 出場テーブルの試合番号はスナップショットの試合の並びと同じ
+    match_dates = [match.date for match in snapshot.matches[:view.sides // 2]]
+    unique_dates, match_day = np.unique(np.array(match_dates, dtype=str), return_inverse=True)
+    # 日付として読めない試合（手で編集されたファイルなど）は日付を使う集計から除く
+    day_ordinals = [_ordinal(date) for date in unique_dates.tolist()]
+    valid = np.array([ordinal is not None for ordinal in day_ordinals], dtype=bool)
+    dates = unique_dates[valid].tolist()
+    ordinals = [ordinal for ordinal in day_ordinals if ordinal is not None]
+    day_count = len(dates)
+    # 読めない日付の試合日の番号は -1
+    match_day = np.where(valid, np.cumsum(valid) - 1, -1)[match_day].astype(np.int64)
+
+    def column(values, length: int, dtype) -> np.ndarray:
+        return np.frombuffer(values[:length], dtype=dtype)
+
+    side_match = column(table.side_match, view.sides, np.intc)
+    side_day = match_day[side_match]
+    side_won = column(table.side_won, view.sides, np.int8)
+    side_team = column(table.side_team, view.sides, np.intc)
+    counted = team_sides(side_team) & (side_day >= 0)
+    match = column(table.match, view.rows, np.intc)
+    day = match_day[match]
+    rows = day >= 0
+    day = day[rows]
+    team = column(table.team, view.rows, np.intc)[rows]
+    member = column(table.member, view.rows, np.intc)[rows]
+    pokemon = column(table.pokemon, view.rows, np.intc)[rows]
+    won = column(table.won, view.rows, np.int8)[rows]
+    pokemon_codes = max(len(table.pokemons), 1)
+
+    return Timeline(
+        dates, np.array(ordinals, dtype=np.int64), pokemon_codes,
+        team=EntityTimeline(side_team[counted], side_day[counted], side_won[counted], day_count),
+        member=EntityTimeline(member, day, won, day_count),
+        pokemon=EntityTimeline(pokemon, day, won, day_count),
+        team_pokemon=EntityTimeline(team.astype(np.int64) * pokemon_codes + pokemon, day, won, day_count),
+    )
+
+
+# 出場テーブルごとに直近に作った ((行数, サイド数), Timeline)（テーブルが作り直されたら一緒に捨てる）
+_timelines: "weakref.WeakKeyDictionary[AppearanceTable, Tuple[Tuple[int, int], Timeline]]" = weakref.WeakKeyDictionary()
+_timelines_lock = threading.Lock()
+
+
+def timeline(snapshot) -> Timeline:
+    """スナップショット時点の Timeline（同じ時点のものは作り直さない）"""
+    view = snapshot.appearances
+    with _timelines_lock:
+        cached = _timelines.get(view.table)
+        if cached is not None and cached[0] == (view.rows, view.sides):
+            return cached[1]
+        built = build_timeline(snapshot)
+        _timelines[view.table] = ((view.rows, view.sides), built)
+        return built
@@ -0,0 +1,167 @@
+"""
+書き込みを後回しにするキュー（write-behind）。
+
+書き込み側は submit() でレコード数を積むだけで戻り、バックグラウンドのスレッドが
+溜まった分をまとめて flush コールバックに渡す。書き込み中に積まれた分は次の1回に
+まとめて書くので、連続した書き込みは件数によらず1回ずつの書き込みにまとまる。
+
+積む側はまず reserve() で枠を確保する。未書き込みと確保済みの件数が max_pending を
+超えるなら、書き込みが追いつくまでそこで待つ（バッファ自体が上限を超えない）。
+submit() は確保した枠に積むだけで待たないので、呼び出し側のロックの中で呼べる。
+submit() が返す番号（それまでに積んだ累計件数）を wait() に渡すと、その分が
+書き込まれるまで待てる（耐久性の確認）。プロセスの終了時には atexit で残りを書く。
+"""
+import atexit
+import threading
+import time
+import weakref
+from typing import Callable, Optional
+
+from instrumentation import count
+
+# 書き込みに失敗したときに再試行するまでの秒数
+RETRY_DELAY = 1.0
+# 終了時に書き残しを待つ秒数
+SHUTDOWN_TIMEOUT = 30.0
+
+_queues: "weakref.WeakSet[WriteBehind]" = weakref.WeakSet()
+
+
+class WriteBehind:
+    """
+    flush(n) を呼ぶ書き込みスレッド。n は積まれた順で未書き込みの先頭 n 件で、
+    flush が例外を送出しなければ書き込めたものとする（送出したら後で再試行する）。
+    after_flush は書き込めたことを知らせた後に呼ぶ（圧縮など、待たせなくてよい処理）。
+    """
+
+    def __init__(self, flush: Callable[[int], None], name: str = "write-behind", max_pending: int = 10_000,
+                 after_flush: Optional[Callable[[], None]] = None):
+        self._flush = flush
+        self._after_flush = after_flush
+        self.name = name
+        self.max_pending = max_pending
+        self._cond = threading.Condition()
+        # 積まれた累計件数と、書き込めた累計件数
+        self._submitted = 0
+        self._written = 0
+        # reserve() で確保し、まだ submit() していない件数
+        self._reserved = 0
+        # 直近の書き込みの失敗（書き込めたら None に戻す）
+        self.error: Optional[BaseException] = None
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        _queues.add(self)
+
+    @property
+    def pending(self) -> int:
+        """未書き込みの件数"""
+        return self._submitted - self._written
+
+    def reserve(self, n: int) -> None:
+        """
+        n 件を積む枠を確保する。未書き込みと確保済みの合計が max_pending を超えるなら
+        書き込みが追いつくまで待つ（1回分が上限より多くても、空になれば確保する）。
+        確保した枠は submit(n) で積むか release(n) で返すこと。
+        """
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError(f"{self.name} is closed")
+                queued = self.pending + self._reserved
+                if not queued or queued + n <= self.max_pending:
+                    break
+                count("write_behind_waits")
+                self._cond.wait()
+            self._reserved += n
+
+    def release(self, n: int) -> None:
+        """reserve(n) で確保した枠を積まずに返す"""
+        with self._cond:
+            self._reserved -= n
+            self._cond.notify_all()
+
+    def submit(self, n: int) -> int:
+        """
+        reserve(n) で確保した枠に n 件を積み、wait() に渡す番号を返す（待たない）。
+        呼び出し側は積む前にレコードを flush から見える場所に置き、番号がその並びと
+        一致するよう、置くのと同じロックの中で呼ぶこと。
+        """
+        with self._cond:
+            self._reserved -= n
+            self._submitted += n
+            ticket = self._submitted
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+        return ticket
+
+    def wait(self, ticket: Optional[int] = None, timeout: Optional[float] = None) -> bool:
+        """
+        ticket（省略するとこれまでに積んだ全件）が書き込まれるまで待つ。
+        タイムアウトしたら False。待っている間に書き込みが失敗したらその例外を送出する。
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            if ticket is None:
+                ticket = self._submitted
+            while self._written < ticket:
+                if self.error is not None:
+                    raise self.error
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        """残りを書いてスレッドを止める。書き終わらなければ False"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+            return not thread.is_alive() and not self.pending
+        return not self.pending
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self.pending and not self._closed:
+                    self._cond.wait()
+                if not self.pending:
+                    return
+                # 書いている間に積まれた分は次の1回にまとめる
+                n = self.pending
+            try:
+                self._flush(n)
+            except Exception as e:
+                count("write_behind_errors")
+                with self._cond:
+                    self.error = e
+                    self._cond.notify_all()
+                    if self._closed:
+                        return
+                time.sleep(RETRY_DELAY)
+                continue
+            count("write_behind_flushes")
+            count("write_behind_records", n)
+            with self._cond:
+                self._written += n
+                self.error = None
+                self._cond.notify_all()
+            if self._after_flush is not None:
+                try:
+                    self._after_flush()
+                except Exception:
+                    # 書き込みは済んでいるので、次の書き込みの後にまた試す
+                    count("write_behind_errors")
+
+
+@atexit.register
+def _close_all():
+    """終了時に全キューの書き残しを書く（デーモンスレッドは atexit の後に止まる）"""
+    deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+    for queue in list(_queues):
+        queue.close(max(0.0, deadline - time.monotonic()))